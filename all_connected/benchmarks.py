@@ -0,0 +1,266 @@
+"""
+Description: Benchmarks for the performance-sensitive parts of Snap N Go. None of them
+    need MySQL or Slack, everything runs on synthetic data.
+    Usage: python benchmarks.py [name ...]   (no name runs all of them)
+"""
+import os
+import sys
+import json
+import asyncio
+import tempfile
+import threading
+import tracemalloc
+from time import perf_counter
+from datetime import datetime, timedelta
+
+import numpy as np
+
+
+def timed(func, *args, **kwargs):
+    """Takes a function & its arguments. Returns (result, seconds it took)."""
+    start = perf_counter()
+    result = func(*args, **kwargs)
+    return result, perf_counter() - start
+
+def timed_with_memory(func, *args, **kwargs):
+    """Takes a function & its arguments. Returns (result, seconds it took, peak MB allocated)."""
+    tracemalloc.start()
+    try:
+        result, seconds = timed(func, *args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+### ### MATCHING ### ###
+def bench_assignment_solver(sizes=(1000, 2000, 5000), dense_sizes=(200, 500), seed=0):
+    """
+    Times matching_assignments.solve_assignment on random square cost matrices, and
+        algorithm_optimal end to end (time & peak memory) on as many synthetic tasks
+        as users, with no cap on tasks per user & with a cap of one.
+    The matching cycle budget is task_parameters.MATCHING_CYCLE (~30 minutes).
+    """
+    import matching_assignments
+
+    rng = np.random.default_rng(seed)
+    for size in dense_sizes:
+        cost = rng.random((size, size))
+        (rows, cols), seconds = timed(matching_assignments.solve_assignment, cost)
+        print(f"solve_assignment   {size}x{size}: {seconds:7.2f}s  total cost {cost[rows, cols].sum():.2f}")
+
+    locations = [f"W{floor}{room:02d}" for floor in range(1, 5) for room in range(2, 27)]
+    now = datetime.now()
+    for size in sizes:
+        task_data = {task_id: (locations[rng.integers(len(locations))],
+                               now + timedelta(minutes=int(rng.integers(0, 180))))
+                     for task_id in range(size)}
+        user_data = {'id': [f"U{i:06d}" for i in range(size)],
+                     'reliability': rng.random(size).round(2).tolist(),
+                     'outstanding': [[(locations[rng.integers(len(locations))],
+                                       now + timedelta(minutes=int(rng.integers(0, 180))))]
+                                     for _ in range(size)]}
+        assignment_data = {task_id: {user_data['id'][rng.integers(size)]} for task_id in range(size)}
+        for capacity in (size, 1):
+            matchings, seconds, peak = timed_with_memory(
+                matching_assignments.algorithm_optimal, assignment_data, task_data, user_data, capacity=capacity,
+                distance=matching_assignments.room_distance, weights={'reliability': 1.0, 'load': 0.25, 'time': 1.0, 'distance': 0.5})
+            print(f"algorithm_optimal  {size}x{size}, {capacity:4d} per user: {seconds:7.2f}s  {peak:7.1f}MB  "
+                  f"{len(matchings)} matchings")
+
+
+### ### BUILDING GRAPHS ### ###
+def dense_read_file(fname):
+    """The original list-of-lists read_file(), kept here as the baseline to compare against."""
+    with open(fname, "r") as file:
+        numVertices = int(file.readline().strip())
+        vertices = {}
+        for _ in range(numVertices):
+            line = file.readline().strip().split(",")
+            vertices[line[0]] = line[1]
+        matrix = [[-1 for _ in range(numVertices)] for _ in range(numVertices)]
+        for line in file:
+            edge = line.strip().split(",")
+            v1, v2, distance = int(edge[0]), int(edge[1]), float(edge[2])
+            matrix[v1-1][v2-1] = distance
+            matrix[v2-1][v1-1] = distance
+        return matrix, vertices
+
+def write_synthetic_graph(fname, num_vertices, edges_per_vertex=3, seed=0):
+    """Writes a connected, sparse building graph file with num_vertices rooms."""
+    rng = np.random.default_rng(seed)
+    with open(fname, 'w') as outfile:
+        outfile.write(f"{num_vertices}\n")
+        for v in range(1, num_vertices + 1):
+            outfile.write(f"{v},W{v:05d}\n")
+        for v in range(2, num_vertices + 1):
+            outfile.write(f"{v - 1},{v},{rng.integers(1, 30)}\n")
+        for _ in range(num_vertices * (edges_per_vertex - 1)):
+            v1, v2 = rng.integers(1, num_vertices + 1, size=2)
+            if v1 != v2:
+                outfile.write(f"{v1},{v2},{rng.integers(1, 60)}\n")
+
+def bench_graph_parser(sizes=(500, 2000, 5000)):
+    """
+    Compares parse time & peak memory of the original dense read_file() with the
+        streaming CSR helper_functions.read_graph() on synthetic sparse graphs.
+    """
+    import helper_functions
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in sizes:
+            fname = os.path.join(tmp_dir, f"graph_{size}.txt")
+            write_synthetic_graph(fname, size)
+            _, dense_seconds, dense_mb = timed_with_memory(dense_read_file, fname)
+            graph, csr_seconds, csr_mb = timed_with_memory(helper_functions.read_graph, fname)
+            print(f"{size:6d} rooms, {len(graph.indices) // 2:6d} edges | "
+                  f"dense read_file {dense_seconds:6.2f}s {dense_mb:8.1f}MB | "
+                  f"read_graph {csr_seconds:6.2f}s {csr_mb:6.1f}MB")
+
+
+### ### SLACK DELIVERY ### ###
+class FakeSlack:
+    """
+    Minimal local stand-in for the Slack Web API, served from a background thread.
+    Every request answers {"ok": true, "ts": ...} after `latency` seconds, except
+        every `rate_limit_every`-th one, which answers 429 with a Retry-After header.
+    """
+    def __init__(self, latency=0.1, rate_limit_every=0, retry_after=1):
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.requests = 0
+        self.rate_limited = 0
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+        threading.Thread(target=self._serve, args=(started,), daemon=True).start()
+        started.wait()
+        self.base_url = f"http://127.0.0.1:{self.port}/api/"
+
+    def _serve(self, started):
+        asyncio.set_event_loop(self.loop)
+        self.server = self.loop.run_until_complete(asyncio.start_server(self._handle, '127.0.0.1', 0))
+        self.port = self.server.sockets[0].getsockname()[1]
+        started.set()
+        self.loop.run_forever()
+
+    async def _handle(self, reader, writer):
+        headers = {}
+        await reader.readline()
+        while (line := await reader.readline()) not in (b'\r\n', b''):
+            key, _, value = line.decode().partition(':')
+            headers[key.strip().lower()] = value.strip()
+        await reader.readexactly(int(headers.get('content-length', 0)))
+        self.requests += 1
+        if self.rate_limit_every and self.requests % self.rate_limit_every == 0:
+            self.rate_limited += 1
+            status, extra, body = '429 Too Many Requests', f"Retry-After: {self.retry_after}\r\n", {'ok': False, 'error': 'ratelimited'}
+        else:
+            await asyncio.sleep(self.latency)
+            status, extra, body = '200 OK', '', {'ok': True, 'channel': 'D0000000', 'ts': f"{self.requests}.000100"}
+        payload = json.dumps(body).encode()
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+                     f"{extra}Connection: close\r\n\r\n".encode() + payload)
+        await writer.drain()
+        writer.close()
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def serial_send(client, messages):
+    """The original send_tasks() loop: one message at a time, a user's first error skips the rest of their tasks."""
+    from slack_sdk.errors import SlackApiError
+
+    sent = 0
+    per_user = {}
+    for user_id, blocks, text in messages:
+        per_user.setdefault(user_id, []).append((blocks, text))
+    for user_id, user_messages in per_user.items():
+        try:
+            for blocks, text in user_messages:
+                client.chat_postMessage(channel=f"@{user_id}", blocks=blocks, text=text)
+                sent += 1
+        except SlackApiError:
+            pass
+    return sent
+
+def bench_slack_fanout(num_users=(100, 500), tasks_per_user=2, latency=0.25):
+    """
+    Delivers tasks_per_user task messages to each of num_users users through a local
+        FakeSlack with `latency` seconds per call: the original serial WebClient loop
+        (smallest size only, it's slow), and slack_delivery with chat.postMessage's
+        default limits, with the limits lifted (engine ceiling) & with every 50th
+        call rate limited (each 429 stalls all sending for its Retry-After second).
+    """
+    from slack_sdk import WebClient
+    from slack_sdk.web.async_client import AsyncWebClient
+    import slack_delivery
+
+    block = [{'type': 'section', 'text': {'type': 'mrkdwn', 'text': '*Task #1* benchmark task'}}]
+    for size in num_users:
+        messages = [(f"U{user:06d}", block, "Sending tasks!") for user in range(size) for _ in range(tasks_per_user)]
+        if size == min(num_users):
+            fake = FakeSlack(latency)
+            sent, seconds = timed(serial_send, WebClient(token='xoxb-fake', base_url=fake.base_url), messages)
+            print(f"{size:5d} users serial WebClient     {seconds:7.2f}s  {sent / seconds:7.1f} msg/s  {sent}/{len(messages)} sent")
+            fake.close()
+
+        unlimited = {'rate': 10_000, 'burst': 10_000, 'channel_interval': 0}
+        runs = [('default limits ', {}, 0),
+                ('no rate limit  ', unlimited, 0),
+                ('429 every 50th ', unlimited, 50)]
+        for label, limits, rate_limit_every in runs:
+            fake = FakeSlack(latency, rate_limit_every)
+
+            async def run():
+                client = AsyncWebClient(token='xoxb-fake', base_url=fake.base_url)
+                return await slack_delivery.deliver(messages, client=client, **limits)
+
+            results, seconds = timed(asyncio.run, run())
+            sent = sum(result.ok for result in results)
+            retries = sum(result.attempts - 1 for result in results)
+            print(f"{size:5d} users deliver, {label} {seconds:7.2f}s  {sent / seconds:7.1f} msg/s  "
+                  f"{sent}/{len(messages)} sent, {fake.rate_limited} 429s, {retries} retries")
+            fake.close()
+
+
+### ### DUPLICATE PICTURES ### ###
+def bench_duplicate_index(sizes=(100_000, 1_000_000), num_queries=1000, seed=0):
+    """
+    Times image_hash.HashIndex on random stored hashes: building it, and looking up
+        num_queries hashes (half of them planted near-duplicates 1-3 bits away from a
+        stored hash) with the banded lookup & with a full vectorized scan.
+    """
+    import image_hash
+
+    rng = np.random.default_rng(seed)
+    for size in sizes:
+        hashes = rng.integers(0, 2**63, size, dtype=np.uint64) * np.uint64(2) + rng.integers(0, 2, size, dtype=np.uint64)
+        index, build_seconds = timed(lambda: (index := image_hash.HashIndex(), index.extend(hashes, np.arange(size)))[0])
+
+        planted = rng.integers(0, size, num_queries // 2)
+        queries = []
+        for position in planted:
+            flips = rng.choice(64, int(rng.integers(1, 4)), replace=False)
+            queries.append(int(hashes[position]) ^ sum(1 << int(bit) for bit in flips))
+        queries += rng.integers(0, 2**63, num_queries - len(queries), dtype=np.uint64).tolist()
+
+        banded, banded_seconds = timed(lambda: [index.query(q, banded=True) for q in queries])
+        full, full_seconds = timed(lambda: [index.query(q, banded=False) for q in queries])
+        found = sum(any(key == position for key, _ in result) for result, position in zip(banded, planted))
+        assert banded == full, "banded lookup must find exactly what the full scan finds"
+        print(f"{size:8d} hashes: build {build_seconds:5.2f}s | banded {1000 * banded_seconds / num_queries:7.3f}ms/query | "
+              f"full scan {1000 * full_seconds / num_queries:7.3f}ms/query | {found}/{len(planted)} planted duplicates found")
+
+
+BENCHMARKS = {
+    'solver': bench_assignment_solver,
+    'graph': bench_graph_parser,
+    'slack': bench_slack_fanout,
+    'duplicates': bench_duplicate_index,
+}
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -1,14 +1,18 @@
 import os
 from pathlib import Path
 from dotenv import load_dotenv
-env_path = Path('..') / '.env'
+env_path = Path(__file__).resolve().parent.parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
 import messenger
-
-import json
-import requests
-import copy
+import helper_functions
+import outbox
+import image_ingest
+import image_hash
+
+import re
+import math
+import functools
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 from slack_bolt import App
@@ -20,6 +24,8 @@ import random
 
 ### ### CONSTANTS ### ###
 DB_NAME = os.environ['DB_NAME']
+MAX_BLOCKS_PER_MESSAGE = 50     # Slack's limit on blocks in one message
+REPORT_PAGE_SIZE = 10           # tasks per page of the `report` message
 
 EMOJI_DICT = {0: '🪴', 
                 1: '🌺', 
@@ -34,31 +40,48 @@ EMOJI_DICT = {0: '🪴',
 }
 
 
-## ### LOAD IN MESSAGE BLOCKS ### ###
-with open('block_messages/default_btn.json', 'r') as infile:
-    default_btn = json.load(infile)
-
-with open('block_messages/help_block.json', 'r') as infile:
-    info_page = json.load(infile)
-
-with open('block_messages/sample_task.json', 'r') as infile:
-    sample_task = json.load(infile)
+### ### PRECOMPILED TASK TEMPLATES ### ###
+# Message blocks are read from block_messages/ on first use (helper_functions.load_block()).
+# The templates are built once, on first use, & shared by every rendered message, so they 
+# are never mutated: the button elements per assignment status are tuples (serialized like lists).
+def _button_elements(style_index=None, style=None):
+    elements = [dict(element) for element in helper_functions.load_block('default_btn')['elements']]
+    if style_index is not None:
+        elements[style_index]['style'] = style
+    return tuple(elements)
 
-with open('block_messages/onboarding_block.json', 'r') as infile:
-    onboarding = json.load(infile)
-
-with open('block_messages/headers.json', 'r') as infile:
-    block_headers = json.load(infile)
+@functools.lru_cache(maxsize=None)
+def task_templates() -> dict:
+    """
+    Takes nothing.
+    Builds the task templates on the first call.
+    Returns a dict: 'task_message', 'compact_task' & 'start_time_format' (from 
+        task_templates.json), 'buttons' (button elements per assignment status) & 
+        'default_buttons' (both buttons grey).
+    """
+    templates = dict(helper_functions.load_block('task_templates'))
+    templates['buttons'] = {
+        'accepted': _button_elements(0, 'primary'),     # Accept btn is green
+        'rejected': _button_elements(1, 'danger'),      # Reject btn is red
+    }
+    templates['default_buttons'] = _button_elements()
+    return templates
 
 
 ### ### INITIALIZE BOLT APP ### ###
-# Initialize app, socket mode handler, & client 
-app = App(token= os.environ['TASK_BOT_TOKEN'])
+# Initialize app, socket mode handler, & client. Nothing here touches the network: Bolt's
+# token check (auth.test) is skipped & the bot id is fetched on first use (bot_id()).
+app = App(token=os.environ['TASK_BOT_TOKEN'], token_verification_enabled=False)
 handler = SlackRequestHandler(app)
 client = WebClient(token=os.environ['TASK_BOT_TOKEN'])
 
-# Get the bot id
-BOT_ID = client.api_call("auth.test")['user_id']
+@functools.lru_cache(maxsize=None)
+def bot_id() -> str:
+    """Returns this bot's user id (one auth.test call, on first use)."""
+    return client.auth_test()['user_id']
+
+# Submitted pictures are downloaded & recorded in the background (workers start on the first submission)
+submission_pool = image_ingest.IngestPool(os.environ['TASK_BOT_TOKEN'])
 
 
 
@@ -67,66 +90,101 @@ def send_messages(user_id, block = None, text = None):
     client.chat_postMessage(channel=f"@{user_id}", blocks = block, text=text)
     return
 
-def send_welcome_message(users_list) -> None:
+def send_welcome_message(users_list) -> int:
     '''
     Takes   A list containing all user ids or a dictionary with user ids as its keys. 
             currently using users_store returned by get_all_users_info()
-    Sends welcoming message to all users
+    Queues a welcoming message to all (active) users in the outbox & drains just
+        those users' welcome messages, so they go out right away at any hour (the
+        outbox timer only runs during work hours); failures are retried by the timer
+    Returns the number of messages queued
     '''
     active_users = messenger.get_active_users_list()
-    for user_id in users_list:
-        if BOT_ID != user_id and user_id in active_users:      
-            try:
-                print(f'IN Welcome: {user_id}', datetime.now())
-                client.chat_postMessage(channel=f"@{user_id}", blocks = onboarding['blocks'], text="Welcome to Snap N Go!")
-                print("Welcome!")
-            except SlackApiError as e:
-                assert e.response["ok"] is False and e.response["error"], f"Got an error: {e.response['error']}"
-
-def send_tasks(assignments_dict) -> None:
+    onboarding = helper_functions.load_block('onboarding_block')
+    messages = [(user_id, onboarding['blocks'], "Welcome to Snap N Go!") 
+                for user_id in users_list if bot_id() != user_id and user_id in active_users]
+    queued = outbox.enqueue(messages, 'welcome')
+    outbox.drain(kind='welcome', user_ids=[message[0] for message in messages])
+    return queued
+
+def send_tasks(assignments_dict) -> dict:
     '''
     * Message users to give them new tasks *
     Takes the assignments dictionary generated by getAssignments() in messenger
-    Format the tasks each user get into block messages. Send them to each 
-        user respectively
-    Returns nothing
+    Format the tasks each user get into block messages, packing each user's
+        tasks into as few messages as the block limit allows. Queues them in the
+        outbox (their assignments become 'queued') & drains it, which sends them
+        concurrently across users and marks each assignment 'pending' once its
+        message is actually posted
+    Returns the outbox.drain() counts
     ''' 
     active_users = messenger.get_active_users_list()
+    messages = []
     for user_id in assignments_dict:
-        print(f'IN SEND TASKS: {user_id}', datetime.now())
-        if BOT_ID != user_id and user_id in active_users:   
-            try:
-                for task_info in assignments_dict[user_id]:
-                    block = generate_message(task_info, user_id)
-                    #texts = "Here are your newly generated tasks"
-                    client.chat_postMessage(channel=f"@{user_id}", blocks = block,text="Sending tasks!")
-                    print("Send task!")
-            except SlackApiError as e:
-                assert e.response["ok"] is False and e.response["error"], f"Got an error: {e.response['error']}"
+        if bot_id() != user_id and user_id in active_users:   
+            task_blocks = [generate_message(task_info, user_id) for task_info in assignments_dict[user_id]]
+            for blocks in pack_task_blocks(task_blocks):
+                task_ids = [int(block['block_id']) for block in blocks if block['type'] == 'actions']
+                messages.append((user_id, blocks, "Sending tasks!", task_ids))
+    outbox.enqueue(messages, 'tasks')
+    counts = outbox.drain()
+    print(f"- queued {len(messages)} task messages; sent {counts['sent']}, retrying {counts['retrying']}, "
+          f"failed {counts['failed']}", datetime.now())
+    return counts
+
+def pack_task_blocks(task_blocks, max_blocks=MAX_BLOCKS_PER_MESSAGE):
+    '''
+    * Helper function for send_tasks() *
+    Takes a list of per-task block lists (generate_message() output).
+    Packs them, in order, into as few messages as max_blocks allows, never 
+        splitting one task's blocks across two messages.
+    Returns a list of block lists, one per message.
+    '''
+    messages = []
+    current = []
+    for blocks in task_blocks:
+        if current and len(current) + len(blocks) > max_blocks:
+            messages.append(current)
+            current = []
+        current = current + blocks
+    if current:
+        messages.append(current)
+    return messages
+
+def replace_task_blocks(message_blocks, task_id, new_blocks):
+    '''
+    * Helper function for the accepted/rejected action handlers *
+    Takes the blocks of a posted message, a task id & that task's new blocks 
+        (section + buttons, as from generate_message()).
+    A message can carry several tasks; each task is its section followed by
+        its buttons block, whose block_id is the task id.
+    Returns the message blocks with only that task's blocks swapped out.
+    '''
+    for i, block in enumerate(message_blocks):
+        if block.get('type') == 'actions' and block.get('block_id') == str(task_id):
+            start = i - 1 if i > 0 and message_blocks[i-1].get('type') == 'section' else i
+            return message_blocks[:start] + new_blocks + message_blocks[i+1:]
+    return new_blocks
 
 
-def generate_message(task_info, user_id):
+def generate_message(task_info, user_id, status=None):
     '''
     Helper function for sendTasks.
     Get the list of task assigned to a user and format them into a 
-    json block message.
+    json block message. The button colours follow the given status, or else
+    the assignment status in the row itself (task_info[7], as fetched by 
+    messenger.get_assignments() / get_task_list()), so no DB lookup is needed.
     Return the block message
     '''
-    block = []
-    starttime_format = task_info[4].strftime("%A (%m/%d) at %I:%M%p")
-    # text = (f"*Task # {task_info[0]}*,Location: {task_info[2]} \n" + 
-    #         f"Description: {task_info[3]}\nStart Time: {starttime_format} \n" + 
-    #         f"Window: {task_info[5]} minutes \nCompensation: {task_info[6]}")
-    
-
-    text = (f"PLACEHOLDER_EMOJI *Task #PLACEHOLDER_TASKID* PLACEHOLDER_EMOJI \n*Description:* PLACEHOLDER_DESCRIPTION. \n*Start Time:* PLACEHOLDER_STARTTIME \n*Window:* PLACEHOLDER_WINDOW minutes \n*Compensation:* PLACEHOLDER_COMPENSATION")\
-                .replace('PLACEHOLDER_EMOJI', EMOJI_DICT[int(str(task_info[0])[-1])]) \
-                .replace('PLACEHOLDER_TASKID', str(task_info[0])) \
-                .replace('PLACEHOLDER_DESCRIPTION', str(task_info[3])) \
-                .replace('PLACEHOLDER_STARTTIME', str(starttime_format)) \
-                .replace('PLACEHOLDER_WINDOW', str(task_info[5])) \
-                .replace('PLACEHOLDER_COMPENSATION', str(task_info[6])) 
-
+    if status is None and len(task_info) > 7:
+        status = task_info[7]
+    templates = task_templates()
+    text = templates['task_message'].format(emoji=EMOJI_DICT[task_info[0] % 10],
+                                    task_id=task_info[0],
+                                    description=task_info[3],
+                                    start_time=task_info[4].strftime(templates['start_time_format']),
+                                    window=task_info[5],
+                                    compensation=task_info[6])
     description = {
                 "type": "section",
                 "text": {
@@ -134,10 +192,7 @@ def generate_message(task_info, user_id):
                     "text": text
                 }
     }
-    buttons = button_color(task_info[0], user_id)
-    block.append(description)
-    block.append(buttons)
-    return block
+    return [description, task_buttons(task_info[0], status)]
 
 
 def compact_task(task_info) -> dict:
@@ -147,13 +202,12 @@ def compact_task(task_info) -> dict:
         of when a task is first send to a user).
     Returns a fully formed 'section' Slack block (dict).
     """
-    starttime_format = task_info[4].strftime("%A (%m/%d) at %I:%M%p")
-    text  = "*Task #PLACEHOLDER_TASKID* (*comp:* PLACEHOLDER_COMPENSATION)\n *Starts:* PLACEHOLDER_STARTTIME, *window*: PLACEHOLDER_WINDOW min \n*Description:* PLACEHOLDER_DESCRIPTION." \
-                .replace('PLACEHOLDER_TASKID', str(task_info[0])) \
-                .replace('PLACEHOLDER_DESCRIPTION', str(task_info[3])) \
-                .replace('PLACEHOLDER_STARTTIME', str(starttime_format)) \
-                .replace('PLACEHOLDER_WINDOW', str(task_info[5])) \
-                .replace('PLACEHOLDER_COMPENSATION', str(task_info[6])) 
+    templates = task_templates()
+    text = templates['compact_task'].format(task_id=task_info[0],
+                                    description=task_info[3],
+                                    start_time=task_info[4].strftime(templates['start_time_format']),
+                                    window=task_info[5],
+                                    compensation=task_info[6])
     return {
 			"type": "section",
 			"text": {
@@ -162,72 +216,85 @@ def compact_task(task_info) -> dict:
 			}
 		}
     
-def make_report_block(user_id) -> list:
+def make_report_block(user_id, page=0, report_tasks=None) -> list:
     """
-    Takes a user id (int? str?)
-    Formats a report block for the given user using their 
+    Takes a user id (str), a page number & optionally the user's report rows
+        (messenger.get_report_tasks(), fetched with one query if not given).
+    Formats one page of the report for the given user using their 
         active (accepted, unexpired, uncompleted) & 
-        pending (pending, unexpired) tasks.
-    Returns a full formatted Slack block message (dict).
-    
+        pending (pending, unexpired, with accept/reject buttons) tasks,
+        REPORT_PAGE_SIZE tasks per page, with previous/next buttons.
+    Returns a full formatted Slack block message (list of blocks).
     """
-    # A list of task_list lists for all accepted, unexpired, uncompleted tasks
-    active_ids = messenger.get_accepted_tasks(user_id)
-    all_active = [messenger.get_task_list(user_id, task_id) for task_id in active_ids]
-  
-    # A list of task_list lists for all pending & unexpired tasks
-    pending_ids = messenger.get_pending_tasks(user_id)
-
-    # Add appropriate active task information
+    if report_tasks is None:
+        report_tasks = messenger.get_report_tasks(user_id)
+    num_active = sum(1 for task_list in report_tasks if task_list[7] == 'accepted')
+    num_pages = max(1, math.ceil(len(report_tasks) / REPORT_PAGE_SIZE))
+    page = min(max(page, 0), num_pages - 1)
+    first = page * REPORT_PAGE_SIZE
+    page_tasks = report_tasks[first:first + REPORT_PAGE_SIZE]
+
+    # Add appropriate active task information (active tasks come first)
+    block_headers = helper_functions.load_block('headers')
     blocks = []
-    if all_active:
-        if len(blocks) >= 46:
-                blocks.append(block_headers['too_many_pending_header'])
+    if num_active == 0 and page == 0:
+        blocks.append(block_headers['no_active_header'])
+    elif first < num_active:
         blocks.append(block_headers['active_header'])
         blocks.append(block_headers['divider'])
-        
-        # Sort active tasks by start time
-        sorted_active = sorted(all_active, key=lambda task_list: task_list[4]) 
-        for task_list in sorted_active:
-            active_task = compact_task(task_list)
-            blocks.append(active_task)
-    else:
-        blocks.append(block_headers['no_active_header'])
-
-    blocks.append(block_headers['divider'])
-    
-    # Add appropriate pending task information
-    if pending_ids:
-        blocks.append(block_headers['pending_header'])
-    else:
+    for i, task_list in enumerate(page_tasks, start=first):
+        if i == num_active or i == first > num_active:
+            # Add appropriate pending task information
+            if blocks:
+                blocks.append(block_headers['divider'])
+            blocks.append(block_headers['pending_header'])
+        blocks.append(compact_task(task_list))
+        if task_list[7] == 'pending':
+            blocks.append(task_buttons(task_list[0]))
+    if num_active == len(report_tasks) and page == num_pages - 1:
+        blocks.append(block_headers['divider'])
         blocks.append(block_headers['no_pending_header'])
 
-    # # Add 'for more info' ending
-    # blocks.append(block_headers['divider'])
-    # blocks.append(block_headers['ending_block'])
-
+    # Page navigation & 'for more info' ending
+    blocks.append(block_headers['divider'])
+    if num_pages > 1:
+        blocks.append(report_navigation(page, num_pages))
+    blocks.append(block_headers['ending_block'])
     return blocks
 
-
-def button_color(task_id, user_id):
+def report_navigation(page, num_pages) -> dict:
+    """
+    * Helper function for make_report_block() *
+    Takes the current page & the number of pages.
+    Returns an actions block with 'Page x of y' & previous/next buttons (each
+        button's value is the page it leads to).
+    """
+    elements = []
+    if page > 0:
+        elements.append({"type": "button", "text": {"type": "plain_text", "text": "◀ Previous"},
+                         "value": str(page - 1), "action_id": "report_previous"})
+    elements.append({"type": "button", "text": {"type": "plain_text", "text": f"Page {page + 1} of {num_pages}"},
+                     "value": str(page), "action_id": "report_current"})
+    if page < num_pages - 1:
+        elements.append({"type": "button", "text": {"type": "plain_text", "text": "Next ▶"},
+                         "value": str(page + 1), "action_id": "report_next"})
+    return {"type": "actions", "block_id": "report_navigation", "elements": elements}
+
+
+def task_buttons(task_id, status=None):
     """
-    Takes a task id (int) and user id (str).
-    Determines button formatting based on assignment status 
+    Takes a task id (int) and its assignment status (str).
+    Determines button formatting based on assignment status, sharing the
+        precompiled (read-only) button elements instead of copying them.
     Returns button block.
     """
-    status = messenger.get_assign_status(task_id, user_id)
-    if status == "rejected": # Reject btn is red
-        block = copy.deepcopy(default_btn)
-        block['elements'][1]['style'] = 'danger'
-        block['block_id'] = str(task_id)
-    elif status == "accepted": # Accept btn is green
-        block = copy.deepcopy(default_btn)
-        block['elements'][0]['style'] = 'primary'
-        block['block_id'] = str(task_id)
-    else: # both buttons grey
-        block = copy.deepcopy(default_btn)
-        block['block_id'] = str(task_id)
-    return block
+    templates = task_templates()
+    return {
+        "type": "actions",
+        "elements": templates['buttons'].get(status, templates['default_buttons']),
+        "block_id": str(task_id)
+    }
+
 
 def get_all_users_info() -> dict:
     '''
@@ -253,24 +320,74 @@ def get_all_users_info() -> dict:
     return users_store
 
 
-def get_pic(url, token, user_id, task_id):
+def remove_picture(path):
+    '''
+    * Helper function for ingest_submission() *
+    Takes   path: a downloaded picture that won't be recorded as a submission
+    Deletes it (if it's still there)
+    '''
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def ingest_submission(url, user_id, task_id, say):
     '''
     Takes   url: from payload['event']['files'][0]['url_private_download']
-            token: the bot token
             user_id: the user who sent the picture
-            task_id: the task they are trying to finish, should be payload['event']['text']
-    Downloads picture with the given download url and saves it in the given path
+            task_id: the task they are trying to finish
+            say: the handler's say(), to tell the user how it went
+    Hands the picture to submission_pool, which streams it to disk & then records
+        the submission, without blocking the handler.
+    Returns True if the submission was queued, False if the pool is saturated
     '''
-    r = requests.get(url, headers={'Authorization': 'Bearer %s' % token})
-    datetime = date.today() # change to clock
-    filename = f"../../snapngo_pics/{user_id}_{task_id}_{datetime}.jpeg"
-    open(filename, 'wb').write(r.content)
-    return filename
-
-def check_all_assignments():
-    messenger.check_all_assignments()
+    def record(path):
+        # The picture is only kept if it ends up recorded as the submission
+        try:
+            try:
+                picture_hash = image_hash.dhash(path)
+            except Exception as e:
+                print(f"- could not hash {path}: {e!r}", datetime.now())
+                say(f":large_orange_circle: We couldn't read your picture for task {task_id}. Please send it again.")
+                remove_picture(path)
+                return
+            # Loaded (once) before this submission is stored, so it only holds earlier ones
+            index = image_hash.shared_index(messenger.get_image_hashes)
+            assignment_id = messenger.submit_task(user_id, task_id, path, picture_hash)
+        except Exception:
+            remove_picture(path)
+            raise
+        if assignment_id:
+            # (submit_task counted it & updated reliability in the same transaction)
+            # Flag (for the submission check) pictures that near-duplicate an earlier submission
+            duplicates = [key for key, _ in index.query(picture_hash) if key != assignment_id]
+            if duplicates:
+                messenger.flag_duplicate_submission(assignment_id, duplicates[0])
+                print(f"- task {task_id} picture from {user_id} near-duplicates submission {duplicates[0]}", datetime.now())
+            index.add(picture_hash, assignment_id)
+        else:
+            remove_picture(path)
+            say(f":large_orange_circle: Task {task_id}'s time window closed before we could record your picture.")
+
+    def failed(error):
+        if isinstance(error, image_ingest.ImageTooLarge):
+            say(f":large_orange_circle: Your picture for task {task_id} is too large. Please send a smaller one.")
+        else:
+            say(f":large_orange_circle: We couldn't save your picture for task {task_id}. Please send it again.")
+
+    return submission_pool.submit(url, user_id, task_id, record, failed)
+
+def check_all_assignments(update_reliability=False):
+    '''
+    Settles the day's submissions (& recomputes reliabilities if asked, see
+        messenger.check_all_assignments()), then sends every active user
+        their daily summary through the outbox
+    '''
+    messenger.check_all_assignments(update_reliability)
     
-    for user_id in messenger.get_active_users_list():
+    # Every active user's account info in one query
+    messages = []
+    for user_id, account_info in messenger.get_all_account_info().items():
         block = [{
         "type": "section",
         "text": {
@@ -278,14 +395,25 @@ def check_all_assignments():
             "text": "✨*Your Daily Summary*✨"
         }
         }]
-        block += generate_account_summary_block(user_id)
-        #send account summary
-        send_messages(user_id, block, "")
+        block += generate_account_summary_block(user_id, account_info)
+        messages.append((user_id, block, "Your Daily Summary"))
+    #send account summaries through the outbox (concurrent, rate limited, failures retried per message);
+    #drain() claims each batch first, so the outbox timer draining at the same time can't post a summary twice
+    start = datetime.now()
+    outbox.enqueue(messages, 'summary')
+    counts = outbox.drain()
+    print(f"- daily summaries: sent {counts['sent']}/{len(messages)}, retrying {counts['retrying']}, "
+          f"failed {counts['failed']} in {(datetime.now() - start).total_seconds():.1f}s", datetime.now())
     return
     
-def generate_account_summary_block(user_id):
-    compensation, tasks = messenger.get_account_info(user_id)
-    text = f"All completed tasks: {tasks}\nTotal compensation: {compensation} points"
+def generate_account_summary_block(user_id, account_info=None):
+    '''
+    Takes a user id & optionally their (compensation, completed task ids, submissions 
+        waiting to be checked), which are looked up if not given.
+    Returns the account summary block.
+    '''
+    compensation, tasks, waiting = account_info or messenger.get_account_info(user_id)
+    text = f"All completed tasks: {tasks}\nSubmissions waiting to be checked: {waiting}\nTotal compensation: {compensation} points"
     summary = [{
         "type": "section",
         "text": {
@@ -310,31 +438,16 @@ def handle_message(payload, say):
 
     print("- Message sent", user_id, text, datetime.now())
     # Handle certain responses
-    if BOT_ID != user_id:
+    if bot_id() != user_id:
         if 'files' not in payload:
             if text.strip() == "?" or text.strip().lower() == 'help':
-                say(info_page)
+                say(helper_functions.load_block('help_block'))
             # User only sends text without attaching an image
             elif text.strip().lower() == "account":
                 send_messages(user_id, generate_account_summary_block(user_id), "")
             elif text.strip().lower() == "report":
-                active_block = make_report_block(user_id)
-                end_block = [block_headers['divider'], block_headers['ending_block']]
-                client.chat_postMessage(channel=f"@{user_id}", blocks = active_block,text="")
-
-                 # Sort pending tasks by start time
-                pending_ids = messenger.get_pending_tasks(user_id)
-                all_pending = [messenger.get_task_list(user_id, task_id) for task_id in pending_ids]
-                sorted_pending = sorted(all_pending, key=lambda task_list: task_list[4])
-                for task_list in sorted_pending:
-                    pending_task = compact_task(task_list)
-                    buttons = copy.deepcopy(default_btn)
-                    buttons['block_id'] = str(task_list[0])
-                    blocks = [pending_task, buttons]
-
-                    client.chat_postMessage(channel=f"@{user_id}", blocks = blocks, text="")
-
-                client.chat_postMessage(channel=f"@{user_id}", blocks = end_block,text="")
+                # One query & one message; more tasks page through previous/next
+                client.chat_postMessage(channel=f"@{user_id}", blocks = make_report_block(user_id), text="Your tasks report")
             elif text.strip().lower() == "opt in":
                 messenger.update_account_status(user_id, "active")
                 say("You have opted in for the day.")
@@ -342,7 +455,7 @@ def handle_message(payload, say):
                 messenger.update_account_status(user_id, "inactive")
                 say("You have opted out for the day.")
             else:
-                say(sample_task)
+                say(helper_functions.load_block('sample_task'))
         else:
             # User attaches more than one image
             print("text+file", datetime.now())
@@ -365,9 +478,10 @@ def handle_message(payload, say):
             accepted_tasks = messenger.get_accepted_tasks(user_id)
             pending_tasks = messenger.get_pending_tasks(user_id)
             # The text the user enters isn't any of their assigned task numbers
-            if messenger.check_time_window(task_id) == "expired":
+            time_window = messenger.check_time_window(task_id)
+            if time_window == "expired":
                 say(f''':large_orange_circle: Task {task_id} has already expired. Please pick another assigned task to finish.''')
-            elif messenger.check_time_window(task_id) == "not started":
+            elif time_window == "not started":
                 say(f''':large_orange_circle: Task {task_id} has not started yet. Please check the start time & time window and finish this task later.''')
             elif task_id not in accepted_tasks: 
                 say(f":large_orange_circle: Task {task_id} is not one of your unfinished, accepted tasks. Your unfinished, accepted tasks are {accepted_tasks}")
@@ -377,10 +491,10 @@ def handle_message(payload, say):
             else:
                 print("submitted")
                 url = file['url_private_download']
-                path = get_pic(url, os.environ['TASK_BOT_TOKEN'], user_id, task_id)
-                if messenger.submit_task(user_id, task_id, path):
-                    messenger.update_reliability(user_id)
+                if ingest_submission(url, user_id, task_id, say):
                     say(f"We received your submission to task {task_id}. Your compensation will be secured once we checked your submission. Reply `account` for more information on your account and completed tasks.")
+                else:
+                    say(f":large_orange_circle: We're receiving a lot of pictures right now. Please send your picture for task {task_id} again in a minute.")
             #update database if image is NULL
         return #needs to be changed
 
@@ -392,7 +506,7 @@ def handle_message_events(body, logger, say):
     '''
     logger.info(body)
     user = body['event']['user']
-    say(sample_task)
+    say(helper_functions.load_block('sample_task'))
 
 
 @app.event("file_shared")
@@ -410,62 +524,63 @@ def handle_team_join(body, logger, say):
     send_welcome_message([user_id])
 
 ### ### INTERACTION HANDLERS ### ###
-@app.action("accepted")
-def action_button_click(body, ack, say):
+def respond_to_task(body, say, new_status):
     '''
-    body['actions'][0]   {'value': 'accepted', 'block_id': '1', 'type': 'button', 'action_id': 'accepted', 'text':...}
+    * Helper function for the accepted/rejected action handlers *
+    Takes the action body, say() & the user's answer.
+    Records the answer with one conditional UPDATE (a rejection also credits a
+        small compensation in the same transaction), re-renders the clicked task
+        from the row read back, and tells the user the outcome.
+    Returns nothing.
     '''
-    # Acknowledge the action
-    ack()
-    messenger.update_tasks_expired()
     action = body['actions'][0]
-    new_status = action['value']
     task = int(action['block_id'])
     user = str(body['user']['id'])
-    task_list = messenger.get_task_list(user, task)
-    old_status = messenger.get_assign_status(task, user)
-    if messenger.check_time_window(task) == "expired":
+    compensation = round(random.randint(10, 30)/100, 2) if new_status == "rejected" else 0
+    changed, task_list = messenger.respond_to_assignment(task, user, new_status, compensation)
+    if changed:
+        message = replace_task_blocks(body["message"]["blocks"], task, generate_message(task_list, user))
+        client.chat_update(channel=body["channel"]["id"], ts = body["message"]["ts"], blocks = message, text=f"{new_status.capitalize()}!")
+        if compensation:
+            say(f"You {new_status} task {task}.\nA compensation of {compensation} points is added to your account. Reply `account` to see your account status.")
+        else:
+            say(f"You {new_status} task {task}")
+    elif task_list[7] not in ("pending", "queued"):
+        say(f"You already {task_list[7]} task {task}")
+    elif task_list[8]:
         say(f''':large_orange_circle: Task {task} has already expired. Please pick another assigned task to finish.''')
-        return
-    if old_status == "pending":
-        messenger.update_assign_status(new_status, task, user)
-        # task_list = messenger.get
-        message = generate_message(task_list, user)
-        client.chat_update(channel=body["channel"]["id"], ts = body["message"]["ts"], blocks = message,text="Accepted!")
-        say(f"You {new_status} task {task}")
-    else:
-        say(f"You already {old_status} task {task}")
-    return
-    
+
+
+@app.action("accepted")
+@helper_functions.track_latency("action accepted")
+def handle_accept(body, ack, say):
+    '''
+    body['actions'][0]   {'value': 'accepted', 'block_id': '1', 'type': 'button', 'action_id': 'accepted', 'text':...}
+    '''
+    # Acknowledge the action
+    ack()
+    respond_to_task(body, say, "accepted")
+
 
 @app.action("rejected")
-def action_button_click(body, ack, say):
+@helper_functions.track_latency("action rejected")
+def handle_reject(body, ack, say):
     # Acknowledge the action
     ack()
+    respond_to_task(body, say, "rejected")
 
-    # Get task info 
-    messenger.update_tasks_expired()
-    action = body['actions'][0]
-    new_status = action['value']
-    task = int(action['block_id'])
+
+@app.action(re.compile("^report_(previous|current|next)$"))
+def handle_report_page(body, ack):
+    '''
+    Previous/next (& page number) buttons of the `report` message: re-renders
+        the same message at the page in the button's value.
+    '''
+    ack()
     user = str(body['user']['id'])
-    task_list = messenger.get_task_list(user, task)
-    old_status = messenger.get_assign_status(task, user)
-    if messenger.check_time_window(task) == "expired":
-        say(f''':large_orange_circle: Task {task} has already expired.''')
-        return
-    # Change 
-    if old_status == "pending":
-        messenger.update_assign_status(new_status, task, user)
-        # task_list = messenger.get
-        message = generate_message(task_list, user)
-        client.chat_update(channel=body["channel"]["id"], ts = body["message"]["ts"], blocks = message,text="Rejected!")
-        compensation = round(random.randint(10, 30)/100, 2)
-        messenger.add_account_compensation(user, compensation)
-        say(f"You {new_status} task {task}.\nA compensation of {compensation} points is added to your account. Reply `account` to see your account status.")
-    else:
-        say(f"You already {old_status} task {task}")
-    return
+    page = int(body['actions'][0]['value'])
+    client.chat_update(channel=body["channel"]["id"], ts=body["message"]["ts"], 
+                       blocks=make_report_block(user, page), text="Your tasks report")
 
 
 @app.action("bugs_form")
@@ -0,0 +1,122 @@
+"""
+Description: Cold-import check for the Snap N Go modules.
+    Imports every module in IMPORT_BUDGETS in a fresh interpreter, from an empty
+    working directory & with outbound network connections refused, and times the
+    import. Fails if importing a module talks to the network (Slack, MySQL), depends
+    on the working directory (fails to import there, or keeps a relative path such as
+    its .env path in a module-level variable), or takes longer than its budget
+    (median of IMPORT_RUNS runs).
+    Usage: python check_import_times.py   (exits with status 1 on a failure)
+"""
+import os
+import sys
+import json
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+
+### ### CONSTANTS ### ###
+MODULE_DIR = Path(__file__).resolve().parent
+IMPORT_RUNS = 3
+# Cold-import budget per module, in seconds (importing a module includes its imports)
+IMPORT_BUDGETS = {
+    'task_parameters': 0.3,
+    'helper_functions': 0.3,
+    'messenger': 0.3,
+    'counters': 0.3,
+    'task_cache': 0.3,
+    'task': 0.3,
+    'outbox': 0.4,
+    'slack_delivery': 0.3,
+    'image_hash': 0.3,
+    'image_ingest': 0.3,
+    'matching_assignments': 0.3,
+    'workspace': 0.3,
+    'migrations': 0.3,
+    'bot': 1.0,
+    'connections': 1.0,
+    'maintenance': 1.0,
+}
+# Configuration the modules read at import; placeholders are used for the ones not set
+# (they only stand in for values: where the .env file is looked for is still checked)
+PLACEHOLDER_ENV = {'DB_NAME': 'snapngo_db', 'SQL_PASS': 'unused', 'TASK_BOT_TOKEN': 'xoxb-unused'}
+
+# Run in the child interpreter: refuse network connections, then time one import
+CHILD_CODE = '''
+import sys, json, socket, importlib
+from pathlib import PurePath
+from time import perf_counter
+
+def refuse(*args, **kwargs):
+    raise ConnectionRefusedError("network access while importing")
+socket.socket.connect = socket.socket.connect_ex = refuse
+socket.create_connection = socket.getaddrinfo = refuse
+
+sys.path.insert(0, sys.argv[1])
+start = perf_counter()
+try:
+    importlib.import_module(sys.argv[2])
+except BaseException as e:
+    print(json.dumps({'error': repr(e)}))
+else:
+    seconds = perf_counter() - start
+    # paths kept at module level must not depend on the working directory
+    relative = [f"{module.__name__}.{name} = {value}" for module in list(sys.modules.values())
+                if str(getattr(module, '__file__', None) or '').startswith(sys.argv[1])
+                for name, value in vars(module).items()
+                if isinstance(value, PurePath) and not value.is_absolute()]
+    print(json.dumps({'error': 'relative path ' + ', '.join(relative)} if relative else {'seconds': seconds}))
+'''
+
+
+### ### TIMING ### ###
+def time_import(module, runs=IMPORT_RUNS):
+    """
+    Takes a module name.
+    Imports it in `runs` fresh interpreters (each from an empty working directory).
+    Returns (median import time in seconds, None), or (None, the error) if an
+        import failed.
+    """
+    env = dict(PLACEHOLDER_ENV, **os.environ)
+    times = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for _ in range(runs):
+            done = subprocess.run([sys.executable, '-c', CHILD_CODE, str(MODULE_DIR), module],
+                                  cwd=workdir, env=env, capture_output=True, text=True)
+            lines = done.stdout.strip().splitlines()
+            if done.returncode or not lines:
+                return None, done.stderr.strip().splitlines()[-1:] or f"exit status {done.returncode}"
+            result = json.loads(lines[-1])
+            if 'error' in result:
+                return None, result['error']
+            times.append(result['seconds'])
+    return statistics.median(times), None
+
+
+### ### OVERALL CHECK ### ###
+def check_import_times(budgets=IMPORT_BUDGETS):
+    """
+    Takes a dict of module name -> budget (seconds).
+    Prints the cold-import time of every module against its budget.
+    Returns the number of modules that failed to import or went over budget.
+    """
+    failures = 0
+    for module, budget in budgets.items():
+        seconds, error = time_import(module)
+        if error:
+            verdict = f"FAILED {error}"
+        elif seconds > budget:
+            verdict = f"{seconds:.3f}s  OVER BUDGET ({budget}s)"
+        else:
+            verdict = f"{seconds:.3f}s  ok ({budget}s)"
+        failures += bool(error) or seconds > budget
+        print(f"{module:<22} {verdict}")
+    return failures
+
+
+if __name__ == '__main__':
+    failures = check_import_times()
+    print(f"{failures} module(s) failed the import check." if failures else "All modules import within budget.")
+    sys.exit(1 if failures else 0)
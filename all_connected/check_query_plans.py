@@ -0,0 +1,208 @@
+"""
+Description: EXPLAIN-based regression check for the database queries.
+    Pulls every SQL statement out of the modules in CHECKED_MODULES, fills in sample
+    values, and runs EXPLAIN on each one against a scratch copy of the schema (all
+    migrations applied) seeded with SEED_ROWS tasks & assignments. Fails if any of
+    them reads a big table with a full table or full index scan.
+    Usage: python check_query_plans.py   (exits with status 1 on a full scan)
+    Note: no MySQL server was available when this check was written, so it has not been
+    run against a real database yet; treat its first run as the baseline to fix against.
+"""
+import ast
+import re
+import sys
+import random
+from pathlib import Path
+from datetime import datetime, timedelta
+
+import pymysql
+import helper_functions
+import migrations
+
+import os
+from dotenv import load_dotenv
+env_path = Path(__file__).resolve().parent.parent / '.env'
+load_dotenv(dotenv_path=env_path)
+
+### ### CONSTANTS ### ###
+DB_NAME = os.environ['DB_NAME']
+CHECK_DB_NAME = f"{DB_NAME}_plan_check"     # scratch database, dropped & rebuilt when re-seeding
+MODULE_DIR = Path(__file__).resolve().parent
+CREATE_TABLES_FILE = MODULE_DIR / 'data' / 'create_tables.sql'
+CHECKED_MODULES = [MODULE_DIR / name for name in ('messenger.py', 'matching_assignments.py', 'outbox.py', 'task_cache.py')]
+
+SEED_ROWS = 1_000_000       # tasks & assignments in the seeded dataset
+SEED_USERS = 10_000
+SEED_BATCH = 10_000
+BIG_TABLES = {'tasks', 'assignments'}   # a full scan of these fails the check
+FULL_SCAN_TYPES = {'ALL', 'index'}      # EXPLAIN access types that read every row
+
+SQL_START = re.compile(r'^\s*(SELECT|UPDATE|DELETE|INSERT)\b', re.IGNORECASE)
+# Sample values for the variables interpolated into f-string queries (default: 1)
+SAMPLE_VALUES = {'user_id': 'U0000001', 'user': 'U0000001', 'status': 'accepted', 'path': 'sample.jpeg',
+                 'table_name': 'users', 'placeholders': '%s', 'reliability': '0.5',
+                 'day_filter': 'AND user_id = %s', 'user_filter': 'users.id = %s', 'where': ''}
+
+
+### ### QUERY EXTRACTION ### ###
+def render_fstring(node):
+    """
+    * Helper function for extract_queries() *
+    Takes an ast.JoinedStr (f-string) node.
+    Returns its text with every {expression} replaced by a sample value.
+    """
+    parts = []
+    for value in node.values:
+        if isinstance(value, ast.Constant):
+            parts.append(str(value.value))
+        else:
+            expression = ast.unparse(value.value)
+            parts.append(SAMPLE_VALUES.get(expression.split('[')[0].split('.')[-1], '1'))
+    return ''.join(parts)
+
+def extract_queries(fname):
+    """
+    Takes a Python source file name.
+    Finds every string or f-string literal that is a SQL statement.
+    Returns a list of (line number, SQL with sample values filled in).
+    """
+    tree = ast.parse(Path(fname).read_text())
+    # the literal pieces of an f-string are Constant nodes too; only look at the whole f-string
+    fstring_pieces = {id(value) for node in ast.walk(tree) if isinstance(node, ast.JoinedStr) for value in node.values}
+    queries = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.JoinedStr):
+            sql = render_fstring(node)
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str) and id(node) not in fstring_pieces:
+            sql = node.value
+        else:
+            continue
+        if SQL_START.match(sql):
+            queries.append((node.lineno, sql.replace('%s', '1').strip().rstrip(';')))
+    return sorted(queries)
+
+
+### ### SCRATCH DATABASE ### ###
+def create_schema(db):
+    """
+    * Helper function for prepare_database() *
+    Takes a connection to the (empty) scratch database.
+    Creates the tables from create_tables.sql, skipping its database-level statements.
+    Returns nothing.
+    """
+    cursor = db.cursor()
+    for statement in migrations.split_statements(CREATE_TABLES_FILE.read_text()):
+        if re.match(r'^(DROP DATABASE|CREATE DATABASE|USE)\b', statement, re.IGNORECASE):
+            continue
+        cursor.execute(statement)
+    db.commit()
+
+def seed(db, num_rows=SEED_ROWS, num_users=SEED_USERS, batch=SEED_BATCH):
+    """
+    * Helper function for prepare_database() *
+    Takes a connection to the scratch database.
+    Fills it with a year's worth of synthetic history: num_users users, num_rows tasks
+        (all but the most recent ~1% expired) & num_rows assignments.
+    Returns nothing.
+    """
+    rng = random.Random(0)
+    cursor = db.cursor()
+    user_ids = [f"U{i:07d}" for i in range(num_users)]
+    cursor.executemany("INSERT INTO users (id, `name`, reliability) VALUES (%s, %s, %s)",
+                       [(user_id, user_id, round(rng.random(), 2)) for user_id in user_ids])
+
+    now = datetime.now()
+    first_start = now - timedelta(days=365)
+    step = timedelta(days=366) / num_rows
+    for offset in range(0, num_rows, batch):
+        rows = []
+        for i in range(offset, min(offset + batch, num_rows)):
+            start = first_start + i * step
+            window = rng.randint(1, 100)
+            rows.append(('W102', 'seeded task', start, window, 3.5, start + timedelta(minutes=window) < now))
+        cursor.executemany("""INSERT INTO tasks (`location`, `description`, start_time, time_window, compensation, expired)
+                              VALUES (%s, %s, %s, %s, %s, %s)""", rows)
+        db.commit()
+
+    statuses = ['accepted', 'rejected', 'pending', 'not assigned']
+    for offset in range(0, num_rows, batch):
+        rows = []
+        for i in range(offset, min(offset + batch, num_rows)):
+            status = 'not assigned' if i > num_rows - 100 else rng.choice(statuses[:3])
+            submitted = status == 'accepted' and rng.random() < 0.7
+            recommend = first_start + i * step
+            rows.append((i + 1, rng.choice(user_ids), recommend, 'seeded.jpeg' if submitted else None,
+                         recommend + timedelta(minutes=5) if submitted else None, submitted, status))
+        cursor.executemany("""INSERT INTO assignments (task_id, user_id, recommend_time, img, submission_time, checked, `status`)
+                              VALUES (%s, %s, %s, %s, %s, %s, %s)""", rows)
+        db.commit()
+    cursor.execute("ANALYZE TABLE users, tasks, assignments")
+    cursor.fetchall()
+
+def prepare_database(reseed=False):
+    """
+    Takes whether to rebuild the scratch database from scratch.
+    Creates, migrates & seeds CHECK_DB_NAME if it isn't seeded yet (seeding a million
+        rows takes a few minutes, so it's reused between runs).
+    Returns nothing.
+    """
+    with helper_functions.connectDB(DB_NAME) as db:
+        cursor = db.cursor()
+        if reseed:
+            cursor.execute(f"DROP DATABASE IF EXISTS `{CHECK_DB_NAME}`")
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{CHECK_DB_NAME}`")
+
+    with helper_functions.connectDB(CHECK_DB_NAME) as db:
+        cursor = db.cursor()
+        cursor.execute("SHOW TABLES LIKE 'tasks'")
+        if not cursor.fetchall():
+            create_schema(db)
+    migrations.migrate(CHECK_DB_NAME)
+
+    with helper_functions.connectDB(CHECK_DB_NAME) as db:
+        cursor = db.cursor()
+        cursor.execute("SELECT COUNT(*) FROM assignments")
+        if cursor.fetchone()[0] < SEED_ROWS:
+            print(f"- seeding {CHECK_DB_NAME} with {SEED_ROWS} tasks & assignments")
+            seed(db)
+
+
+### ### OVERALL CHECK ### ###
+def full_scans(db, sql):
+    """
+    Takes a connection & a SQL statement.
+    Runs EXPLAIN on it.
+    Returns a list of (table, access type) for every big table it reads in full.
+    """
+    cursor = db.cursor(pymysql.cursors.DictCursor)
+    cursor.execute(f"EXPLAIN {sql}")
+    return [(row['table'], row['type']) for row in cursor.fetchall()
+            if row['table'] in BIG_TABLES and row['type'] in FULL_SCAN_TYPES]
+
+def check_query_plans(modules=CHECKED_MODULES, reseed=False):
+    """
+    Takes the modules to check.
+    Prints the plan verdict for every query in them.
+    Returns the number of failing queries (full scans or queries MySQL rejects).
+    """
+    prepare_database(reseed)
+    failures = 0
+    with helper_functions.connectDB(CHECK_DB_NAME) as db:
+        for module in modules:
+            for line, sql in extract_queries(module):
+                if sql.upper().startswith('INSERT'):
+                    continue
+                try:
+                    scans = full_scans(db, sql)
+                except pymysql.MySQLError as e:
+                    scans = [('error', str(e))]
+                failures += bool(scans)
+                verdict = 'ok' if not scans else 'FULL SCAN ' + ', '.join(f"{t} ({kind})" for t, kind in scans)
+                print(f"{Path(module).name}:{line:<5} {verdict}")
+    return failures
+
+
+if __name__ == '__main__':
+    failures = check_query_plans(reseed='--reseed' in sys.argv)
+    print(f"{failures} query(ies) fall back to a full scan." if failures else "No full scans.")
+    sys.exit(1 if failures else 0)
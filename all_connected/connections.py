@@ -7,13 +7,15 @@ Description: File that connects all 5 components & calls functions for them to
 import os
 from pathlib import Path
 from dotenv import load_dotenv
-env_path = Path('..') / '.env'
+env_path = Path(__file__).resolve().parent.parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
 import matching_assignments
 import task
 import messenger
 import bot
+import outbox
+import counters
 import task_parameters
 
 from datetime import datetime as dt, date
@@ -25,12 +27,15 @@ from threading import Timer
 DB_NAME = os.environ['DB_NAME']
 
 TASK_CYCLE = task_parameters.TASK_CYCLE #every half an hour
-NUM_TASKS_PER_CYCLE = task_parameters.NUM_TASKS_PER_CYCLE 
 
 MATCHING_CYCLE = task_parameters.MATCHING_CYCLE
 
 MESSENGER_BOT_CYCLE = task_parameters.MESSENGER_BOT_CYCLE 
 
+EXPIRY_CYCLE = task_parameters.EXPIRY_CYCLE
+
+OUTBOX_CYCLE = task_parameters.OUTBOX_CYCLE
+
 START_HOURS = task_parameters.START_HOURS
 END_HOURS = task_parameters.END_HOURS
 
@@ -57,12 +62,21 @@ class RepeatTimer(Timer):
 # Generate & insert task(s)
 def task_call():
     """Takes & returns nothing. Container for task call timer."""
-    task.generate_tasks(NUM_TASKS_PER_CYCLE, DB_NAME)
+    task.generate_tasks(task_parameters.num_tasks_per_cycle(), DB_NAME)
     print('- tasks generated', dt.now())
 
 
+### ### Expiry Sweeper call ### ###
+# The only writer of tasks.expired: flags tasks whose time window has passed
+def expiry_call():
+    """Takes & returns nothing. Container for expiry sweeper timer."""
+    flagged = messenger.update_tasks_expired()
+    if flagged:
+        print(f'- {flagged} tasks expired', dt.now())
+
+
 ### ### Matching Algorithm & Assignments call ### ###
-# Update expired tasks, matches unexpired & unassigned tasks to users, create those Assignments
+# Matches unexpired & unassigned tasks to users, create those Assignments
 def match_call():
     """Takes & returns nothing. Container for match call timer."""
     matching_assignments.match_users_and_tasks(task_parameters.MATCHING_ALGO, DB_NAME)
@@ -70,15 +84,22 @@ def match_call():
 
 
 ### ### MESSENGER call ### ###
-# Sends out tasks & updates recommendTime in 'assignments' table
+# Queues new tasks in the outbox & sends them (assignments become pending once posted)
 def messenger_bot_call():
     """Takes & returns nothing. Container for messenger timer."""
     assign_dict = messenger.get_assignments(DB_NAME)
     bot.send_tasks(assign_dict)
     print('- sent tasks')
-    messenger.update_assign_status("pending", 0, 0)
 
 
+### ### OUTBOX call ### ###
+# Retries failed messages & resumes whatever was still queued at (re)start
+def outbox_call():
+    """Takes & returns nothing. Container for outbox timer."""
+    counts = outbox.drain()
+    if any(counts.values()):
+        print(f"- outbox: sent {counts['sent']}, retrying {counts['retrying']}, failed {counts['failed']}", dt.now())
+
 
 def start_all_timers():
     task_timer = RepeatTimer(task_call, TASK_CYCLE)
@@ -90,53 +111,54 @@ def start_all_timers():
                                 seconds=MESSENGER_BOT_CYCLE,
                                 minutes=0,
                                 hours=0)
+    expiry_timer = RepeatTimer(expiry_call, EXPIRY_CYCLE)
+    outbox_timer = RepeatTimer(outbox_call, OUTBOX_CYCLE)
     # Start all cycles
     task_timer.start()
     match_timer.start()
     messenger_timer.start()
+    expiry_timer.start()
+    outbox_timer.start()
     print("STARTED ALL TIMERS", dt.now())
-    return task_timer, match_timer, messenger_timer
+    return task_timer, match_timer, messenger_timer, expiry_timer, outbox_timer
 
-def cancel_all_timers(task_timer, match_timer, messenger_timer):
+def cancel_all_timers(task_timer, match_timer, messenger_timer, expiry_timer, outbox_timer):
     print("CANCEL ALL TIMERS", dt.now())
     task_timer.cancel()
     match_timer.cancel()
     messenger_timer.cancel()
+    expiry_timer.cancel()
+    outbox_timer.cancel()
 
 def daily_cycle():
-    all_users = messenger.get_all_users_list()
-    for user_id in all_users:
-        if user_id not in admin_list:
-            messenger.update_account_status(user_id, "active")
-    task_timer, match_timer, messenger_timer = start_all_timers()
+    messenger.activate_users(admin_list)
+    timers = start_all_timers()
     # Run time
     end_time = dt.combine(date.today(), END_HOURS)
     duration = (end_time - dt.now()).total_seconds()
     print(duration)
     time.sleep(duration + 2) # run till end_time
-    # Check assignments and end daily summary
-    bot.check_all_assignments()
-    for user_id in all_users:
-        if user_id not in ['USLACKBOT']:
-            messenger.update_reliability(user_id)
+    # Verify (& repair) the running per-user counters against assignments before reliability reads them
+    counters.reconcile(fix=True)
+    # Check assignments, update reliabilities (set-based, one transaction) and end daily summary
+    bot.check_all_assignments(update_reliability=True)
     # End all cycles
-    cancel_all_timers(task_timer, match_timer, messenger_timer)
+    cancel_all_timers(*timers)
 
 def short_cycle():
-    all_users = messenger.get_all_users_list()
-    for user_id in all_users:
-        if user_id not in admin_list:
-            messenger.update_account_status(user_id, "active")
-    task_timer, match_timer, messenger_timer = start_all_timers()
+    messenger.activate_users(admin_list)
+    timers = start_all_timers()
     # Run time
     end_time = dt.combine(date.today(), END_HOURS)
     duration = (end_time - dt.now()).total_seconds()
     print(duration)
     time.sleep(duration + 2) # run till end_time
+    # Verify (& repair) the running per-user counters against assignments
+    counters.reconcile(fix=True)
     # Check assignments and end daily summary
     bot.check_all_assignments()
     # End all cycles
-    cancel_all_timers(task_timer, match_timer, messenger_timer)
+    cancel_all_timers(*timers)
 
 if __name__ == "__main__":
     start_hours_str = START_HOURS.strftime("%H:%M")
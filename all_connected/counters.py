@@ -0,0 +1,191 @@
+"""
+Description: Running per-user counters (accepted assignments, submitted pictures,
+    checked submissions & compensation earned from them), kept in the `user_counters`
+    table with one row per user & day (the day the assignment was recommended), and
+    over all days in the `user_totals` table with one row per user.
+    messenger.py updates both with add() / add_settled() inside the same transaction
+    as the status change, submission or settlement they count, so reliability reads
+    a couple of day rows & account views one total row instead of recounting assignments.
+    reconcile() recounts everything from the raw tables (a full scan, run once a day)
+    and reports, & optionally repairs, any counter that drifted.
+    Usage: python counters.py         (report mismatches)
+           python counters.py --fix   (report & repair them)
+"""
+import os
+import sys
+from pathlib import Path
+from dotenv import load_dotenv
+env_path = Path(__file__).resolve().parent.parent / '.env'
+load_dotenv(dotenv_path=env_path)
+
+from decimal import Decimal
+from datetime import datetime
+from time import perf_counter
+
+import helper_functions
+
+
+### ### CONSTANTS ### ###
+DB_NAME = os.environ['DB_NAME']
+COUNTERS = ('accepted', 'submitted', 'checked', 'earned')
+
+# What every counter row should hold, recounted from assignments (same as the 004 migration's backfill)
+EXPECTED_QUERY = '''SELECT assignments.user_id, DATE(assignments.recommend_time),
+                        SUM(assignments.`status` = 'accepted'), COUNT(assignments.img),
+                        SUM(assignments.checked = 1 AND assignments.submission_time IS NOT NULL),
+                        COALESCE(SUM(IF(assignments.checked = 1 AND assignments.submission_time IS NOT NULL, tasks.compensation, 0)), 0)
+                    FROM assignments LEFT JOIN tasks ON assignments.task_id = tasks.id
+                    WHERE assignments.user_id IS NOT NULL AND assignments.recommend_time IS NOT NULL
+                    GROUP BY assignments.user_id, DATE(assignments.recommend_time)'''
+
+
+### ### INCREMENTS ### ###
+def add(cur, user_id, task_id, **deltas):
+    """
+    Takes a cursor in the caller's open transaction, an assignment's user id & task
+        id, and the amount to add to each counter (eg. accepted=1, submitted=-1).
+    Adds them to the row for the day that assignment was recommended & to the user's
+        totals (nothing is counted for an assignment that was never recommended).
+    Returns nothing.
+    """
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    assert set(deltas) <= set(COUNTERS), f"Unknown counters: {set(deltas) - set(COUNTERS)}"
+    if not deltas:
+        return
+    columns = ', '.join(deltas)
+    values = ', '.join(['%s'] * len(deltas))
+    updates = ', '.join(f"{name} = {name} + VALUES({name})" for name in deltas)
+    cur.execute(f'''INSERT INTO user_counters (user_id, `day`, {columns})
+                    SELECT user_id, DATE(recommend_time), {values}
+                    FROM assignments
+                    WHERE user_id = %s AND task_id = %s AND recommend_time IS NOT NULL
+                ON DUPLICATE KEY UPDATE {updates}''',
+                (*deltas.values(), user_id, task_id))
+    cur.execute(f'''INSERT INTO user_totals (user_id, {columns})
+                    SELECT user_id, {values}
+                    FROM assignments
+                    WHERE user_id = %s AND task_id = %s AND recommend_time IS NOT NULL
+                ON DUPLICATE KEY UPDATE {updates}''',
+                (*deltas.values(), user_id, task_id))
+
+def add_settled(cur):
+    """
+    Takes a cursor in the settlement transaction, before it marks the unchecked
+        submissions checked (& with them locked).
+    Counts every one of them as checked & its task's compensation as earned, with
+        one set-based INSERT into the day rows & one into the totals.
+    Returns nothing.
+    """
+    cur.execute('''INSERT INTO user_counters (user_id, `day`, checked, earned)
+                    SELECT assignments.user_id, DATE(assignments.recommend_time), COUNT(*), COALESCE(SUM(tasks.compensation), 0)
+                    FROM assignments LEFT JOIN tasks ON assignments.task_id = tasks.id
+                    WHERE assignments.checked = 0 AND assignments.submission_time IS NOT NULL
+                        AND assignments.user_id IS NOT NULL AND assignments.recommend_time IS NOT NULL
+                    GROUP BY assignments.user_id, DATE(assignments.recommend_time)
+                ON DUPLICATE KEY UPDATE checked = checked + VALUES(checked), earned = earned + VALUES(earned)''')
+    cur.execute('''INSERT INTO user_totals (user_id, checked, earned)
+                    SELECT assignments.user_id, COUNT(*), COALESCE(SUM(tasks.compensation), 0)
+                    FROM assignments LEFT JOIN tasks ON assignments.task_id = tasks.id
+                    WHERE assignments.checked = 0 AND assignments.submission_time IS NOT NULL
+                        AND assignments.user_id IS NOT NULL AND assignments.recommend_time IS NOT NULL
+                    GROUP BY assignments.user_id
+                ON DUPLICATE KEY UPDATE checked = checked + VALUES(checked), earned = earned + VALUES(earned)''')
+
+
+### ### RECONCILIATION ### ###
+def normalize(row):
+    """
+    * Helper function for reconcile() *
+    Takes the counter values of one row (or None for a missing row).
+    Returns them as (int, int, int, Decimal); an all-zero row is the same as a missing one.
+    """
+    if row is None:
+        return (0, 0, 0, Decimal(0))
+    accepted, submitted, checked, earned = row
+    return (int(accepted), int(submitted), int(checked), Decimal(earned))
+
+def diff(stored, expected):
+    """
+    * Helper function for reconcile() *
+    Takes the stored & the recounted counters, as dicts from a key (eg. (user_id, day))
+        to normalized counter values.
+    Returns a sorted list of (key, stored counters, expected counters) for every key
+        whose values differ (a missing key counts as all zeros, and is None in the
+        result).
+    """
+    zero = normalize(None)
+    return [(key, stored.get(key), expected.get(key)) for key in sorted(stored.keys() | expected.keys())
+            if stored.get(key, zero) != expected.get(key, zero)]
+
+def totals_of(day_counters):
+    """
+    * Helper function for reconcile() *
+    Takes normalized counters keyed by (user_id, day).
+    Returns them summed per user, keyed by user_id.
+    """
+    totals = {}
+    for (user_id, _), counters in day_counters.items():
+        total = totals.get(user_id, normalize(None))
+        totals[user_id] = tuple(a + b for a, b in zip(total, counters))
+    return totals
+
+def reconcile(fix=False):
+    """
+    Takes whether to repair the counters that don't match.
+    Recounts every (user, day) from assignments & compares it with user_counters,
+        and every user's totals with user_totals. With fix, the counters are locked
+        first (so submissions & status changes wait instead of racing the repair),
+        then every mismatched row is overwritten with the recounted values, in the
+        same transaction.
+    Returns a list of (user_id, day, stored counters, expected counters) for every
+        mismatched row; day is None for a user's totals.
+    """
+    start = perf_counter()
+    lock = ' FOR UPDATE' if fix else ''
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT user_id, `day`, {', '.join(COUNTERS)} FROM user_counters{lock}")
+        stored = {(row[0], row[1]): normalize(row[2:]) for row in cur.fetchall()}
+        cur.execute(f"SELECT user_id, {', '.join(COUNTERS)} FROM user_totals{lock}")
+        stored_totals = {row[0]: normalize(row[1:]) for row in cur.fetchall()}
+        cur.execute(EXPECTED_QUERY)
+        expected = {(row[0], row[1]): normalize(row[2:]) for row in cur.fetchall()}
+
+        mismatches = [(*key, counters, recounted) for key, counters, recounted in diff(stored, expected)]
+        expected_totals = totals_of(expected)
+        total_mismatches = [(user_id, None, counters, recounted)
+                            for user_id, counters, recounted in diff(stored_totals, expected_totals)]
+
+        if fix and mismatches:
+            repaired = [(user_id, day, *counters) for user_id, day, _, counters in mismatches if counters]
+            removed = [(user_id, day) for user_id, day, _, counters in mismatches if not counters]
+            if repaired:
+                cur.executemany(f'''INSERT INTO user_counters (user_id, `day`, {', '.join(COUNTERS)})
+                                    VALUES (%s, %s, %s, %s, %s, %s)
+                                ON DUPLICATE KEY UPDATE {', '.join(f"{name} = VALUES({name})" for name in COUNTERS)}''',
+                                repaired)
+            if removed:
+                cur.executemany("DELETE FROM user_counters WHERE user_id = %s AND `day` = %s", removed)
+        if fix and total_mismatches:
+            repaired = [(user_id, *counters) for user_id, _, _, counters in total_mismatches if counters]
+            removed = [(user_id,) for user_id, _, _, counters in total_mismatches if not counters]
+            if repaired:
+                cur.executemany(f'''INSERT INTO user_totals (user_id, {', '.join(COUNTERS)})
+                                    VALUES (%s, %s, %s, %s, %s)
+                                ON DUPLICATE KEY UPDATE {', '.join(f"{name} = VALUES({name})" for name in COUNTERS)}''',
+                                repaired)
+            if removed:
+                cur.executemany("DELETE FROM user_totals WHERE user_id = %s", removed)
+        conn.commit()
+
+    mismatches += total_mismatches
+    for user_id, day, counters, recounted in mismatches[:20]:
+        print(f"- counters for {user_id} {'in total' if day is None else f'on {day}'}: "
+              f"stored {counters}, recounted {recounted}")
+    print(f"- reconciled {len(expected)} user-days & {len(expected_totals)} user totals: {len(mismatches)} mismatched"
+          f"{' & repaired' if fix else ''} in {perf_counter() - start:.2f}s", datetime.now())
+    return mismatches
+
+
+if __name__ == '__main__':
+    reconcile(fix='--fix' in sys.argv)
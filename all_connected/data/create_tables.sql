@@ -38,6 +38,7 @@ CREATE TABLE IF NOT EXISTS assignments (
     recommend_time DATETIME,
     img varchar(100),
     submission_time DATETIME,
+    checked BOOLEAN DEFAULT 0,
     `status` ENUM('not assigned','accepted','rejected','pending') DEFAULT 'not assigned',
     PRIMARY KEY (id),
     FOREIGN KEY (task_id) REFERENCES tasks(id)
@@ -49,4 +50,7 @@ CREATE TABLE IF NOT EXISTS assignments (
 )
 ENGINE = InnoDB;
 
-    
+-- REQUIRED NEXT STEP: this file is only the base schema. Indexes & later schema changes
+-- (tasks.expires_at, the outbox, assignments.img_hash/duplicate_of, user_counters/totals) live in
+-- data/migrations/ and the application's queries depend on them. Apply them with:
+--     python migrations.py
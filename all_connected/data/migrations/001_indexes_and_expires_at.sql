@@ -0,0 +1,12 @@
+-- Indexes for the hot messenger.py / matching_assignments.py queries, plus a stored
+-- expires_at column so "is this task over?" no longer needs start_time + INTERVAL
+-- time_window MINUTE evaluated on every row.
+
+ALTER TABLE tasks
+    ADD COLUMN expires_at DATETIME AS (start_time + INTERVAL time_window MINUTE) STORED,
+    ADD INDEX idx_tasks_expired_expires_at (expired, expires_at);
+
+ALTER TABLE assignments
+    ADD INDEX idx_assignments_user_status (user_id, `status`),
+    ADD INDEX idx_assignments_status_task (`status`, task_id),
+    ADD INDEX idx_assignments_checked_submission (checked, submission_time);
@@ -0,0 +1,25 @@
+-- Durable outbox for outgoing Slack messages (tasks, welcome, daily summary, broadcast).
+-- outbox.py drains it; an assignment is 'queued' from the moment its task message is
+-- in the outbox until the message has actually been posted (then it becomes 'pending').
+
+ALTER TABLE assignments
+    MODIFY `status` ENUM('not assigned','queued','accepted','rejected','pending') DEFAULT 'not assigned';
+
+CREATE TABLE IF NOT EXISTS outbox (
+    id BIGINT AUTO_INCREMENT,
+    user_id VARCHAR(50) NOT NULL,
+    kind ENUM('tasks','welcome','summary','broadcast') NOT NULL,
+    blocks MEDIUMTEXT,
+    `text` VARCHAR(1000),
+    task_ids VARCHAR(1000),
+    `status` ENUM('queued','sent','failed') DEFAULT 'queued',
+    attempts INT DEFAULT 0,
+    next_attempt_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    last_error VARCHAR(255),
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    sent_at DATETIME,
+    ts VARCHAR(32),
+    PRIMARY KEY (id),
+    INDEX idx_outbox_status_next_attempt (`status`, next_attempt_at)
+)
+ENGINE = InnoDB;
@@ -0,0 +1,6 @@
+-- Perceptual hash (64-bit dHash, see image_hash.py) of every submitted picture, and
+-- the earlier submission it near-duplicates, if any.
+
+ALTER TABLE assignments
+    ADD COLUMN img_hash BIGINT UNSIGNED AFTER img,
+    ADD COLUMN duplicate_of INT AFTER img_hash;
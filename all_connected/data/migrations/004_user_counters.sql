@@ -0,0 +1,26 @@
+-- Running per-user counters, one row per user & day (the day the assignment was
+-- recommended, as reliability counts them). counters.py keeps them in step with every
+-- status change, submission & settlement, in the same transaction, and reconciles
+-- them against assignments daily. The backfill below starts them from the raw tables.
+
+CREATE TABLE IF NOT EXISTS user_counters (
+    user_id VARCHAR(50) NOT NULL,
+    `day` DATE NOT NULL,
+    accepted INT NOT NULL DEFAULT 0,
+    submitted INT NOT NULL DEFAULT 0,
+    checked INT NOT NULL DEFAULT 0,
+    earned DECIMAL(10,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, `day`)
+)
+ENGINE = InnoDB;
+
+INSERT INTO user_counters (user_id, `day`, accepted, submitted, checked, earned)
+    SELECT assignments.user_id, DATE(assignments.recommend_time),
+           SUM(assignments.`status` = 'accepted'), COUNT(assignments.img),
+           SUM(assignments.checked = 1 AND assignments.submission_time IS NOT NULL),
+           COALESCE(SUM(IF(assignments.checked = 1 AND assignments.submission_time IS NOT NULL, tasks.compensation, 0)), 0)
+    FROM assignments LEFT JOIN tasks ON assignments.task_id = tasks.id
+    WHERE assignments.user_id IS NOT NULL AND assignments.recommend_time IS NOT NULL
+    GROUP BY assignments.user_id, DATE(assignments.recommend_time)
+ON DUPLICATE KEY UPDATE accepted = VALUES(accepted), submitted = VALUES(submitted),
+                        checked = VALUES(checked), earned = VALUES(earned);
@@ -0,0 +1,9 @@
+-- Outbox rows are claimed (leased) before they are posted, so drains running in different
+-- processes never post the same message: a claimed row is 'sending', owned by claimed_by
+-- since claimed_at. A lease older than outbox.OUTBOX_LEASE is assumed dead & re-queued.
+
+ALTER TABLE outbox
+    MODIFY `status` ENUM('queued','sending','sent','failed') DEFAULT 'queued',
+    ADD COLUMN claimed_by VARCHAR(64) AFTER `status`,
+    ADD COLUMN claimed_at DATETIME AFTER claimed_by,
+    ADD INDEX idx_outbox_claimed_by (claimed_by);
@@ -0,0 +1,6 @@
+-- Index for messenger.get_image_hashes(), which loads every hashed submission into the
+-- duplicate-picture index: reading (img_hash, id) from this index touches only the
+-- hashed rows instead of scanning all of assignments.
+
+ALTER TABLE assignments
+    ADD INDEX idx_assignments_img_hash (img_hash, id);
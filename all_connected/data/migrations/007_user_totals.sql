@@ -0,0 +1,25 @@
+-- Per-user running totals (over all days) kept next to the per-day user_counters rows,
+-- so account views read one primary-key row instead of summing a row per day.
+-- counters.py updates both in the same transaction. The backfill below starts the
+-- totals from user_counters. The index covers the list of a user's completed
+-- (checked) tasks shown in their account summary.
+
+CREATE TABLE IF NOT EXISTS user_totals (
+    user_id VARCHAR(50) NOT NULL,
+    accepted INT NOT NULL DEFAULT 0,
+    submitted INT NOT NULL DEFAULT 0,
+    checked INT NOT NULL DEFAULT 0,
+    earned DECIMAL(10,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id)
+)
+ENGINE = InnoDB;
+
+INSERT INTO user_totals (user_id, accepted, submitted, checked, earned)
+    SELECT user_id, SUM(accepted), SUM(submitted), SUM(checked), SUM(earned)
+    FROM user_counters
+    GROUP BY user_id
+ON DUPLICATE KEY UPDATE accepted = VALUES(accepted), submitted = VALUES(submitted),
+                        checked = VALUES(checked), earned = VALUES(earned);
+
+ALTER TABLE assignments
+    ADD INDEX idx_assignments_user_checked (user_id, checked, submission_time, task_id);
@@ -6,62 +6,495 @@ Description: General helper functions & environment set up for the overall Snap
 import os
 from pathlib import Path
 from dotenv import load_dotenv
-env_path = Path('..') / '.env'
+env_path = Path(__file__).resolve().parent.parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
 import pymysql
-from flask import Flask
-
 
+import re
+import json
+import heapq
+from array import array
+import hashlib
+import threading
+import functools
+from collections import deque
+from time import monotonic, perf_counter
 from datetime import datetime, time
 
+import numpy as np
+
+
+### ### DATABASE CONNECTION POOL ### ###
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))              # max open connections per database
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))      # seconds to wait for a free connection
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', 60)) # idle seconds before a connection is health-checked
+
+
+class PooledConnection:
+    """
+    A pymysql connection borrowed from a ConnectionPool.
+    Behaves like the underlying connection, except .close() hands it back to 
+        the pool instead of closing the socket. Can be used in a `with` block,
+        which rolls back on error and always returns the connection.
+    """
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            self._pool.release(self._conn)
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None and self._conn is not None:
+            try:
+                self._conn.rollback()
+            except pymysql.MySQLError:
+                pass
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of at most `size` connections to one database.
+    Idle connections are reused (most recently used first), health-checked with
+        a ping when they have been idle for a while, and reopened if stale.
+    """
+    def __init__(self, dbName, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT):
+        self.dbName = dbName
+        self.size = size
+        self.timeout = timeout
+        self._idle = []          # stack of (connection, last used time)
+        self._num_open = 0
+        self._cond = threading.Condition()
+        self.counters = {'borrowed': 0, 'in_use': 0, 'max_in_use': 0, 'opened': 0,
+                         'reconnects': 0, 'discarded': 0, 'waits': 0, 
+                         'wait_time': 0.0, 'max_wait': 0.0}
+
+    def _open_connection(self):
+        conn = pymysql.connect(
+            host='localhost',
+            user='root', 
+            password=os.environ['SQL_PASS'], 
+            db=self.dbName
+        )
+        with self._cond:
+            self.counters['opened'] += 1
+        return conn
+
+    def acquire(self):
+        """
+        Borrows a connection, waiting up to self.timeout seconds for one to be freed.
+        Returns a PooledConnection.
+        """
+        start = monotonic()
+        with self._cond:
+            while not self._idle and self._num_open >= self.size:
+                remaining = self.timeout - (monotonic() - start)
+                if remaining <= 0:
+                    raise TimeoutError(f"No free connection to {self.dbName} after {self.timeout}s "
+                                       f"({self.size} in use)")
+                self._cond.wait(remaining)
+            if self._idle:
+                conn, last_used = self._idle.pop()
+            else:
+                conn, last_used = None, None
+                self._num_open += 1
+
+            waited = monotonic() - start
+            self.counters['borrowed'] += 1
+            self.counters['in_use'] += 1
+            self.counters['max_in_use'] = max(self.counters['max_in_use'], self.counters['in_use'])
+            if waited > 0.001:
+                self.counters['waits'] += 1
+            self.counters['wait_time'] += waited
+            self.counters['max_wait'] = max(self.counters['max_wait'], waited)
+
+        # Open or health-check outside the lock so slow handshakes don't block other threads
+        try:
+            if conn is None:
+                conn = self._open_connection()
+            elif monotonic() - last_used > DB_POOL_PING_AFTER:
+                try:
+                    conn.ping(reconnect=False)
+                except pymysql.MySQLError:
+                    self._close_quietly(conn)
+                    conn = self._open_connection()
+                    with self._cond:
+                        self.counters['reconnects'] += 1
+        except Exception:
+            with self._cond:
+                self._num_open -= 1
+                self.counters['in_use'] -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        """
+        Returns a connection to the pool. Any open transaction is rolled back so
+            the next borrower never sees a stale snapshot or half-done writes.
+        Broken connections are discarded.
+        """
+        try:
+            conn.rollback()
+            healthy = conn.open
+        except pymysql.MySQLError:
+            healthy = False
+        with self._cond:
+            self.counters['in_use'] -= 1
+            if healthy:
+                self._idle.append((conn, monotonic()))
+            else:
+                self._num_open -= 1
+                self.counters['discarded'] += 1
+            self._cond.notify()
+        if not healthy:
+            self._close_quietly(conn)
+
+    def close_all(self):
+        """Closes every idle connection. Borrowed connections are closed when returned."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._num_open -= len(idle)
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self.counters)
+            stats['open'] = self._num_open
+            stats['idle'] = len(self._idle)
+            stats['size'] = self.size
+        return stats
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(dbName):
+    """Returns the (lazily created) connection pool for the given database name."""
+    with _pools_lock:
+        if dbName not in _pools:
+            _pools[dbName] = ConnectionPool(dbName)
+        return _pools[dbName]
+
+def pool_stats():
+    """Returns {database name: usage & wait-time counters} for every pool."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {pool.dbName: pool.stats() for pool in pools}
 
 
 def connectDB(dbName):
     """
      * General Helper Function * 
     Takes a database name (str).
-    Returns a connection object to that database. This connection should eventually
-        be closed with .close()
+    Borrows a connection to that database from the shared pool. Use it in a 
+        `with` block, or call .close() to hand it back to the pool.
     """
-    # Connect to the database
-    db = pymysql.connect(
-        host='localhost',
-        user='root', 
-        password=os.environ['SQL_PASS'], 
-        db=dbName
-    )
+    return get_pool(dbName).acquire()
 
-    return db
 
+### ### LATENCY TRACKING ### ###
+LATENCY_WINDOW = 1000       # most recent calls the percentiles are computed over
+LATENCY_REPORT_EVERY = 100  # print a handler's p50/p99 every this many calls
 
-# code to open text file and read into a matrix
-def read_file(fname):
+
+class LatencyTracker:
+    """
+    Keeps the last `window` durations of one code path (eg. a Slack handler).
+    percentiles() gives the count, p50, p99 & max over that window (in ms).
+    """
+    def __init__(self, name, window=LATENCY_WINDOW):
+        self.name = name
+        self.calls = 0
+        self._durations = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._durations.append(seconds)
+            self.calls += 1
+            return self.calls
+
+    def percentiles(self):
+        with self._lock:
+            durations = np.array(self._durations) * 1000
+        if not len(durations):
+            return {'calls': self.calls, 'p50_ms': None, 'p99_ms': None, 'max_ms': None}
+        p50, p99 = np.percentile(durations, [50, 99])
+        return {'calls': self.calls, 'p50_ms': round(float(p50), 1), 'p99_ms': round(float(p99), 1),
+                'max_ms': round(float(durations.max()), 1)}
+
+
+_latency_trackers = {}
+_latency_lock = threading.Lock()
+
+def track_latency(name, report_every=LATENCY_REPORT_EVERY):
+    """
+    * General Helper Function * 
+    Takes a name for the code path.
+    Returns a decorator that times every call of the function it wraps, and
+        prints that path's p50/p99 every report_every calls.
+    """
+    with _latency_lock:
+        tracker = _latency_trackers.setdefault(name, LatencyTracker(name))
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                calls = tracker.record(perf_counter() - start)
+                if report_every and calls % report_every == 0:
+                    print(f"- latency {name}: {tracker.percentiles()}", datetime.now())
+        return wrapper
+    return decorator
+
+def latency_stats():
+    """Returns {name: count, p50, p99 & max in ms} for every tracked code path."""
+    with _latency_lock:
+        trackers = list(_latency_trackers.values())
+    return {tracker.name: tracker.percentiles() for tracker in trackers}
+
+
+### ### MESSAGE BLOCKS ### ###
+BLOCK_MESSAGES_DIR = Path(__file__).resolve().parent / 'block_messages'
+
+@functools.lru_cache(maxsize=None)
+def load_block(name):
+    """
+    * General Helper Function * 
+    Takes the name of a block_messages/ JSON file (without .json).
+    Reads & parses it on first use, relative to this file rather than the working
+        directory. Later calls return the same object, so don't mutate it.
+    Returns its contents.
+    """
+    with open(BLOCK_MESSAGES_DIR / f"{name}.json", 'r') as infile:
+        return json.load(infile)
+
+
+### ### BUILDING GRAPHS ### ###
+class BuildingGraph:
+    """
+    A building graph in compressed sparse row (CSR) form, as parsed by read_graph().
+    The edges of vertex i are indices[indptr[i]:indptr[i+1]] with lengths 
+        weights[indptr[i]:indptr[i+1]] (every edge is stored in both directions).
+    names[i] is the vertex number from the file ('1', '2', ...), descriptions[i]
+        its location description, and index maps a name back to i.
+    """
+    def __init__(self, names, descriptions, indptr, indices, weights):
+        self.names = names
+        self.descriptions = descriptions
+        self.index = {name: i for i, name in enumerate(names)}
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+
+    def __len__(self):
+        return len(self.names)
+
+    def neighbours(self, vertex):
+        """Takes a vertex index. Returns (neighbour indices, edge lengths) arrays."""
+        start, end = self.indptr[vertex], self.indptr[vertex + 1]
+        return self.indices[start:end], self.weights[start:end]
+
+    def dense(self):
+        """
+        Dense view for small graphs: an N x N float array with the edge lengths and -1
+            where there is no edge (same layout as read_file()'s matrix).
+        """
+        matrix = np.full((len(self), len(self)), -1.0)
+        rows = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+        matrix[rows, self.indices] = self.weights
+        return matrix
+
+
+def read_graph(fname):
+    """
+    Takes the name of a building graph file: the number of vertices, one 
+        'vertex number,description' line per vertex, then one 'v1,v2,distance' 
+        line per (undirected) edge.
+    Streams the edge lines straight into flat arrays, so memory grows with the 
+        number of edges instead of vertices squared.
+    Returns a BuildingGraph.
+    """
+    sources, targets, lengths = array('q'), array('q'), array('d')
     with open(fname, "r") as file:
-        # Read the first line that contains the number of vertices
         numVertices = int(file.readline().strip())
 
-        # Create a dictionary to store each vertex and its corresponding location description
-        vertices = {}
+        names, descriptions = [], []
         for _ in range(numVertices):
             line = file.readline().strip().split(",")
-            vertices[line[0]] = line[1]
-
-        # Create an empty matrix
-        matrix = [[-1 for _ in range(numVertices)] for _ in range(numVertices)]
+            names.append(line[0])
+            descriptions.append(line[1])
 
-        # Next, read the edges and build the graph
         for line in file:
-            # edge is a list of 3 values representing a pair of adjacent vertices and their distance
             edge = line.strip().split(",")
-            v1, v2, distance = int(edge[0]), int(edge[1]), float(edge[2])
+            if len(edge) < 3:
+                continue
+            sources.append(int(edge[0]) - 1)
+            targets.append(int(edge[1]) - 1)
+            lengths.append(float(edge[2]))
+
+    # Store each edge in both directions, grouped by source vertex
+    sources = np.frombuffer(sources, dtype=np.int64) if sources else np.zeros(0, dtype=np.int64)
+    targets = np.frombuffer(targets, dtype=np.int64) if targets else np.zeros(0, dtype=np.int64)
+    lengths = np.frombuffer(lengths, dtype=np.float64) if lengths else np.zeros(0)
+
+    # An edge listed twice keeps its last length (like the dense matrix would)
+    pair_keys = np.minimum(sources, targets) * numVertices + np.maximum(sources, targets)
+    _, last_from_end = np.unique(pair_keys[::-1], return_index=True)
+    keep = np.sort(len(pair_keys) - 1 - last_from_end)
+    sources, targets, lengths = sources[keep], targets[keep], lengths[keep]
+
+    both_sources = np.concatenate([sources, targets])
+    order = np.argsort(both_sources, kind='stable')
+    indices = np.concatenate([targets, sources])[order]
+    weights = np.concatenate([lengths, lengths])[order]
+    indptr = np.zeros(numVertices + 1, dtype=np.int64)
+    np.cumsum(np.bincount(both_sources, minlength=numVertices), out=indptr[1:])
+    return BuildingGraph(names, descriptions, indptr, indices, weights)
+
+
+# code to open text file and read into a matrix
+def read_file(fname):
+    """
+    Takes the name of a building graph file (see read_graph()).
+    Returns (N x N list-of-lists matrix of edge lengths, -1 = no edge, 
+        dict of vertex number: location description). Only use this for small 
+        graphs; read_graph() keeps large ones sparse.
+    """
+    graph = read_graph(fname)
+    matrix = graph.dense().tolist()
+    vertices = dict(zip(graph.names, graph.descriptions))
+    return matrix, vertices
+
+
+### ### BUILDING DISTANCES ### ###
+DISTANCE_CACHE_DIR = Path(__file__).resolve().parent / 'data' / 'distance_cache'  # where all-pairs distance arrays are saved
+FLOYD_WARSHALL_MAX_VERTICES = 1500  # bigger graphs use one Dijkstra search per vertex
+ROOM_CODE = re.compile(r'[A-Za-z]+\d+')
+
+def floyd_warshall(matrix):
+    """
+    * Helper function for all_pairs_distances() *
+    Takes a square adjacency matrix (-1 = no edge), eg. BuildingGraph.dense().
+    Runs Floyd-Warshall, one vectorized relaxation per intermediate vertex.
+    Returns a float32 array of shortest distances (inf = unreachable).
+    """
+    dist = np.array(matrix, dtype=np.float64)
+    dist[dist < 0] = np.inf
+    np.fill_diagonal(dist, 0)
+    for k in range(len(dist)):
+        np.minimum(dist, dist[:, k, None] + dist[None, k, :], out=dist)
+    return dist.astype(np.float32)
+
+def dijkstra_all_pairs(graph):
+    """
+    * Helper function for all_pairs_distances() *
+    Takes a BuildingGraph.
+    Runs a heap-based Dijkstra search from every vertex over the CSR edges
+        (fast for large, sparse graphs).
+    Returns a float32 array of shortest distances (inf = unreachable).
+    """
+    num_vertices = len(graph)
+    neighbours = [list(zip(*(values.tolist() for values in graph.neighbours(i)))) for i in range(num_vertices)]
+    dist = np.full((num_vertices, num_vertices), np.inf, dtype=np.float32)
+    for source in range(num_vertices):
+        best = {source: 0.0}
+        heap = [(0.0, source)]
+        while heap:
+            d, vertex = heapq.heappop(heap)
+            if d > best[vertex]:
+                continue
+            for neighbour, weight in neighbours[vertex]:
+                new_d = d + weight
+                if new_d < best.get(neighbour, np.inf):
+                    best[neighbour] = new_d
+                    heapq.heappush(heap, (new_d, neighbour))
+        dist[source, list(best)] = list(best.values())
+    return dist
+
+def all_pairs_distances(graph):
+    """
+    Takes a BuildingGraph (see read_graph()).
+    Returns a float32 array of shortest walking distances between every pair of vertices.
+    """
+    if len(graph) <= FLOYD_WARSHALL_MAX_VERTICES:
+        return floyd_warshall(graph.dense())
+    return dijkstra_all_pairs(graph)
+
+
+class BuildingDistances:
+    """
+    Room-to-room walking distances for one building graph file (see read_graph()).
+    All-pairs shortest paths are computed once per version of the file & saved as 
+        DISTANCE_CACHE_DIR/<sha256 of the file>.npy; later loads memory-map that file.
+    Vertices can be looked up by vertex number ('12'), description, or the room 
+        code the description starts with ('W102', as in task_locations.json).
+    """
+    def __init__(self, fname, cache_dir=DISTANCE_CACHE_DIR):
+        with open(fname, 'rb') as infile:
+            digest = hashlib.sha256(infile.read()).hexdigest()
+        cache_path = Path(cache_dir) / f'{digest}.npy'
+
+        graph = read_graph(fname)
+        if not cache_path.exists():
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix('.tmp.npy')
+            np.save(tmp_path, all_pairs_distances(graph))
+            os.replace(tmp_path, cache_path)
+        self.distances = np.load(cache_path, mmap_mode='r')
+
+        self.index = {}
+        for position, (vertex, description) in enumerate(zip(graph.names, graph.descriptions)):
+            self.index[vertex] = position
+            self.index[description.strip()] = position
+            code = ROOM_CODE.match(description.strip())
+            if code:
+                self.index.setdefault(code.group(0), position)
+
+    def __contains__(self, room):
+        return room in self.index
+
+    def distance(self, room_a, room_b, default=None):
+        """
+        Takes two room codes / vertex names.
+        Returns the shortest walking distance between them (inf if unreachable),
+            or `default` if either room isn't in the graph.
+        """
+        if room_a not in self.index or room_b not in self.index:
+            return default
+        return float(self.distances[self.index[room_a], self.index[room_b]])
+
 
-            # Update the matrix with the distance between v1 and v2
-            matrix[v1-1][v2-1] = distance
-            matrix[v2-1][v1-1] = distance
+_building_distances = {}
 
-        # Return the matrix and the dictionary of vertices
-        return matrix, vertices
+def get_building_distances(fname):
+    """Returns the (lazily built, then cached) BuildingDistances for a graph file."""
+    if fname not in _building_distances:
+        _building_distances[fname] = BuildingDistances(fname)
+    return _building_distances[fname]
 
 
 
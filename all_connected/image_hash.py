@@ -0,0 +1,148 @@
+"""
+Description: Perceptual hashing of submitted pictures & an in-memory index for
+    finding near-duplicate submissions (eg. an old picture re-sent for a new task).
+    Every picture gets a 64-bit difference hash (dHash), stored in
+    assignments.img_hash. HashIndex keeps all hashes in a packed uint64 array and
+    finds the ones within a small Hamming distance with vectorized XOR + popcount;
+    for small distances it first narrows the candidates with 16-bit bands (LSH),
+    since two hashes within distance < NUM_BANDS must agree exactly on at least
+    one band.
+"""
+import threading
+
+import numpy as np
+
+
+### ### CONSTANTS ### ###
+HASH_SIZE = 8                   # dHash grid: HASH_SIZE x HASH_SIZE bits = 64-bit hash
+DUPLICATE_DISTANCE = 3          # max differing bits for two pictures to count as duplicates
+NUM_BANDS = 4                   # 16-bit bands used to narrow candidates
+BAND_BITS = 64 // NUM_BANDS
+TAIL_MERGE_SIZE = 4096          # recently added hashes scanned in full until they are merged into the bands
+
+
+### ### HASHING ### ###
+def dhash(path, hash_size=HASH_SIZE):
+    """
+    Takes the path of an image.
+    Shrinks it to a (hash_size+1) x hash_size grayscale grid & compares every pixel
+        with its right neighbour, so resizing, recompression & small edits barely
+        change the result.
+    Returns the hash as an int (fits an unsigned 64-bit column for hash_size 8).
+    """
+    from PIL import Image
+
+    with Image.open(path) as image:
+        image.draft('L', (hash_size * 8, hash_size * 8))     # lets JPEG decode at reduced size
+        pixels = np.asarray(image.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS), dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), 'big')
+
+if hasattr(np, 'bitwise_count'):
+    def popcount(values):
+        """Takes a uint64 array. Returns the number of set bits of every element."""
+        return np.bitwise_count(values)
+else:
+    _BYTE_COUNTS = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+    def popcount(values):
+        """Takes a uint64 array. Returns the number of set bits of every element."""
+        return _BYTE_COUNTS[values.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.uint8)
+
+
+### ### INDEX ### ###
+class HashIndex:
+    """
+    Near-duplicate lookup over every stored picture hash.
+    Hashes & their keys (assignment ids) live in parallel numpy arrays; new ones go
+        to a small tail that is merged into the banded arrays every TAIL_MERGE_SIZE
+        additions. Thread-safe.
+    """
+    def __init__(self):
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._keys = np.empty(0, dtype=np.int64)
+        self._bands = []                # per band: (sorted band values, positions in _hashes)
+        self._tail_hashes = []
+        self._tail_keys = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._hashes) + len(self._tail_hashes)
+
+    def extend(self, hashes, keys):
+        """Takes equal-length sequences of hashes & keys. Adds them all & rebuilds the bands."""
+        with self._lock:
+            self._merge(np.asarray(hashes, dtype=np.uint64), np.asarray(keys, dtype=np.int64))
+
+    def add(self, img_hash, key):
+        """Takes one hash & its key. Adds it (to the tail until the next merge)."""
+        with self._lock:
+            self._tail_hashes.append(img_hash)
+            self._tail_keys.append(key)
+            if len(self._tail_hashes) >= TAIL_MERGE_SIZE:
+                self._merge(np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64))
+
+    def _merge(self, hashes, keys):
+        self._hashes = np.concatenate([self._hashes, np.array(self._tail_hashes, dtype=np.uint64), hashes])
+        self._keys = np.concatenate([self._keys, np.array(self._tail_keys, dtype=np.int64), keys])
+        self._tail_hashes, self._tail_keys = [], []
+        self._bands = []
+        for band in range(NUM_BANDS):
+            values = ((self._hashes >> np.uint64(band * BAND_BITS)) & np.uint64(2**BAND_BITS - 1)).astype(np.uint16)
+            order = np.argsort(values, kind='stable')
+            self._bands.append((values[order], order))
+
+    def _candidates(self, img_hash):
+        # Positions whose hash equals img_hash on at least one band
+        found = []
+        for band, (values, order) in enumerate(self._bands):
+            # same dtype as the band values, or searchsorted converts the whole array per call
+            value = np.uint16((img_hash >> (band * BAND_BITS)) & (2**BAND_BITS - 1))
+            lo, hi = np.searchsorted(values, value, 'left'), np.searchsorted(values, value, 'right')
+            found.append(order[lo:hi])
+        return np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+
+    def query(self, img_hash, max_distance=DUPLICATE_DISTANCE, banded=None):
+        """
+        Takes a hash & the max Hamming distance (& whether to narrow with the bands;
+            default: whenever max_distance < NUM_BANDS, where it finds the same set).
+        Returns a list of (key, distance) for every stored hash within max_distance,
+            closest first.
+        """
+        if banded is None:
+            banded = max_distance < NUM_BANDS
+        target = np.uint64(img_hash)
+        with self._lock:
+            if banded:
+                positions = self._candidates(img_hash)
+                hashes, keys = self._hashes[positions], self._keys[positions]
+            else:
+                hashes, keys = self._hashes, self._keys
+            if self._tail_hashes:
+                hashes = np.concatenate([hashes, np.array(self._tail_hashes, dtype=np.uint64)])
+                keys = np.concatenate([keys, np.array(self._tail_keys, dtype=np.int64)])
+        distances = popcount(hashes ^ target)
+        close = np.flatnonzero(distances <= max_distance)
+        close = close[np.argsort(distances[close], kind='stable')]
+        return list(zip(keys[close].tolist(), distances[close].tolist()))
+
+
+_shared_index = None
+_shared_lock = threading.Lock()
+
+def shared_index(load_hashes):
+    """
+    Takes a function returning every stored (key, hash) pair (eg.
+        messenger.get_image_hashes).
+    Returns the process-wide HashIndex, loading it with load_hashes() on first use.
+    """
+    global _shared_index
+    with _shared_lock:
+        if _shared_index is None:
+            index = HashIndex()
+            rows = load_hashes()
+            if rows:
+                keys, hashes = zip(*rows)
+                index.extend(hashes, keys)
+            _shared_index = index
+        return _shared_index
@@ -0,0 +1,164 @@
+"""
+Description: Background ingestion of the pictures users submit for their tasks.
+    The Slack message handler only validates a submission & enqueues it; a bounded
+    pool of worker threads downloads each picture from Slack in chunks, straight to
+    disk (never more than MAX_IMAGE_BYTES), through per-worker pooled HTTP sessions,
+    and then records the submission. Queue depth & download throughput are available
+    from stats().
+"""
+import os
+from pathlib import Path
+from dotenv import load_dotenv
+env_path = Path(__file__).resolve().parent.parent / '.env'
+load_dotenv(dotenv_path=env_path)
+
+import queue
+import threading
+from time import monotonic
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+### ### CONSTANTS ### ###
+IMAGE_DIR = Path(__file__).resolve().parent.parent.parent / 'snapngo_pics'
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', 4))          # concurrent downloads
+INGEST_QUEUE_SIZE = int(os.environ.get('INGEST_QUEUE_SIZE', 200))  # submissions waiting before submit() refuses more
+MAX_IMAGE_BYTES = 25 * 2**20        # larger pictures are rejected (Slack's own cap is far higher)
+CHUNK_SIZE = 64 * 2**10             # bytes read & written per step
+DOWNLOAD_TIMEOUT = (5, 30)          # (connect, read) seconds
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+### ### DOWNLOADING ### ###
+def image_path(user_id, task_id, image_dir=IMAGE_DIR):
+    """
+    Takes a user id & task id.
+    Returns a unique path for that submission's picture (timestamped to the
+        microsecond, so a resubmission never overwrites an earlier picture).
+    """
+    stamp = datetime.now().strftime('%Y-%m-%d_%H%M%S_%f')
+    return Path(image_dir) / f"{user_id}_{task_id}_{stamp}.jpeg"
+
+def download(session, url, token, path, max_bytes=MAX_IMAGE_BYTES, chunk_size=CHUNK_SIZE):
+    """
+    Takes a requests session, a Slack private download url, the bot token & a
+        destination path.
+    Streams the file to path (via a .part file that is renamed once complete, or
+        removed on failure). Raises ImageTooLarge past max_bytes.
+    Returns the number of bytes written.
+    """
+    part = Path(f"{path}.part")
+    written = 0
+    try:
+        with session.get(url, headers={'Authorization': f"Bearer {token}"}, stream=True, timeout=DOWNLOAD_TIMEOUT) as r:
+            r.raise_for_status()
+            if int(r.headers.get('Content-Length') or 0) > max_bytes:
+                raise ImageTooLarge(f"{r.headers['Content-Length']} bytes > {max_bytes}")
+            with open(part, 'wb') as outfile:
+                for chunk in r.iter_content(chunk_size):
+                    written += len(chunk)
+                    if written > max_bytes:
+                        raise ImageTooLarge(f"more than {max_bytes} bytes")
+                    outfile.write(chunk)
+        os.replace(part, path)
+    except BaseException:
+        part.unlink(missing_ok=True)
+        raise
+    return written
+
+
+### ### WORKER POOL ### ###
+class IngestPool:
+    """
+    Bounded queue of submissions drained by `workers` threads (started on the first
+        submit). Each job is (url, user_id, task_id, on_done, on_error): the picture
+        is downloaded, then on_done(path) is called in the worker; on_error(exception)
+        is called instead if the download fails.
+    """
+    def __init__(self, token, workers=INGEST_WORKERS, queue_size=INGEST_QUEUE_SIZE, image_dir=IMAGE_DIR):
+        self.token = token
+        self.workers = workers
+        self.image_dir = Path(image_dir)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self.counters = {'submitted': 0, 'refused': 0, 'in_flight': 0, 'completed': 0,
+                         'failed': 0, 'bytes': 0, 'download_time': 0.0}
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self.image_dir.mkdir(parents=True, exist_ok=True)
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"image-ingest-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, url, user_id, task_id, on_done, on_error=None):
+        """
+        Takes a Slack download url, the submitting user & task, and callbacks.
+        Enqueues the download without waiting for it.
+        Returns True if queued, False if the queue is full (try again later).
+        """
+        self._start()
+        try:
+            self._queue.put_nowait((url, user_id, task_id, on_done, on_error))
+        except queue.Full:
+            with self._lock:
+                self.counters['refused'] += 1
+            return False
+        with self._lock:
+            self.counters['submitted'] += 1
+        return True
+
+    def _work(self):
+        # One session (keep-alive connection pool) per worker thread
+        session = requests.Session()
+        session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        while True:
+            url, user_id, task_id, on_done, on_error = self._queue.get()
+            with self._lock:
+                self.counters['in_flight'] += 1
+            start = monotonic()
+            try:
+                path = image_path(user_id, task_id, self.image_dir)
+                size = download(session, url, self.token, path)
+            except Exception as e:
+                with self._lock:
+                    self.counters['failed'] += 1
+                print(f"- download of task {task_id} picture from {user_id} failed: {e!r}", datetime.now())
+                if on_error:
+                    try:
+                        on_error(e)
+                    except Exception as callback_error:
+                        print(f"- on_error callback failed: {callback_error!r}", datetime.now())
+            else:
+                seconds = monotonic() - start
+                with self._lock:
+                    self.counters['completed'] += 1
+                    self.counters['bytes'] += size
+                    self.counters['download_time'] += seconds
+                print(f"- saved task {task_id} picture from {user_id}: {size / 2**10:.0f}KB in {seconds:.2f}s, "
+                      f"{self._queue.qsize()} queued", datetime.now())
+                try:
+                    on_done(str(path))
+                except Exception as e:
+                    print(f"- recording task {task_id} submission from {user_id} failed: {e!r}", datetime.now())
+            finally:
+                with self._lock:
+                    self.counters['in_flight'] -= 1
+                self._queue.task_done()
+
+    def stats(self):
+        """Returns a dict of the queue depth, in-flight & finished downloads, and average download throughput (MB/s)."""
+        with self._lock:
+            stats = dict(self.counters)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['mb_per_second'] = stats['bytes'] / 2**20 / stats['download_time'] if stats['download_time'] else 0.0
+        return stats
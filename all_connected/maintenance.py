@@ -9,6 +9,7 @@ import matching_assignments
 import task
 import messenger
 import bot
+import outbox
 import task_parameters
 
 import time
@@ -17,13 +18,12 @@ import time
 import os
 from pathlib import Path
 from dotenv import load_dotenv
-env_path = Path('..') / '.env'
+env_path = Path(__file__).resolve().parent.parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
 import json
 import requests
 import copy
-import pandas as pd
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 from slack_bolt import App
@@ -39,6 +39,7 @@ DB_NAME = os.environ['DB_NAME']
 
 START_HOURS = task_parameters.START_HOURS
 END_HOURS = task_parameters.END_HOURS
+EXPORT_DIR = Path(__file__).resolve().parent.parent  # where the tables are exported to (next to all_connected/)
 
 def add_new_users():
     user_store = bot.get_all_users_info()
@@ -51,24 +52,27 @@ def delete_invalid_submissions(user_id, task_id, assignment_id):
 
 def broadcast(block = None, text = None):
     active_users = messenger.get_active_users_list()
-    for user_id in active_users:
-        bot.send_messages(user_id, block = None, text = None)
+    outbox.enqueue([(user_id, block, text) for user_id in active_users], 'broadcast')
+    return outbox.drain()
 
 def test_update_reliability(user_id):
-    conn = helper_functions.connectDB(DB_NAME)
-    cur = conn.cursor()
     date = datetime.today().strftime('%Y/%m/%d')
     print(date)
-    query = f'''SELECT task_id
-                FROM assignments
-                WHERE (user_id = '{user_id}') and DATE(recommend_time) >= CURDATE() -1
-            '''
-    cur.execute(query)
-    accepted = cur.fetchall()
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        query = f'''SELECT task_id
+                    FROM assignments
+                    WHERE (user_id = '{user_id}') and DATE(recommend_time) >= CURDATE() -1
+                '''
+        cur.execute(query)
+        accepted = cur.fetchall()
     print(accepted)
 
 def export_table_to_csv(table_name, csv_file):
-    # Connect to MySQL database
+    # pandas is only needed here, so it's imported here (it's slow to import)
+    import pandas as pd
+
+    # Borrow a pooled connection to the MySQL database
     conn = helper_functions.connectDB(DB_NAME)
 
     try:
@@ -87,7 +91,7 @@ def export_table_to_csv(table_name, csv_file):
         print(f"Table '{table_name}' exported to '{csv_file}' successfully.")
 
     finally:
-        # Close database connection
+        # Return the connection to the pool
         conn.close()
 
 
@@ -95,7 +99,7 @@ def export_table_to_csv(table_name, csv_file):
 if __name__ == "__main__":
     # add_new_users()
     # bot.send_messages('U05B24S3LR1', block = None, text = 'Hello world')
-    export_table_to_csv('users', '../users.csv')
-    export_table_to_csv('assignments', '../assignments.csv')
-    export_table_to_csv('tasks', '../tasks.csv')
+    export_table_to_csv('users', EXPORT_DIR / 'users.csv')
+    export_table_to_csv('assignments', EXPORT_DIR / 'assignments.csv')
+    export_table_to_csv('tasks', EXPORT_DIR / 'tasks.csv')
     print("DONE")
\ No newline at end of file
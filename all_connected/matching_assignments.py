@@ -4,7 +4,10 @@ Date: 06/07/2023
 Description: All functions & algorithms for the Matching Component & Assignment generation.
 """
 
+import math
+import heapq
 import random
+import numpy as np
 import pymysql
 import helper_functions
 from datetime import datetime
@@ -12,7 +15,7 @@ from datetime import datetime
 import os
 from pathlib import Path
 from dotenv import load_dotenv
-env_path = Path('..') / '.env'
+env_path = Path(__file__).resolve().parent.parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
 ### ### SPECIFIC HELPER FUNCTIONS ### ###
@@ -43,44 +46,46 @@ def read_table(db, table_name):
 
     return table_dict
 
-def create_task_user_dict(assignment_data):
+def get_outstanding_tasks(db):
     """
-    * Helper functions for matching algorithms * 
-    Takes data from the 'assignments' table (dict).
-    Creates a task-user dict, key: task_id, value: set of all user_ids who've 
-        previously been assigned to it.
-    Returns that dict.
+    * Helper function for match_users_and_tasks()*
+    Takes a database (obj).
+    Finds every user's open work: unexpired, unsubmitted assignments that are 
+        not assigned yet, queued for delivery, pending or accepted.
+    Returns a dict, key: user_id, value: list of (location, start_time) of those tasks.
     """
-    # get [task_id, user_id] pairs
-    task_user_list = list(zip(assignment_data['task_id'], assignment_data['user_id']))
-    
-    # map all user_ids (values) to task_id (key) 
-    task_users_dict = {}
-    for task_id, user_id in task_user_list:
-        previously_assigned = task_users_dict.get(task_id, set()) # get any user_ids already stored
-        previously_assigned.add(user_id)
-        task_users_dict[task_id] = previously_assigned
-    return task_users_dict
-
+    cursor = db.cursor()
+    cursor.execute("""SELECT assignments.user_id, tasks.location, tasks.start_time
+                      FROM assignments INNER JOIN tasks ON assignments.task_id = tasks.id
+                      WHERE tasks.expired = 0 AND tasks.expires_at >= NOW() AND assignments.img IS NULL
+                        AND assignments.`status` IN ('not assigned', 'queued', 'pending', 'accepted')""")
+    outstanding = {}
+    for user_id, location, start_time in cursor.fetchall():
+        outstanding.setdefault(user_id, []).append((location, start_time))
+    return outstanding
 
 def insert_assignments(assignment_info, db):
     """
      * Helper function for match_users_and_tasks() *
     Takes a list of assignments and database (obj).
-    Inserts the assignments into the database given. 
+    Inserts all the assignments into the database given with one multi-row insert,
+        in a single transaction (either every assignment is inserted or none are). 
     Returns nothing.
     """
-    # Connect to database & create cursor obj
-    cursor = db.cursor()
+    if not assignment_info:
+        return
 
-    for assignment in assignment_info:
-        # Create & execute query
-        query = f"INSERT INTO assignments(`task_id`, `user_id`, `status`) VALUES \
-            ({assignment['task_id']}, '{assignment['user_id']}', 'not assigned');"
-        cursor.execute(query)
+    rows = [(assignment['task_id'], assignment['user_id']) for assignment in assignment_info]
 
-        # Commit the changes to the database
+    # pymysql folds executemany() on a plain INSERT ... VALUES into multi-row inserts
+    query = "INSERT INTO assignments (`task_id`, `user_id`, `status`) VALUES (%s, %s, 'not assigned')"
+    cursor = db.cursor()
+    try:
+        cursor.executemany(query, rows)
         db.commit()
+    except Exception:
+        db.rollback()
+        raise
 
 def create_ab_groups(user_list):
     middle_index = int(len(user_list)/2)
@@ -88,16 +93,522 @@ def create_ab_groups(user_list):
     b_group = user_list[middle_index:]
     return a_group, b_group
 
+### ### ARRAY-BACKED ELIGIBILITY INDEX ### ###
+def build_exclusion_bitmask(task_ids, user_ids, task_users_dict):
+    """
+    * Helper function for array-backed matching algorithms *
+    Takes a list of task ids, a list of user ids (their positions are the dense user
+        indices) and a task-user dict of previously-assigned users.
+    Sets bit u of row t when user_ids[u] may not be given task_ids[t].
+    Returns a (num_tasks, ceil(num_users/8)) uint8 array of packed bits.
+    """
+    user_position = {user_id: i for i, user_id in enumerate(user_ids)}
+    rows, cols = [], []
+    for row, task_id in enumerate(task_ids):
+        for user_id in task_users_dict.get(task_id, ()):
+            col = user_position.get(user_id)
+            if col is not None:
+                rows.append(row)
+                cols.append(col)
+
+    bitmask = np.zeros((len(task_ids), (len(user_ids) + 7) // 8), dtype=np.uint8)
+    if rows:
+        rows, cols = np.array(rows), np.array(cols)
+        np.bitwise_or.at(bitmask, (rows, cols >> 3), (1 << (cols & 7)).astype(np.uint8))
+    return bitmask
+
+def is_excluded(bitmask, task_rows, user_cols):
+    """
+    * Helper function for array-backed matching algorithms *
+    Takes a packed exclusion bitmask and equal-length arrays of task rows & user columns.
+    Returns a bool array, True where that user is excluded from that task.
+    """
+    return ((bitmask[task_rows, user_cols >> 3] >> (user_cols & 7)) & 1).astype(bool)
+
+def rank_within_user(user_cols):
+    """
+    * Helper function for sample_eligible_users() *
+    Takes an array of user columns (one per drawn task).
+    Returns, for every entry, how many earlier entries drew the same user (0, 1, 2, ...).
+    """
+    order = np.argsort(user_cols, kind='stable')
+    sorted_cols = user_cols[order]
+    group_starts = np.flatnonzero(np.r_[True, sorted_cols[1:] != sorted_cols[:-1]])
+    group_sizes = np.diff(np.r_[group_starts, len(sorted_cols)])
+    ranks = np.empty(len(user_cols), dtype=np.int64)
+    ranks[order] = np.arange(len(sorted_cols)) - np.repeat(group_starts, group_sizes)
+    return ranks
+
+def sample_eligible_users(bitmask, num_users, draw_users, capacity=None, rng=None, max_rounds=20):
+    """
+    * Helper function for array-backed matching algorithms *
+    Takes a packed exclusion bitmask, the number of users, a draw function
+        draw_users(candidate_cols, size) -> user columns, an optional per-user cap on
+        the number of tasks & a numpy random Generator.
+    Draws a user for every task at once & re-draws only the tasks whose pick was excluded 
+        or over capacity. Tasks still unmatched after max_rounds are matched exactly 
+        one by one; a task with no eligible user left stays unmatched.
+    Returns an int array of user columns, one per task (-1 for unmatched).
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    num_tasks = bitmask.shape[0]
+    remaining = np.full(num_users, num_tasks if capacity is None else capacity, dtype=np.int64)
+    chosen = np.full(num_tasks, -1, dtype=np.int64)
+    pending = rng.permutation(num_tasks)
+
+    for _ in range(max_rounds):
+        candidates = np.flatnonzero(remaining > 0)
+        if not len(pending) or not len(candidates):
+            break
+        picks = draw_users(candidates, len(pending))
+        ok = ~is_excluded(bitmask, pending, picks)
+        ok[ok] = rank_within_user(picks[ok]) < remaining[picks[ok]]
+        chosen[pending[ok]] = picks[ok]
+        np.subtract.at(remaining, picks[ok], 1)
+        pending = pending[~ok]
+
+    # Exact fallback for the few tasks rejection sampling couldn't place
+    all_cols = np.arange(num_users)
+    for row in pending:
+        eligible = all_cols[(remaining > 0) & ~is_excluded(bitmask, np.full(num_users, row), all_cols)]
+        if len(eligible):
+            pick = draw_users(eligible, 1)[0]
+            chosen[row] = pick
+            remaining[pick] -= 1
+    return chosen
+
+def build_alias_table(weights):
+    """
+    * Helper function for make_weighted_draw() *
+    Takes an array of non-negative weights (all zero -> uniform).
+    Builds a Walker/Vose alias table so each weighted draw is O(1).
+    Returns (prob, alias) arrays: pick column i, keep it with probability prob[i], 
+        otherwise take alias[i].
+    """
+    weights = np.asarray(weights, dtype=float)
+    num = len(weights)
+    total = weights.sum()
+    scaled = (weights * num / total if total > 0 else np.ones(num)).tolist()
+
+    prob = np.ones(num)
+    alias = np.arange(num)
+    small = [i for i in range(num) if scaled[i] < 1]
+    large = [i for i in range(num) if scaled[i] >= 1]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        prob[less] = scaled[less]
+        alias[less] = more
+        scaled[more] -= 1 - scaled[less]
+        (small if scaled[more] < 1 else large).append(more)
+    return prob, alias
+
+def make_uniform_draw(rng):
+    """
+    * Helper function for array-backed matching algorithms *
+    Returns a draw function for sample_eligible_users() that picks candidates uniformly.
+    """
+    def draw(candidates, size):
+        return candidates[rng.integers(0, len(candidates), size=size)]
+    return draw
+
+def make_weighted_draw(weights, rng):
+    """
+    * Helper function for array-backed matching algorithms *
+    Takes per-user weights & a numpy random Generator.
+    Builds one alias table for all users; a new table is only built for a smaller
+        candidate partition (eg. when capacity caps remove users).
+    Returns a draw function for sample_eligible_users().
+    """
+    weights = np.asarray(weights, dtype=float)
+    prob, alias = build_alias_table(weights)
+
+    def draw(candidates, size):
+        if len(candidates) == len(weights):
+            table_prob, table_alias, cols = prob, alias, None
+        else:
+            (table_prob, table_alias), cols = build_alias_table(weights[candidates]), candidates
+        picks = rng.integers(0, len(table_prob), size=size)
+        picks = np.where(rng.random(size) < table_prob[picks], picks, table_alias[picks])
+        return picks if cols is None else cols[picks]
+    return draw
+
+def match_group(task_ids, user_ids, task_users_dict, draw_users, capacity=None, rng=None):
+    """
+    * Helper function for array-backed matching algorithms *
+    Takes lists of task ids & user ids, a task-user dict of previously-assigned users,
+        a draw function (see make_uniform_draw/make_weighted_draw) and an optional 
+        per-user cap.
+    Returns a list of user-task matches, format: [[task_id, user_id], [...], ...]
+    """
+    if not task_ids or not user_ids:
+        return []
+    bitmask = build_exclusion_bitmask(task_ids, user_ids, task_users_dict)
+    chosen = sample_eligible_users(bitmask, len(user_ids), draw_users, capacity, rng)
+    return [[task_ids[row], user_ids[col]] for row, col in enumerate(chosen.tolist()) if col >= 0]
+
+
+### ### MIN-COST ASSIGNMENT ### ###
+FORBIDDEN_COST = 1e6    # cost of leaving a task unmatched; above any real cost, so as many tasks as possible are matched
+TIME_CLASH_MINUTES = 60 # tasks starting further apart than this don't clash
+CANDIDATES_PER_TASK = 8         # cheapest users each task is first offered to (more are added if they fill up)
+COST_BLOCK_CELLS = 2_000_000    # cap on the cells of one block of the cost computation (rows x users)
+TIE_BREAK = 1e-9        # random noise that breaks exact cost ties when picking each user's candidate tasks
+UNMATCHED = -2          # SlotAssignment.col_of_row value of a row left unmatched
+
+class SlotAssignment:
+    """
+    Sparse minimum-cost assignment of rows (tasks) to columns (users).
+    Column c takes up to room[c] rows and its k-th row costs an extra
+        slot_base[c] + slot_step * k, so work is spread out; a row only goes to a
+        column it has an edge to (add_edges()), and one that can't be placed stays
+        unmatched at unmatched_cost.
+    place() puts one row in with a shortest augmenting path (Dijkstra over the
+        reduced costs, with row/column potentials), which may move rows placed
+        earlier to other columns: after every place() the rows placed so far are
+        assigned at minimum total cost (the Hungarian method on a sparse graph).
+    """
+    def __init__(self, num_rows, room, slot_base=None, slot_step=0.0, unmatched_cost=FORBIDDEN_COST):
+        self.num_rows = num_rows
+        self.room = [int(r) for r in room]
+        self.slot_base = [0.0] * len(self.room) if slot_base is None else [float(b) for b in slot_base]
+        self.slot_step = float(slot_step)
+        self.unmatched_cost = float(unmatched_cost)
+        self.sink = num_rows + len(self.room)
+        self.edges = [{} for _ in range(num_rows)]      # row -> {column: cost}
+        self.col_of_row = [-1] * num_rows               # -1 not placed yet, UNMATCHED, or its column
+        self.rows_of_col = [set() for _ in self.room]
+        self.used = [0] * len(self.room)
+        self.pi = [0.0] * (self.sink + 1)               # potentials: rows, then columns, then the sink
+        # Dijkstra scratch space, reset after every place()
+        self._dist = [math.inf] * (self.sink + 1)
+        self._done = bytearray(self.sink + 1)
+        self._parent = [-1] * (self.sink + 1)
+
+    def add_edges(self, row, cols, costs):
+        """
+        Takes a row that isn't placed on a column, columns it may go to & their costs.
+        Adds them (raising the row's potential so every reduced cost stays >= 0).
+        """
+        assert self.col_of_row[row] < 0, "edges can only be added to a row that isn't placed"
+        edges, pi = self.edges[row], self.pi
+        for col, cost in zip(cols, costs):
+            edges[int(col)] = float(cost)
+        lowest = max([pi[self.num_rows + col] - cost for col, cost in edges.items()]
+                     + [pi[self.sink] - self.unmatched_cost])
+        pi[row] = max(pi[row], lowest)
+        self.col_of_row[row] = -1
+
+    def place_all(self, rows):
+        """
+        Takes rows that aren't placed.
+        Places them all: while nothing is placed yet, potentials start from each
+            column's first slot & each row's cheapest edge, and every row whose
+            cheapest column is still empty takes it straight away (greedy start);
+            the other rows go in with place().
+        Returns nothing.
+        """
+        num_rows, pi = self.num_rows, self.pi
+        if not any(self.used) and all(col == -1 for col in self.col_of_row):
+            for col, base in enumerate(self.slot_base):
+                pi[num_rows + col] = -base
+            pi[self.sink] = 0.0
+            for row in rows:
+                edges = self.edges[row]
+                if not edges:
+                    continue
+                col = min(edges, key=lambda col: edges[col] - pi[num_rows + col])
+                pi[row] = pi[num_rows + col] - edges[col]
+                if self.used[col] == 0 and self.room[col] > 0:
+                    self.used[col] = 1
+                    self.col_of_row[row] = col
+                    self.rows_of_col[col].add(row)
+        for row in rows:
+            if self.col_of_row[row] == -1:
+                self.place(row)
+
+    def place(self, start):
+        """
+        Takes a row that isn't placed.
+        Places it along the cheapest augmenting path, moving earlier rows if that's cheaper.
+        Returns True if it got a column, False if it stays unmatched.
+        """
+        num_rows, sink, pi = self.num_rows, self.sink, self.pi
+        edges, col_of_row, rows_of_col = self.edges, self.col_of_row, self.rows_of_col
+        used, room, slot_base, slot_step = self.used, self.room, self.slot_base, self.slot_step
+        unmatched_cost = self.unmatched_cost
+        dist, done, parent = self._dist, self._done, self._parent
+        dist[start] = 0.0
+        touched, scanned = [start], []
+        heap = [(0.0, start)]
+        heappop, heappush = heapq.heappop, heapq.heappush
+        while heap:
+            d, node = heappop(heap)
+            if d >= dist[sink]:
+                # nothing left is closer than the sink (ties are common, end on the first one)
+                done[sink] = 1
+                scanned.append(sink)
+                break
+            if done[node]:
+                continue
+            done[node] = 1
+            scanned.append(node)
+            base = d + pi[node]
+            if node < num_rows:
+                # a row may go to any of its columns (but the one it's on), or be left unmatched
+                here = col_of_row[node]
+                for col, cost in edges[node].items():
+                    if col != here:
+                        nxt = num_rows + col
+                        nd = base + cost - pi[nxt]
+                        if nd < dist[nxt] and not done[nxt]:
+                            if dist[nxt] == math.inf:
+                                touched.append(nxt)
+                            dist[nxt] = nd
+                            parent[nxt] = node
+                            heappush(heap, (nd, nxt))
+                if here != UNMATCHED:
+                    nd = base + unmatched_cost - pi[sink]
+                    if nd < dist[sink]:
+                        if dist[sink] == math.inf:
+                            touched.append(sink)
+                        dist[sink] = nd
+                        parent[sink] = node
+                        heappush(heap, (nd, sink))
+            else:
+                # a column with room ends the path; otherwise one of its rows moves elsewhere
+                col = node - num_rows
+                if used[col] < room[col]:
+                    nd = base + slot_base[col] + slot_step * used[col] - pi[sink]
+                    if nd < dist[sink]:
+                        if dist[sink] == math.inf:
+                            touched.append(sink)
+                        dist[sink] = nd
+                        parent[sink] = node
+                        heappush(heap, (nd, sink))
+                for row in rows_of_col[col]:
+                    nd = base - edges[row][col] - pi[row]
+                    if nd < dist[row] and not done[row]:
+                        if dist[row] == math.inf:
+                            touched.append(row)
+                        dist[row] = nd
+                        parent[row] = node
+                        heappush(heap, (nd, row))
+
+        # Update potentials so every edge on the new path is tight (& all stay >= 0)
+        total = dist[sink]
+        for node in scanned:
+            pi[node] += dist[node] - total
+        path = [sink]
+        while path[-1] != start:
+            path.append(parent[path[-1]])
+        for node in touched:
+            dist[node] = math.inf
+            done[node] = 0
+
+        # Flip the augmenting path (it ends in a column with room, or leaves a row unmatched)
+        node = path[1]
+        if node < num_rows:
+            col = col_of_row[node]
+            col_of_row[node] = UNMATCHED
+            if node == start:
+                return False
+            rows_of_col[col].discard(node)
+        else:
+            col = node - num_rows
+            used[col] += 1
+        while True:
+            row = parent[num_rows + col]
+            previous = col_of_row[row]
+            col_of_row[row] = col
+            rows_of_col[col].add(row)
+            if previous < 0:
+                return True
+            rows_of_col[previous].discard(row)
+            col = previous
+
+    def matches(self):
+        """Returns a list of (row, column) for every placed row, by row."""
+        return [(row, col) for row, col in enumerate(self.col_of_row) if col >= 0]
+
+def solve_assignment(cost):
+    """
+    Takes a 2D cost array (rows x columns, any shape; np.inf marks a forbidden pair).
+    Solves the minimum-cost assignment exactly with SlotAssignment (one slot per
+        column), matching as many rows as the allowed pairs permit.
+    Returns (row_indices, col_indices), one pair per matched row, like 
+        scipy.optimize.linear_sum_assignment.
+    """
+    cost = np.asarray(cost, dtype=float)
+    num_rows, num_cols = cost.shape
+    allowed = np.isfinite(cost)
+    largest = np.abs(cost[allowed]).max() if allowed.any() else 0.0
+    matching = SlotAssignment(num_rows, np.ones(num_cols),
+                              unmatched_cost=(2 * min(num_rows, num_cols) + 2) * (largest + 1))
+    for row in range(num_rows):
+        cols = np.flatnonzero(allowed[row])
+        matching.add_edges(row, cols, cost[row, cols])
+    matching.place_all(range(num_rows))
+    pairs = matching.matches()
+    return (np.array([row for row, _ in pairs], dtype=np.int64),
+            np.array([col for _, col in pairs], dtype=np.int64))
+
+def room_distance(location_a, location_b):
+    """
+    * Default distance function for algorithm_optimal() *
+    Takes two room codes like 'W102' (wing letter, floor digit, room number).
+    Estimates the walking distance between them from the codes alone.
+    Returns a float (0 for the same room).
+    """
+    if location_a == location_b:
+        return 0.0
+    try:
+        wing_a, number_a = location_a[0], int(location_a[1:])
+        wing_b, number_b = location_b[0], int(location_b[1:])
+    except (TypeError, ValueError, IndexError):
+        return 50.0
+    floors = abs(number_a // 100 - number_b // 100)
+    rooms = abs(number_a % 100 - number_b % 100)
+    return 10.0 * floors + rooms + (20.0 if wing_a != wing_b else 0.0)
+
+def make_distance_function(graph_file=None):
+    """
+    * Helper function for algorithm_optimal() *
+    Takes an optional building graph file (see helper_functions.read_file()).
+    Returns a distance function over room codes: precomputed walking distances from 
+        the graph (falling back to room_distance() for rooms not in it), or just
+        room_distance() when there is no graph.
+    """
+    if not graph_file:
+        return room_distance
+    building = helper_functions.get_building_distances(graph_file)
+    return lambda location_a, location_b: building.distance(location_a, location_b, 
+                                                            default=room_distance(location_a, location_b))
+
+def make_cost_function(task_ids, task_data, user_ids, user_data, task_users_dict, weights, distance=room_distance):
+    """
+    * Helper function for algorithm_optimal() *
+    Takes task ids & their (location, start_time) details, user ids & their data 
+        (reliability & outstanding tasks), a task-user dict of previously-assigned 
+        users, cost weights and a location distance function.
+    Cost of giving task t to user u = 
+        weights['reliability'] * (1 - reliability of u)
+        + weights['time'] * how close t starts to u's other open tasks (0 to 1)
+        + weights['distance'] * distance from t to u's nearest open task (0 to 1)
+    Previously-assigned pairs cost np.inf.
+    Returns (cost_block(rows, cols) -> cost array of shape (len(rows), len(cols)),
+        array of each user's open task count, cells one row of a block takes).
+    """
+    num_users = len(user_ids)
+    reliability = np.array([float(r) for r in user_data['reliability']])
+    outstanding = user_data.get('outstanding', [[] for _ in user_ids])
+    load = np.array([len(tasks) for tasks in outstanding], dtype=float)
+
+    # Index every location once & precompute location-to-location distances
+    locations = sorted({task_data[task_id][0] for task_id in task_ids} |
+                       {loc for tasks in outstanding for loc, _ in tasks}, key=str)
+    loc_index = {loc: i for i, loc in enumerate(locations)}
+    loc_dist = np.array([[distance(a, b) for b in locations] for a in locations]).reshape(len(locations), len(locations))
+    reachable = np.isfinite(loc_dist)
+    if reachable.any() and loc_dist[reachable].max() > 0:
+        loc_dist /= loc_dist[reachable].max()
+    loc_dist[~reachable] = 1.0
+
+    task_loc = np.array([loc_index[task_data[task_id][0]] for task_id in task_ids], dtype=np.int64)
+    task_start = np.array([task_data[task_id][1] for task_id in task_ids], dtype='datetime64[m]').astype(np.int64)
+
+    # Every open task in one flat array, grouped by user (segments start at open_starts)
+    open_cols = np.array([col for col, tasks in enumerate(outstanding) for _ in tasks], dtype=np.int64)
+    open_start = np.array([start for tasks in outstanding for _, start in tasks], dtype='datetime64[m]').astype(np.int64)
+    open_loc = np.array([loc_index[loc] for tasks in outstanding for loc, _ in tasks], dtype=np.int64)
+    users_with_open, open_starts = np.unique(open_cols, return_index=True)
+
+    # Previously-assigned pairs are forbidden
+    user_position = {user_id: i for i, user_id in enumerate(user_ids)}
+    forbidden = {}
+    for row, task_id in enumerate(task_ids):
+        cols = [user_position[user_id] for user_id in task_users_dict.get(task_id, ()) if user_id in user_position]
+        if cols:
+            forbidden[row] = cols
+
+    def cost_block(rows, cols):
+        rows = np.asarray(rows, dtype=np.int64)
+        # Closest open task of each user, in start time & in distance (neutral if none)
+        min_gap = np.full((len(rows), num_users), np.inf)
+        min_dist = np.full((len(rows), num_users), 0.5)
+        if len(open_cols):
+            gaps = np.abs(task_start[rows][:, None] - open_start[None, :])
+            min_gap[:, users_with_open] = np.minimum.reduceat(gaps, open_starts, axis=1)
+            dists = loc_dist[task_loc[rows][:, None], open_loc[None, :]]
+            min_dist[:, users_with_open] = np.minimum.reduceat(dists, open_starts, axis=1)
+        clash = np.clip(1 - min_gap / TIME_CLASH_MINUTES, 0, 1)
+        cost = (weights['reliability'] * (1 - reliability)[None, :]
+                + weights['time'] * clash
+                + weights['distance'] * min_dist)
+        for i, row in enumerate(rows.tolist()):
+            if row in forbidden:
+                cost[i, forbidden[row]] = np.inf
+        return cost[:, cols]
+
+    return cost_block, load, num_users + len(open_cols)
+
+def candidate_edges(cost_block, rows, cols, penalty, num_candidates, row_cells):
+    """
+    * Helper function for algorithm_optimal() *
+    Takes a cost function (see make_cost_function), the rows (tasks) & columns
+        (users) to consider, a per-user penalty added for ranking only (eg. their
+        current load), the number of candidates to keep & the cells one row of a
+        cost block takes.
+    Computes the costs COST_BLOCK_CELLS at a time (never the full tasks x users
+        matrix) and keeps each row's num_candidates cheapest allowed columns, plus
+        each column's num_candidates cheapest rows (so every user is within reach).
+    Returns a list of (row, candidate columns, their costs), one per row.
+    """
+    rng = np.random.default_rng(0)
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    per_row = [{} for _ in rows]
+    keep_cols = min(num_candidates, len(cols))
+    keep_rows = min(num_candidates, len(rows))
+    col_best = np.zeros((0, len(cols)), dtype=np.int64)     # positions in rows of each column's cheapest rows
+    col_ranked = np.zeros((0, len(cols)))
+    col_cost = np.zeros((0, len(cols)))
+    chunk = max(1, COST_BLOCK_CELLS // max(row_cells, 1))
+    for start in range(0, len(rows), chunk):
+        positions = np.arange(start, min(start + chunk, len(rows)))
+        cost = cost_block(rows[positions], cols)
+        ranked = cost + penalty[cols][None, :]
+
+        best = np.argpartition(ranked, keep_cols - 1, axis=1)[:, :keep_cols]
+        for i, position in enumerate(positions.tolist()):
+            for j in best[i][np.isfinite(cost[i, best[i]])].tolist():
+                per_row[position][j] = cost[i, j]
+
+        # Merge this block into each column's cheapest rows so far; ties are broken at random,
+        # so users whose cost is the same for every task (no open tasks) spread over the tasks
+        col_best = np.concatenate([col_best, np.broadcast_to(positions[:, None], ranked.shape)])
+        col_ranked = np.concatenate([col_ranked, ranked + TIE_BREAK * rng.random(ranked.shape)])
+        col_cost = np.concatenate([col_cost, cost])
+        if len(col_best) > keep_rows:
+            top = np.argpartition(col_ranked, keep_rows - 1, axis=0)[:keep_rows]
+            col_best, col_ranked, col_cost = (np.take_along_axis(a, top, axis=0) for a in (col_best, col_ranked, col_cost))
+
+    for j, position, cost in zip(np.broadcast_to(np.arange(len(cols)), col_best.shape).ravel().tolist(),
+                                 col_best.ravel().tolist(), col_cost.ravel().tolist()):
+        if math.isfinite(cost):
+            per_row[position][j] = cost
+    return [(int(row), cols[list(edges)], np.array(list(edges.values()))) for row, edges in zip(rows.tolist(), per_row)]
+
+
 ### ### ALGORITHMS ### ###
 def algorithm_random(assignment_data, task_data, user_data):
     """
     * One of many possible matching algorithms for match_users_and_tasks()*
-    Takes a list of all user ids & a list of all unassigned task ids.
+    Takes a task-user dict (key: task_id, value: set of previously-assigned user ids),
+        a list of all unassigned task ids & the active users' data.
     Randomly matches a user (who has never been previously assigned to this task) to each task.
     Returns a list of those user-task matches, format: [[task_id, user_id], [...], ...]
     """
-    # Assemble task-user dict, key: task_id (int), value: ids of all previously-assigned users (set)
-    task_users_dict = {} if not assignment_data else create_task_user_dict(assignment_data)
+    task_users_dict = assignment_data or {}
 
     # For each task, select a new random user_id 
     matchings = []
@@ -111,50 +622,109 @@ def algorithm_random(assignment_data, task_data, user_data):
 
     return matchings
 
-def algorithm_weighted(assignment_data, task_data, user_data):
+def algorithm_weighted(assignment_data, task_data, user_data, seed=None):
     """
     * One of many possible matching algorithms for match_users_and_tasks()*
-    Takes a list of all user ids & a list of all unassigned task ids.
-    Matches a user (who has never been previously assigned to this task) to each task weighted on their reliability scores.
+    Takes a task-user dict (key: task_id, value: set of previously-assigned user ids),
+        a list of all unassigned task ids & the active users' data (plus an optional random seed).
+    Splits users into A-B groups. The first half of the tasks go to the B group, weighted 
+        on their reliability scores (one alias table per cycle, all draws batched); 
+        the rest go to the A group uniformly at random. Users are never matched to a 
+        task they've previously been assigned to.
     Returns a list of those user-task matches, format: [[task_id, user_id], [...], ...]
     """
-    # Assemble task-user dict, key: task_id (int), value: ids of all previously-assigned users (set)
-    task_users_dict = {} if not assignment_data else create_task_user_dict(assignment_data)
-    reliability_dict = {user_data['id'][i]:float(user_data['reliability'][i]) for i in range(len(user_data['id']))}
-    
-    # Split users into a-b groups
-    # active_list = [user for user in reliability_dict if reliability_dict[user]> 0.1]
-    # a_active, b_active = create_ab_groups(active_list)
-    # inactive_list = [user for user in reliability_dict if reliability_dict[user]== 0.1]
-    # a_inactive, b_inactive = create_ab_groups(inactive_list)
-    # a_group = a_active + a_inactive
-    # b_group = b_active + b_inactive
-    # print("A GROUP: ", a_group)
-    # print("B GROUP: ", b_group)
-    # For each task, select a new random user_id 
-    user_list = [user for user in reliability_dict]
-    a_group, b_group = create_ab_groups(user_list)
+    task_users_dict = assignment_data or {}
+    user_ids = list(user_data['id'])
+    reliabilities = [float(reliability) for reliability in user_data['reliability']]
+    rng = np.random.default_rng(seed)
 
-    matchings = []
-    count = 0
-    half_task = int(len(task_data)/2)
-    for task_id in task_data:
-        if count <= half_task:
-            # Subtract all previously-assigned users from overall user pool
-            available_user_ids = set(b_group) - task_users_dict.get(task_id, set())
-            reliability_list = [int(reliability_dict[user]*100) for user in available_user_ids]
+    # Split users into a-b groups
+    a_group, b_group = create_ab_groups(list(range(len(user_ids))))
 
-            # Assign & note matching
-            user_id = random.choices(list(available_user_ids), reliability_list)[0]
-        else:
-            available_user_ids = set(a_group) - task_users_dict.get(task_id, set())
+    task_ids = list(task_data)
+    half_task = int(len(task_ids)/2)
+    b_tasks, a_tasks = task_ids[:half_task + 1], task_ids[half_task + 1:]
 
-            # Assign & note matching
-            user_id = random.choice(list(available_user_ids))
-        matchings.append([task_id, user_id])
-        count += 1
+    b_weights = np.array([reliabilities[i] for i in b_group])
+    matchings = match_group(b_tasks, [user_ids[i] for i in b_group], task_users_dict, 
+                            make_weighted_draw(b_weights, rng), rng=rng)
+    matchings += match_group(a_tasks, [user_ids[i] for i in a_group], task_users_dict, 
+                             make_uniform_draw(rng), rng=rng)
     return matchings
 
+def algorithm_array(assignment_data, task_data, user_data, capacity=None, seed=None):
+    """
+    * One of many possible matching algorithms for match_users_and_tasks()*
+    Takes a task-user dict (key: task_id, value: set of previously-assigned user ids),
+        a list of all unassigned task ids & the active users' data (plus an optional 
+        per-user cap on tasks this cycle, default task_parameters.MAX_TASKS_PER_USER, 
+        and an optional random seed).
+    Same idea as algorithm_random, but users live in a dense array & exclusions in a 
+        packed bitmask, so all tasks are matched with a few vectorized draws.
+    Returns a list of those user-task matches, format: [[task_id, user_id], [...], ...]
+    """
+    if capacity is None:
+        import task_parameters
+        capacity = task_parameters.MAX_TASKS_PER_USER
+
+    task_ids = list(task_data)
+    user_ids = list(user_data['id'])
+    rng = np.random.default_rng(seed)
+    return match_group(task_ids, user_ids, assignment_data or {}, make_uniform_draw(rng), capacity, rng)
+
+
+def algorithm_optimal(assignment_data, task_data, user_data, capacity=None, weights=None, distance=None):
+    """
+    * One of many possible matching algorithms for match_users_and_tasks()*
+    Takes a task-user dict (key: task_id, value: set of previously-assigned user ids),
+        the unassigned tasks (dict, key: task_id, value: (location, start_time)) & the
+        active users' data (with 'outstanding' open tasks per user), plus an optional
+        per-user cap, cost weights & location distance function (defaults: 
+        task_parameters.MAX_TASKS_PER_USER, task_parameters.ASSIGNMENT_COST_WEIGHTS &
+        distances from task_parameters.BUILDING_GRAPH_FILE).
+    Solves the whole batch as one minimum-cost assignment (see make_cost_function &
+        SlotAssignment). Each user takes up to `capacity` tasks, and the k-th task a
+        user gets costs an extra weights['load'] * (open tasks + k), so work is spread
+        out instead of piling onto one person.
+    Each task is first offered to its CANDIDATES_PER_TASK cheapest users; tasks left
+        unmatched because those filled up are offered to the users that still have
+        room, until every task is matched or has no eligible user with room left.
+    Returns a list of those user-task matches, format: [[task_id, user_id], [...], ...]
+    """
+    if capacity is None or weights is None or distance is None:
+        import task_parameters
+        capacity = task_parameters.MAX_TASKS_PER_USER if capacity is None else capacity
+        weights = weights or task_parameters.ASSIGNMENT_COST_WEIGHTS
+        distance = distance or make_distance_function(task_parameters.BUILDING_GRAPH_FILE)
+
+    task_ids = list(task_data)
+    user_ids = list(user_data['id'])
+    if not task_ids or not user_ids:
+        return []
+
+    cost_block, load, row_cells = make_cost_function(task_ids, task_data, user_ids, user_data,
+                                                     assignment_data or {}, weights, distance)
+    room = np.full(len(user_ids), len(task_ids) if capacity is None else min(capacity, len(task_ids)))
+    penalty = weights['load'] * load
+    matching = SlotAssignment(len(task_ids), room, slot_base=penalty, slot_step=weights['load'])
+
+    # Offer every task its cheapest users (& every user its cheapest tasks), then offer
+    # the tasks left over because those filled up every user that still has room
+    rows, cols, num_candidates = np.arange(len(task_ids)), np.arange(len(user_ids)), CANDIDATES_PER_TASK
+    while len(rows) and len(cols):
+        offered = []
+        for row, candidates, costs in candidate_edges(cost_block, rows, cols, penalty, num_candidates, row_cells):
+            if len(candidates):
+                matching.add_edges(row, candidates, costs)
+                offered.append(row)
+        matching.place_all(offered)
+        if num_candidates >= len(cols):
+            break
+        rows = np.array([row for row, col in enumerate(matching.col_of_row) if col == UNMATCHED], dtype=np.int64)
+        cols = np.flatnonzero(np.array(matching.used) < room)
+        num_candidates = len(cols)
+    return [[task_ids[row], user_ids[col]] for row, col in matching.matches()]
+
 
 ### ### OVERALL MATCHING & ASSIGNMENT GENERATION ### ###
 def match_users_and_tasks(matching_algo, db_name):
@@ -162,34 +732,37 @@ def match_users_and_tasks(matching_algo, db_name):
     Takes 'users' table data & 'tasks' table data, and a matching algorithm (function).
     Finds unexpired & unassigned tasks, matches users to those tasks, writes those
         Assignments to the 'assignments' table.
+    The algorithm gets the unassigned tasks as a dict (key: task_id, value: (location, 
+        start_time)) and each user's open tasks in user_data['outstanding'].
     Returns nothing.
     """
-    # Open database connection
-    db = helper_functions.connectDB(db_name)
+    # Borrow a pooled database connection
+    with helper_functions.connectDB(db_name) as db:
+        # read in (active) user data & every user's open tasks
+        user_data = read_table(db, 'users')
+        if user_data:
+            outstanding = get_outstanding_tasks(db)
+            user_data['outstanding'] = [outstanding.get(user_id, []) for user_id in user_data['id']]
 
-    # read in assignment, task, and user data
-    assignment_data = read_table(db, 'assignments')
-    # task_data = read_table(db, 'tasks')
-    user_data = read_table(db, 'users')
+        # Identify unassigned, unexpired tasks (anti-join on the assignments.task_id index);
+        # the expired flag may lag behind the sweeper, so check expires_at too
+        cursor = db.cursor()
+        cursor.execute(f"SELECT tasks.id, tasks.location, tasks.start_time FROM tasks \
+                       LEFT JOIN assignments ON tasks.id=assignments.task_id \
+                       WHERE tasks.expired = 0 AND tasks.expires_at >= now() AND assignments.id IS NULL")
+        unassigned_tasks = {task[0]: (task[1], task[2]) for task in cursor.fetchall()}
 
-    # Updates task expiration status
-    cursor = db.cursor()
-    cursor.execute(f"UPDATE tasks SET expired = 1 WHERE start_time + INTERVAL time_window minute < now()")
-    
-    # Identify unassigned tasks 
-    cursor.execute(f"SELECT tasks.id FROM tasks LEFT JOIN assignments ON tasks.id=assignments.task_id \
-                   WHERE expired = 0 AND tasks.id NOT IN (SELECT task_id from assignments)")
-    unassigned_tasks = set([tasks[0] for tasks in cursor.fetchall()])
-    # Use the given Matching Algorithm to match users to unassigned tasks
-    if user_data:
-        task_user_matchings = matching_algo(assignment_data, unassigned_tasks, user_data)
-
-        # Generate Assignments & insert them into the Assignments table
-        all_assignments = [{'task_id': task_id, 'user_id': user_id} for task_id, user_id in task_user_matchings]
-        insert_assignments(all_assignments, db)
-
-    # Close database connection
-    db.close()
+        # Candidates have no assignment rows (anti-join above), so no user is excluded from any of them
+        assignment_data = {task_id: set() for task_id in unassigned_tasks}
+
+        # Use the given Matching Algorithm to match users to unassigned tasks
+        task_user_matchings = []
+        if user_data:
+            task_user_matchings = matching_algo(assignment_data, unassigned_tasks, user_data)
+
+            # Generate Assignments & insert them into the Assignments table
+            all_assignments = [{'task_id': task_id, 'user_id': user_id} for task_id, user_id in task_user_matchings]
+            insert_assignments(all_assignments, db)
 
 
 
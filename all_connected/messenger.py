@@ -8,12 +8,15 @@ run this file in another terminal
 (both of these things need to happen in order to run)
 """
 import helper_functions
+import counters
+import task_cache
 from datetime import datetime
+from time import perf_counter
 
 import os
 from pathlib import Path
 from dotenv import load_dotenv
-env_path = Path('..') / '.env'
+env_path = Path(__file__).resolve().parent.parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
 ### ### CONSTANTS ### ###
@@ -25,91 +28,184 @@ def add_users(user_store):
     Gets teh database connection. Returns nothing.
     Add users to the database based on the current list of users in the the workplace 
     '''
-    conn = helper_functions.connectDB(DB_NAME)
-    cur = conn.cursor()
-    # user_store = get_all_users_info()
-    query = '''INSERT IGNORE INTO users (name, id) VALUES (%s, %s)'''
-    for key in user_store:
-        not_bot = user_store[key]['is_bot'] == False
-        not_slackbot = (key != 'USLACKBOT')
-        deleted = user_store[key]['deleted']
-        if not_bot and not_slackbot and (not deleted):
-            name = user_store[key]['name']
-            cur.execute(query, (name, key))
-            conn.commit()
-    conn.close()
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        # user_store = get_all_users_info()
+        query = '''INSERT IGNORE INTO users (name, id) VALUES (%s, %s)'''
+        for key in user_store:
+            not_bot = user_store[key]['is_bot'] == False
+            not_slackbot = (key != 'USLACKBOT')
+            deleted = user_store[key]['deleted']
+            if not_bot and not_slackbot and (not deleted):
+                name = user_store[key]['name']
+                cur.execute(query, (name, key))
+                conn.commit()
 
 def get_total_users():
-    conn = helper_functions.connectDB(DB_NAME)
-    cur = conn.cursor()
-    query = "SELECT COUNT(id) FROM users WHERE `status` = 'active'"
-    cur.execute(query)
-    total_users = cur.fetchone()[0]
-    return int(total_users)
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        query = "SELECT COUNT(id) FROM users WHERE `status` = 'active'"
+        cur.execute(query)
+        total_users = cur.fetchone()[0]
+        return int(total_users)
 
 def get_active_users_list():
-    conn = helper_functions.connectDB(DB_NAME)
-    cur = conn.cursor()
-    query = "SELECT id FROM users WHERE `status` = 'active'"
-    cur.execute(query)
-    active_users_list = cur.fetchall()
-    active_users = [user[0] for user in active_users_list]
-    return active_users
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        query = "SELECT id FROM users WHERE `status` = 'active'"
+        cur.execute(query)
+        active_users_list = cur.fetchall()
+        active_users = [user[0] for user in active_users_list]
+        return active_users
 
 def get_all_users_list():
-    conn = helper_functions.connectDB(DB_NAME)
-    cur = conn.cursor()
-    query = "SELECT id FROM users"
-    cur.execute(query)
-    all_users_list = cur.fetchall()
-    all_users = [user[0] for user in all_users_list]
-    return all_users
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        query = "SELECT id FROM users"
+        cur.execute(query)
+        all_users_list = cur.fetchall()
+        all_users = [user[0] for user in all_users_list]
+        return all_users
 
 def get_account_info(user_id):
-    conn = helper_functions.connectDB(DB_NAME)
-    cur = conn.cursor()
-    query = f"SELECT compensation FROM users WHERE id = '{user_id}'"
-    cur.execute(query)
-    compensation = cur.fetchone()[0]
-    query = f"SELECT task_id FROM assignments WHERE user_id = '{user_id}' AND checked = 1 AND submission_time IS NOT NULL"
-    cur.execute(query)
-    tasks = [task[0] for task in cur.fetchall()]
-    return compensation, tasks
+    """
+    Takes a user id.
+    Reads their compensation & running totals (see counters.py) from two primary-key
+        rows, and their completed task ids from the idx_assignments_user_checked index.
+    Returns (compensation, list of completed (checked) task ids, number of
+        submissions still waiting to be checked).
+    """
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        query = f'''SELECT users.compensation, COALESCE(user_totals.checked, 0), COALESCE(user_totals.submitted, 0)
+                    FROM users LEFT JOIN user_totals ON user_totals.user_id = users.id
+                    WHERE users.id = '{user_id}'
+                '''
+        cur.execute(query)
+        compensation, checked, submitted = cur.fetchone()
+        query = f"SELECT task_id FROM assignments WHERE user_id = '{user_id}' AND checked = 1 AND submission_time IS NOT NULL"
+        cur.execute(query)
+        tasks = [task[0] for task in cur.fetchall()]
+        return compensation, tasks, int(submitted - checked)
+
+def get_all_account_info(active_only=True) -> dict:
+    """
+    Takes whether to only include active users.
+    Finds every user's compensation & totals in one query, and their completed task
+        ids in another.
+    Returns a dict, key: user_id, value: (compensation, list of completed task ids,
+        submissions waiting to be checked), as get_account_info() gives for one user.
+    """
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        where = "WHERE users.`status` = 'active'" if active_only else ""
+        query = f'''SELECT users.id, users.compensation, COALESCE(user_totals.checked, 0), COALESCE(user_totals.submitted, 0)
+                    FROM users LEFT JOIN user_totals ON user_totals.user_id = users.id
+                    {where}'''
+        cur.execute(query)
+        rows = cur.fetchall()
+        query = f'''SELECT users.id, assignments.task_id
+                    FROM users INNER JOIN assignments ON assignments.user_id = users.id
+                        AND assignments.checked = 1 AND assignments.submission_time IS NOT NULL
+                    {where}
+                    ORDER BY users.id, assignments.task_id'''
+        cur.execute(query)
+        completed = {}
+        for user_id, task_id in cur.fetchall():
+            completed.setdefault(user_id, []).append(task_id)
+    return {user_id: (compensation, completed.get(user_id, []), int(submitted - checked))
+            for user_id, compensation, checked, submitted in rows}
 
 def update_account_status(user_id, status):
-    conn = helper_functions.connectDB(DB_NAME)
-    cur = conn.cursor()
-    cur.execute(f"UPDATE users SET `status` = '{status}' WHERE id = '{user_id}'")
-    conn.commit()
-    conn.close
-
-def add_account_compensation(user_id, compensation):
-    conn = helper_functions.connectDB(DB_NAME)
-    cur = conn.cursor()
-    cur.execute(f"UPDATE users SET `compensation` = compensation + {compensation} WHERE id = '{user_id}'")
-    conn.commit()
-    conn.close
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        cur.execute(f"UPDATE users SET `status` = '{status}' WHERE id = '{user_id}'")
+        conn.commit()
+
+def activate_users(excluded_users=()):
+    """
+    Takes user ids to leave alone (eg. task_parameters.admin_list).
+    Re-activates every other user for the day in one UPDATE.
+    Returns the number of users re-activated.
+    """
+    start = perf_counter()
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        excluded = list(excluded_users) or ['']
+        placeholders = ', '.join(['%s'] * len(excluded))
+        activated = cur.execute(f"UPDATE users SET `status` = 'active' WHERE `status` <> 'active' AND id NOT IN ({placeholders})",
+                                excluded)
+        conn.commit()
+    print(f"- re-activated {activated} users in {perf_counter() - start:.2f}s", datetime.now())
+    return activated
 
 def update_tasks_expired():
-    conn = helper_functions.connectDB(DB_NAME)
-    cur = conn.cursor()
-    cur.execute("UPDATE tasks SET `expired` = 1 WHERE (start_time + INTERVAL time_window MINUTE) < NOW()")
-    conn.commit()
-    conn.close
+    """
+    Takes nothing.
+    Flags the tasks that expired since the last sweep (a range scan of the 
+        (expired, expires_at) index, so only newly expired rows are touched).
+    Only the background expiry sweeper in connections.py calls this; interactive
+        paths read expiry straight from tasks.expires_at instead of writing.
+    Returns the number of tasks flagged.
+    """
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        flagged = cur.execute("UPDATE tasks SET `expired` = 1 WHERE `expired` = 0 AND expires_at < NOW()")
+        conn.commit()
+    return flagged
 
 def get_task_list(user_id, task_id):
-    conn = helper_functions.connectDB(DB_NAME)
-    cur = conn.cursor()
-    query = f'''SELECT assignments.task_id, assignments.user_id, 
-                tasks.location, tasks.description, tasks.start_time, tasks.time_window, 
-                tasks.compensation
-                FROM assignments INNER JOIN tasks ON assignments.task_id = tasks.id
-                WHERE (assignments.task_id = {task_id} AND assignments.user_id = '{user_id}')'''
-    cur.execute(query)
-    assignment = cur.fetchone()
-    conn.close()
-    assert assignment, f"Assignment #{task_id} could not be found in database!"
-    return assignment
+    '''
+    Takes a user id & task id.
+    Reads the assignment's status; the task's details come from task_cache.
+    Returns (task_id, user_id, location, description, start_time, time_window, 
+        compensation, status)
+    '''
+    task = task_cache.get_task(task_id)
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        query = f"SELECT `status` FROM assignments WHERE task_id = {task_id} AND user_id = '{user_id}'"
+        cur.execute(query)
+        assignment = cur.fetchone()
+    assert task and assignment, f"Assignment #{task_id} could not be found in database!"
+    return (task.id, user_id, task.location, task.description, task.start_time, task.time_window,
+            task.compensation, assignment[0])
+
+
+def respond_to_assignment(task_id, user_id, new_status, compensation=0):
+    """
+    Takes a task id, user id, the user's answer ('accepted' or 'rejected') & the 
+        compensation to credit if the answer is recorded.
+    Records the answer with one conditional UPDATE that only matches a pending
+        (or still-queued) assignment of an unexpired task; its affected-row count
+        decides the outcome. An acceptance is counted in the user's counters in the
+        same transaction. Then reads the assignment back for re-rendering.
+    Returns (whether the answer was recorded, the task_list row as get_task_list()
+        with assignments.status & whether the task has expired appended).
+    """
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        changed = cur.execute("""UPDATE assignments INNER JOIN tasks ON assignments.task_id = tasks.id
+                                 SET assignments.`status` = %s,
+                                     assignments.recommend_time = COALESCE(assignments.recommend_time, NOW())
+                                 WHERE assignments.task_id = %s AND assignments.user_id = %s
+                                   AND assignments.`status` IN ('pending', 'queued')
+                                   AND tasks.expired = 0 AND tasks.expires_at >= NOW()""",
+                              (new_status, task_id, user_id))
+        if changed and compensation:
+            cur.execute("UPDATE users SET compensation = compensation + %s WHERE id = %s", (compensation, user_id))
+        if changed and new_status == 'accepted':
+            counters.add(cur, user_id, task_id, accepted=1)
+        cur.execute("""SELECT assignments.task_id, assignments.user_id, 
+                       tasks.location, tasks.description, tasks.start_time, tasks.time_window, 
+                       tasks.compensation, assignments.`status`, (tasks.expired OR tasks.expires_at < NOW())
+                       FROM assignments INNER JOIN tasks ON assignments.task_id = tasks.id
+                       WHERE assignments.task_id = %s AND assignments.user_id = %s""", (task_id, user_id))
+        task_list = cur.fetchone()
+        conn.commit()
+    assert task_list, f"Assignment #{task_id} could not be found in database!"
+    task_cache.remember([task_list])
+    return bool(changed), task_list
 
 
 def get_assignments(db_name):
@@ -119,17 +215,16 @@ def get_assignments(db_name):
     details) that user is assigned
     Return the dictionary
     '''
-    update_tasks_expired()
-    conn = helper_functions.connectDB(db_name)
-    cur = conn.cursor()
-    query = '''SELECT assignments.task_id, assignments.user_id, 
-                tasks.location, tasks.description, tasks.start_time, tasks.time_window, 
-                tasks.compensation
-                FROM assignments INNER JOIN tasks ON assignments.task_id = tasks.id
-                WHERE (assignments.`status` = 'not assigned' AND tasks.expired != 1)'''
-    cur.execute(query)
-    assignments = cur.fetchall()
-    conn.close()
+    with helper_functions.connectDB(db_name) as conn:
+        cur = conn.cursor()
+        query = '''SELECT assignments.task_id, assignments.user_id, 
+                    tasks.location, tasks.description, tasks.start_time, tasks.time_window, 
+                    tasks.compensation, assignments.`status`
+                    FROM assignments INNER JOIN tasks ON assignments.task_id = tasks.id
+                    WHERE (assignments.`status` = 'not assigned' AND tasks.expired = 0 AND tasks.expires_at >= NOW())'''
+        cur.execute(query)
+        assignments = cur.fetchall()
+    task_cache.remember(assignments)
     assignments_dict = {}
     for assignment in assignments:
         uid = assignment[1]
@@ -139,58 +234,21 @@ def get_assignments(db_name):
             assignments_dict[uid] = [assignment]       
     return assignments_dict
 
-def get_assign_status(task, user):
-    conn = helper_functions.connectDB(DB_NAME)
-    cur = conn.cursor()
-    query = f'''SELECT status FROM assignments
-                WHERE task_id = {task} AND user_id = '{user}'
-    '''
-    cur.execute(query)
-    status = cur.fetchone()[0]
-    return status
-
-
-def update_assign_status(status, task_id, user_id):
-    '''
-    Takes database name, the new status of the assignment, the task id and 
-        the user id. 
-    Updates the database accordingly.  
-        If new status is pending (only when called in ), then ignore task id and user id, update all
-        
-    Helper function to update assignment status,
-    '''
-    conn = helper_functions.connectDB(DB_NAME)
-    cur = conn.cursor()
-    if status == "pending":
-        query = '''UPDATE assignments INNER JOIN tasks 
-                ON assignments.task_id = tasks.id
-                SET assignments.`status` = 'pending', recommend_time = NOW()
-                WHERE (assignments.`status` = 'not assigned' AND tasks.expired != 1)
-        '''
-        cur.execute(query)
-    elif status == "accepted" or status == "rejected":
-        cur.execute(f"UPDATE assignments SET `status` = '{status}' WHERE task_id={task_id} AND user_id='{user_id}'")
-    conn.commit()
-    conn.close
-
 def get_accepted_tasks(user_id) -> list:
     """
     Takes a user id (int)
     Finds that user's assignment data.
     
     """
-    update_tasks_expired()
-    conn = helper_functions.connectDB(DB_NAME)
-    cur = conn.cursor()
-    query = f'''SELECT DISTINCT assignments.task_id
-                FROM assignments INNER JOIN tasks 
-                ON assignments.task_id = tasks.id
-                WHERE (assignments.user_id = '{user_id}') AND (assignments.`status` = 'accepted') AND (tasks.expired != 1) AND (img IS NULL)'''
-    cur.execute(query)
-
-    task_list = [int(task_id[0]) for task_id in cur.fetchall()]
-    
-    conn.close()
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        query = f'''SELECT DISTINCT assignments.task_id
+                    FROM assignments INNER JOIN tasks 
+                    ON assignments.task_id = tasks.id
+                    WHERE (assignments.user_id = '{user_id}') AND (assignments.`status` = 'accepted') AND (tasks.expired = 0) AND (tasks.expires_at >= NOW()) AND (img IS NULL)'''
+        cur.execute(query)
+
+        task_list = [int(task_id[0]) for task_id in cur.fetchall()]
     return task_list
 
 def get_pending_tasks(user_id) -> list:
@@ -199,157 +257,233 @@ def get_pending_tasks(user_id) -> list:
     Finds that user's assignment data.
     
     """
-    conn = helper_functions.connectDB(DB_NAME)
-    cur = conn.cursor()
-    # query = f'''SELECT task_id FROM assignments 
-    #             WHERE user_id = '{user_id}' AND `status` = 'pending'
-    #         '''
-    query = f'''SELECT DISTINCT assignments.task_id 
-                FROM assignments INNER JOIN tasks
-                ON assignments.task_id = tasks.id
-                WHERE assignments.user_id = '{user_id}' AND assignments.`status` = 'pending' AND tasks.expired = 0
-            '''
-    cur.execute(query)
-    task_list = [item[0] for item in cur.fetchall()]
-    conn.close()
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        # query = f'''SELECT task_id FROM assignments 
+        #             WHERE user_id = '{user_id}' AND `status` = 'pending'
+        #         '''
+        query = f'''SELECT DISTINCT assignments.task_id 
+                    FROM assignments INNER JOIN tasks
+                    ON assignments.task_id = tasks.id
+                    WHERE assignments.user_id = '{user_id}' AND assignments.`status` = 'pending' AND tasks.expired = 0
+                        AND tasks.expires_at >= NOW()
+                '''
+        cur.execute(query)
+        task_list = [item[0] for item in cur.fetchall()]
     return task_list
 
+def get_report_tasks(user_id) -> list:
+    """
+    Takes a user id (str)
+    Finds, in one query, that user's active (accepted, unexpired, uncompleted) &
+        pending (pending, unexpired) tasks.
+    Returns a list of task_list rows (as get_task_list(), status last), active
+        tasks first, each group sorted by start time.
+    """
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        query = f'''SELECT assignments.task_id, assignments.user_id, 
+                    tasks.location, tasks.description, tasks.start_time, tasks.time_window, 
+                    tasks.compensation, assignments.`status`
+                    FROM assignments INNER JOIN tasks ON assignments.task_id = tasks.id
+                    WHERE assignments.user_id = '{user_id}' AND tasks.expired = 0 AND tasks.expires_at >= NOW()
+                        AND ((assignments.`status` = 'accepted' AND assignments.img IS NULL) 
+                             OR assignments.`status` = 'pending')
+                    ORDER BY assignments.`status` = 'pending', tasks.start_time'''
+        cur.execute(query)
+        report_tasks = list(cur.fetchall())
+    task_cache.remember(report_tasks)
+    return report_tasks
+
 def check_time_window(task_id):
-    update_tasks_expired()
-    conn = helper_functions.connectDB(DB_NAME)
-    cur = conn.cursor()
-    cur.execute(f"SELECT expired, (start_time<NOW()) FROM tasks WHERE id = {task_id}")
-    timing = cur.fetchone()
-    expired = timing[0]
-    started = timing[1]
-    if expired == 1:
-        return "expired"
-    elif started == 0:
-        return "not started"
-
-def submit_task(user_id, task_id, path):
-    update_tasks_expired()
-    conn = helper_functions.connectDB(DB_NAME)
-    cur = conn.cursor()
-    cur.execute(f"SELECT expired, (start_time<NOW()) FROM tasks WHERE id = {task_id}")
-    timing = cur.fetchone()
-    expired = timing[0]
-    started = timing[1]
-    if expired == 0 and started == 1:
+    '''
+    Takes a task id.
+    Judges it against the clock from the cached task row (no query on a cache hit).
+    Returns "expired", "not started", or None while the task is open (or unknown).
+    '''
+    task = task_cache.get_task(task_id)
+    return task_cache.timing(task) if task else None
+
+def submit_task(user_id, task_id, path, img_hash=None):
+    """
+    Takes a user id, task id, the saved picture's path & its perceptual hash.
+    Records the submission if the task is within its time window (judged from
+        task_cache) and, in the same transaction, counts it (a first picture for
+        the assignment only) & updates the user's reliability from their counters.
+    Returns the assignment id (truthy) if recorded, otherwise False.
+    """
+    task = task_cache.get_task(task_id)
+    if task is None or task_cache.timing(task) is not None:
+        return False
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT id, img IS NULL FROM assignments WHERE user_id = '{user_id}' AND task_id = {task_id} FOR UPDATE")
+        assignment_id, first_picture = cur.fetchone()
         query = f'''UPDATE assignments 
                     INNER JOIN users ON assignments.user_id = users.id
                     INNER JOIN tasks ON assignments.task_id = tasks.id
                 SET assignments.img = '{path}', 
+                    assignments.img_hash = {'NULL' if img_hash is None else img_hash},
                     assignments.`submission_time` = NOW()
                 WHERE (assignments.user_id = '{user_id}' 
                     AND assignments.task_id = {task_id})
                 '''
         cur.execute(query)
+        if first_picture:
+            counters.add(cur, user_id, task_id, submitted=1)
+        reliability_update(cur, user_id)
+        conn.commit()
+    return assignment_id
+
+def get_image_hashes() -> list:
+    """
+    Takes nothing.
+    Returns a list of (assignment id, img_hash) for every hashed submission
+        (read from the covering idx_assignments_img_hash index, not the table).
+    """
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id, img_hash FROM assignments WHERE img_hash IS NOT NULL")
+        return list(cur.fetchall())
+
+def flag_duplicate_submission(assignment_id, duplicate_of):
+    """
+    Takes an assignment id & the id of the earlier submission its picture near-duplicates.
+    Records it in assignments.duplicate_of for whoever checks the submissions.
+    """
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        cur.execute(f"UPDATE assignments SET duplicate_of = {duplicate_of} WHERE id = {assignment_id}")
         conn.commit()
-        conn.close()
-        update_reliability(user_id)
-        return True
-    else:
-        return False
 
 def delete_submission(user_id, task_id):
-    conn = helper_functions.connectDB(DB_NAME)
-    cur = conn.cursor()
-    query = f'''UPDATE assignments
-            SET img = NULL, submission_time = NULL
-            WHERE user_id = {user_id} AND task_id = {task_id}
-            '''
-    cur.execute(query)
-    conn.commit()
-    conn.close()
-    return
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        # Uncount the picture (& its settlement, if it was already checked) in the same transaction
+        cur.execute(f'''SELECT assignments.img IS NOT NULL, assignments.checked = 1 AND assignments.submission_time IS NOT NULL,
+                        COALESCE(tasks.compensation, 0)
+                        FROM assignments LEFT JOIN tasks ON assignments.task_id = tasks.id
+                        WHERE assignments.user_id = '{user_id}' AND assignments.task_id = {task_id} FOR UPDATE''')
+        row = cur.fetchone()
+        if row and row[0]:
+            settled = bool(row[1])
+            counters.add(cur, user_id, task_id, submitted=-1, checked=-settled, earned=-row[2] if settled else 0)
+        query = f'''UPDATE assignments
+                SET img = NULL, submission_time = NULL
+                WHERE user_id = '{user_id}' AND task_id = {task_id}
+                '''
+        cur.execute(query)
+        conn.commit()
+        return
     
-def check_all_assignments():
-    conn = helper_functions.connectDB(DB_NAME)
-    cur = conn.cursor()
-    query = f'''UPDATE assignments 
-                INNER JOIN users ON assignments.user_id = users.id
-                INNER JOIN tasks ON assignments.task_id = tasks.id
-            SET users.compensation = users.compensation+ tasks.compensation,
-                assignments.checked = 1
-            WHERE (assignments.checked = 0 AND submission_time IS NOT NULL)
-            '''
-    cur.execute(query)
-    conn.commit()
-    conn.close()
-    return
-
-def update_reliability(user_id):
-    conn = helper_functions.connectDB(DB_NAME)
-    cur = conn.cursor()
-    query = f'''SELECT COUNT(status)
-                FROM assignments
-                WHERE status = 'accepted' and user_id = '{user_id}' and DATE(recommend_time) >= CURDATE() -1
-            '''
-    cur.execute(query)
-    accepted = cur.fetchone()[0]
-    if accepted == 0:
-        new_reliability = 0.1
-    else:
-        query = f'''SELECT COUNT(img)
-                    FROM assignments
-                    WHERE img IS NOT NULL and user_id = '{user_id}' and DATE(recommend_time) >= CURDATE() -1
+def check_all_assignments(update_reliability=False, excluded_users=('USLACKBOT',)):
+    """
+    Takes whether to also recompute every user's reliability (end of day) & the
+        users whose reliability is left alone.
+    In one transaction, set-based (no per-user queries):
+        settlement - credits every user with the compensation of all their unchecked
+            submissions & marks those submissions checked;
+        reliability - blends each user's reliability with the day's submitted/accepted
+            ratio from their counters (see reliability_update()).
+    The settled submissions are counted as checked & earned in the same transaction.
+    Prints the time each phase took.
+    Returns nothing.
+    """
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        start = perf_counter()
+        # Lock the unchecked submissions (& the index range) so one arriving mid-settlement waits for the next one
+        cur.execute("SELECT COUNT(*) FROM assignments WHERE checked = 0 AND submission_time IS NOT NULL FOR UPDATE")
+        num_submissions = cur.fetchone()[0]
+        counters.add_settled(cur)
+        query = '''UPDATE users
+                    INNER JOIN (SELECT assignments.user_id, SUM(tasks.compensation) AS total
+                                FROM assignments INNER JOIN tasks ON assignments.task_id = tasks.id
+                                WHERE assignments.checked = 0 AND assignments.submission_time IS NOT NULL
+                                GROUP BY assignments.user_id) AS earned ON earned.user_id = users.id
+                    INNER JOIN assignments ON assignments.user_id = users.id
+                        AND assignments.checked = 0 AND assignments.submission_time IS NOT NULL
+                SET users.compensation = users.compensation + earned.total,
+                    assignments.checked = 1
                 '''
         cur.execute(query)
-        submissions = cur.fetchone()[0]
-        if submissions == 0:
-            new_reliability = 0.1
-        else:
-            new_reliability = round(submissions/accepted, 2)
-    query = f'''SELECT reliability
-                FROM users
-                WHERE user_id = '{user_id}'
-            '''
-    cur.execute(query)
-    old_reliability = cur.fetchone()[0]
-    reliability = old_reliability * 0.3 +new_reliability * 0.7
-    print(user_id, reliability)
-    query = f'''UPDATE users 
-            SET reliability = {reliability}
-            WHERE id = '{user_id}'
+        print(f"- settlement: {num_submissions} submissions credited in {perf_counter() - start:.2f}s", datetime.now())
+
+        if update_reliability:
+            start = perf_counter()
+            num_users = reliability_update(cur, excluded_users=excluded_users)
+            print(f"- reliability: {num_users} users updated in {perf_counter() - start:.2f}s", datetime.now())
+        conn.commit()
+
+def reliability_update(cur, user_id=None, excluded_users=()):
+    """
+    * Helper function for submit_task(), update_reliability() & check_all_assignments() *
+    Takes a cursor in the caller's open transaction & either one user id or the
+        users to leave alone (default: everyone is updated).
+    Blends each user's reliability with their submitted/accepted ratio over today &
+        yesterday (0.3 old + 0.7 new, where the new one is 0.1 without any accepted
+        task or submission), summed from their user_counters rows.
+    Returns the number of users updated.
+    """
+    if user_id is not None:
+        day_filter, user_filter, params = "AND user_id = %s", "users.id = %s", [user_id, user_id]
+    else:
+        excluded = list(excluded_users) or ['']
+        day_filter, user_filter, params = "", f"users.id NOT IN ({', '.join(['%s'] * len(excluded))})", excluded
+    query = f'''UPDATE users
+                LEFT JOIN (SELECT user_id, SUM(accepted) AS accepted, SUM(submitted) AS submissions
+                           FROM user_counters
+                           WHERE `day` >= CURDATE() - INTERVAL 1 DAY {day_filter}
+                           GROUP BY user_id) AS today ON today.user_id = users.id
+            SET users.reliability = users.reliability * 0.3 + 0.7 *
+                CASE WHEN COALESCE(today.accepted, 0) = 0 OR COALESCE(today.submissions, 0) = 0 THEN 0.1
+                     ELSE ROUND(today.submissions / today.accepted, 2) END
+            WHERE {user_filter}
             '''
-    cur.execute(query)
-    conn.commit()
-    conn.close()
-    return
+    return cur.execute(query, params)
+
+def update_reliability(user_id):
+    """
+    Takes a user id.
+    Updates their reliability from their counters (see reliability_update()).
+    Returns nothing.
+    """
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        reliability_update(cur, user_id)
+        conn.commit()
 
         
 def update_reliability_old(user_id):
-    conn = helper_functions.connectDB(DB_NAME)
-    cur = conn.cursor()
-    query = f'''SELECT COUNT(status)
-                FROM assignments
-                WHERE status = 'accepted' and user_id = '{user_id}'
-            '''
-    cur.execute(query)
-    accepted = cur.fetchone()[0]
-    if accepted == 0:
-        reliability = 0.1
-    else:
-        query = f'''SELECT COUNT(img)
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        query = f'''SELECT COUNT(status)
                     FROM assignments
-                    WHERE img IS NOT NULL and user_id = '{user_id}'
+                    WHERE status = 'accepted' and user_id = '{user_id}'
                 '''
         cur.execute(query)
-        submissions = cur.fetchone()[0]
-        if submissions == 0:
+        accepted = cur.fetchone()[0]
+        if accepted == 0:
             reliability = 0.1
         else:
-            reliability = round(submissions/accepted, 2)
-    print(user_id, reliability)
-    query = f'''UPDATE users 
-            SET reliability = {reliability}
-            WHERE id = '{user_id}'
-            '''
-    cur.execute(query)
-    conn.commit()
-    conn.close()
-    return
+            query = f'''SELECT COUNT(img)
+                        FROM assignments
+                        WHERE img IS NOT NULL and user_id = '{user_id}'
+                    '''
+            cur.execute(query)
+            submissions = cur.fetchone()[0]
+            if submissions == 0:
+                reliability = 0.1
+            else:
+                reliability = round(submissions/accepted, 2)
+        print(user_id, reliability)
+        query = f'''UPDATE users 
+                SET reliability = {reliability}
+                WHERE id = '{user_id}'
+                '''
+        cur.execute(query)
+        conn.commit()
+        return
 
 if __name__ == "__main__":
     pass
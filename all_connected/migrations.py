@@ -0,0 +1,105 @@
+"""
+Description: Versioned schema migrations for the Snap N Go database.
+    Every data/migrations/NNN_description.sql file is one migration; the ones already
+    applied are recorded in the `schema_migrations` table, so running this again only
+    applies the new ones (in version order).
+    Usage: python migrations.py           (apply pending migrations)
+           python migrations.py status    (list applied & pending migrations)
+"""
+import re
+import sys
+from pathlib import Path
+
+import helper_functions
+
+import os
+from dotenv import load_dotenv
+env_path = Path(__file__).resolve().parent.parent / '.env'
+load_dotenv(dotenv_path=env_path)
+
+### ### CONSTANTS ### ###
+DB_NAME = os.environ['DB_NAME']
+MIGRATIONS_DIR = Path(__file__).resolve().parent / 'data' / 'migrations'
+MIGRATION_FILE = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+
+### ### HELPER FUNCTIONS ### ###
+def list_migrations(migrations_dir=MIGRATIONS_DIR):
+    """
+    Takes the migrations directory.
+    Returns a list of (version (int), name, path) for every migration file, sorted by version.
+    """
+    migrations = []
+    for path in Path(migrations_dir).iterdir():
+        match = MIGRATION_FILE.match(path.name)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), path))
+    migrations.sort()
+    versions = [version for version, _, _ in migrations]
+    assert len(versions) == len(set(versions)), f"Duplicate migration versions in {migrations_dir}"
+    return migrations
+
+def split_statements(sql):
+    """
+    Takes the text of a .sql file.
+    Strips `--` comments & splits it on semicolons.
+    Returns a list of SQL statements.
+    """
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    return [statement.strip() for statement in '\n'.join(lines).split(';') if statement.strip()]
+
+def applied_versions(db):
+    """
+    Takes a database connection.
+    Creates the `schema_migrations` table if needed.
+    Returns the set of migration versions already applied.
+    """
+    cursor = db.cursor()
+    cursor.execute('''CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INT PRIMARY KEY,
+                        `name` VARCHAR(100),
+                        applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                      ) ENGINE = InnoDB''')
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+### ### OVERALL MIGRATION ### ###
+def migrate(db_name=DB_NAME, migrations_dir=MIGRATIONS_DIR):
+    """
+    Takes a database name (& optionally the migrations directory).
+    Applies every pending migration in version order, recording each one as it
+        finishes. Stops at the first failing migration (MySQL commits DDL
+        statement by statement, so fix it & re-run; finished ones are skipped).
+    Returns the list of versions applied.
+    """
+    applied = []
+    with helper_functions.connectDB(db_name) as db:
+        done = applied_versions(db)
+        cursor = db.cursor()
+        for version, name, path in list_migrations(migrations_dir):
+            if version in done:
+                continue
+            print(f"- applying migration {version:03d} {name}")
+            for statement in split_statements(path.read_text()):
+                cursor.execute(statement)
+            cursor.execute("INSERT INTO schema_migrations (version, `name`) VALUES (%s, %s)", (version, name))
+            db.commit()
+            applied.append(version)
+    return applied
+
+def status(db_name=DB_NAME, migrations_dir=MIGRATIONS_DIR):
+    """Prints every migration & whether it has been applied to the given database."""
+    with helper_functions.connectDB(db_name) as db:
+        done = applied_versions(db)
+        db.commit()
+    for version, name, _ in list_migrations(migrations_dir):
+        print(f"{version:03d} {name:40s} {'applied' if version in done else 'PENDING'}")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['status']:
+        status()
+    else:
+        applied = migrate()
+        print(f"Applied {len(applied)} migration(s).")
@@ -0,0 +1,215 @@
+"""
+Description: Durable outbox for the Slack messages Snap N Go sends on its own
+    (task, welcome, daily summary & broadcast messages).
+    enqueue() records messages in the `outbox` table; drain() claims the queued ones
+    in batches, posts them through slack_delivery and records every outcome. A claim
+    is an atomic UPDATE that marks rows 'sending' under a per-drain owner id before
+    anything is posted, so drains running at the same time in different processes
+    (bot, connections, maintenance) never post the same message. Failed messages are
+    retried with exponential backoff, and whatever is still queued after a crash or
+    restart is picked up by the next drain(). An auth error (e.g. a revoked token)
+    stops the drain and leaves its messages queued, since every other message would
+    fail the same way until the token is fixed. Delivery is at least once: a crash
+    between posting & recording the result leaves the batch claimed until its lease
+    (OUTBOX_LEASE) runs out, and it is then re-queued & re-sent.
+    Task messages carry their task ids; those assignments go 'not assigned' ->
+    'queued' when enqueued & 'queued' -> 'pending' only once the message is posted.
+    If the message fails for good, they are deleted so the matcher re-offers the tasks.
+"""
+import os
+from pathlib import Path
+from dotenv import load_dotenv
+env_path = Path(__file__).resolve().parent.parent / '.env'
+load_dotenv(dotenv_path=env_path)
+
+import json
+import uuid
+import socket
+import threading
+from datetime import datetime
+
+import helper_functions
+import slack_delivery
+
+
+### ### CONSTANTS ### ###
+DB_NAME = os.environ['DB_NAME']
+OUTBOX_BATCH = 200              # messages claimed & posted per batch
+OUTBOX_MAX_ATTEMPTS = 6         # a message is marked 'failed' after this many failed posts
+OUTBOX_BACKOFF = 30             # seconds before the first retry, doubled for every later one
+OUTBOX_MAX_BACKOFF = 30*60      # cap on the wait between retries
+OUTBOX_LEASE = 10*60            # seconds a claimed batch stays owned by its drain before it is re-queued
+# Slack errors that retrying will not fix
+PERMANENT_ERRORS = {'channel_not_found', 'user_not_found', 'invalid_blocks',
+                    'is_archived', 'msg_too_long', 'no_text'}
+# Slack errors about our own token: no message can be sent until it is fixed, so they
+# don't count as attempts and they stop the drain
+AUTH_ERRORS = {'not_authed', 'invalid_auth', 'account_inactive', 'token_revoked', 'token_expired'}
+
+# One drain at a time per process (the messenger & outbox timers can overlap); drains in
+# different processes are kept apart by the claims themselves
+_drain_lock = threading.Lock()
+
+
+### ### QUEUEING ### ###
+def enqueue(messages, kind):
+    """
+    Takes a list of messages as (user_id, blocks, text) or, for task messages,
+        (user_id, blocks, text, task_ids), and their kind ('tasks', 'welcome',
+        'summary' or 'broadcast').
+    Records them in the outbox and, in the same transaction, marks the assignments
+        of the tasks they carry as 'queued'.
+    Returns the number of messages queued.
+    """
+    rows = []
+    queued_assignments = []
+    for message in messages:
+        user_id, blocks, text = message[:3]
+        task_ids = list(message[3]) if len(message) > 3 else []
+        rows.append((user_id, kind, json.dumps(blocks), text, json.dumps(task_ids) if task_ids else None))
+        queued_assignments += [(user_id, task_id) for task_id in task_ids]
+    if not rows:
+        return 0
+
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        cur.executemany("""INSERT INTO outbox (user_id, kind, blocks, `text`, task_ids)
+                           VALUES (%s, %s, %s, %s, %s)""", rows)
+        if queued_assignments:
+            cur.executemany("""UPDATE assignments SET `status` = 'queued'
+                               WHERE user_id = %s AND task_id = %s AND `status` = 'not assigned'""", queued_assignments)
+        conn.commit()
+    return len(rows)
+
+
+### ### DRAINING ### ###
+def backoff(attempts):
+    """
+    * Helper function for record_results() *
+    Takes the number of failed attempts so far.
+    Returns the seconds to wait before the next one.
+    """
+    return min(OUTBOX_BACKOFF * 2 ** (attempts - 1), OUTBOX_MAX_BACKOFF)
+
+def claim_batch(batch_size, owner, kind=None, user_ids=None):
+    """
+    * Helper function for drain() *
+    Takes the batch size, this drain's owner id & optionally the kind of message
+        and the users to claim messages for.
+    Re-queues batches whose lease ran out (their drain died mid-batch), then claims
+        up to batch_size queued messages that are due, oldest first, with one
+        UPDATE (committed before anything is posted).
+    Returns the claimed messages as a list of dicts (id, user_id, kind, blocks,
+        text, task_ids, attempts).
+    """
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        cur.execute("""UPDATE outbox SET `status` = 'queued', claimed_by = NULL
+                       WHERE `status` = 'sending' AND claimed_at < NOW() - INTERVAL %s SECOND""", (OUTBOX_LEASE,))
+        filters, params = "", [owner]
+        if kind is not None:
+            filters += " AND kind = %s"
+            params.append(kind)
+        if user_ids is not None:
+            filters += f" AND user_id IN ({', '.join(['%s'] * len(user_ids))})"
+            params += list(user_ids)
+        cur.execute(f"""UPDATE outbox SET `status` = 'sending', claimed_by = %s, claimed_at = NOW()
+                        WHERE `status` = 'queued' AND next_attempt_at <= NOW(){filters}
+                        ORDER BY id LIMIT %s""", (*params, batch_size))
+        conn.commit()
+        cur.execute("""SELECT id, user_id, kind, blocks, `text`, task_ids, attempts FROM outbox
+                       WHERE claimed_by = %s AND `status` = 'sending' ORDER BY id""", (owner,))
+        rows = cur.fetchall()
+    return [{'id': row[0], 'user_id': row[1], 'kind': row[2], 'blocks': json.loads(row[3]), 'text': row[4],
+             'task_ids': json.loads(row[5]) if row[5] else [], 'attempts': row[6]} for row in rows]
+
+def record_results(batch, results, owner):
+    """
+    * Helper function for drain() *
+    Takes a claimed batch, the slack_delivery.DeliveryResults of posting it & the
+        owner id it was claimed under.
+    In one transaction: marks posted messages 'sent' (& their assignments
+        'pending'), re-queues the failed ones for a retry, or marks them 'failed'
+        once they run out of attempts or hit a permanent error (& deletes the
+        still-queued assignments they carried, so those tasks can be re-matched).
+        Messages that hit an auth error are re-queued without using up an attempt.
+        Only rows still claimed by owner are touched.
+    Returns a dict with the number of messages sent, retrying, failed & stopped
+        by an auth error (those are counted in retrying too).
+    """
+    sent, retrying, failed, pending_assignments, dropped_assignments = [], [], [], [], []
+    unauthorized = []
+    for row, result in zip(batch, results):
+        attempts = row['attempts'] + 1
+        assignments = [(row['user_id'], task_id) for task_id in row['task_ids']]
+        if result.ok:
+            sent.append((result.ts, row['id'], owner))
+            pending_assignments += assignments
+        elif result.error in AUTH_ERRORS:
+            unauthorized.append((OUTBOX_BACKOFF, str(result.error)[:255], row['id'], owner))
+        elif attempts >= OUTBOX_MAX_ATTEMPTS or result.error in PERMANENT_ERRORS:
+            failed.append((str(result.error)[:255], row['id'], owner))
+            dropped_assignments += assignments
+        else:
+            retrying.append((backoff(attempts), str(result.error)[:255], row['id'], owner))
+
+    with helper_functions.connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        if sent:
+            cur.executemany("""UPDATE outbox SET `status` = 'sent', attempts = attempts + 1, sent_at = NOW(),
+                               ts = %s, last_error = NULL WHERE id = %s AND claimed_by = %s""", sent)
+        if pending_assignments:
+            cur.executemany("""UPDATE assignments SET `status` = 'pending', recommend_time = NOW()
+                               WHERE user_id = %s AND task_id = %s AND `status` = 'queued'""", pending_assignments)
+        if retrying:
+            cur.executemany("""UPDATE outbox SET `status` = 'queued', claimed_by = NULL, attempts = attempts + 1,
+                               next_attempt_at = NOW() + INTERVAL %s SECOND, last_error = %s
+                               WHERE id = %s AND claimed_by = %s""", retrying)
+        if unauthorized:
+            cur.executemany("""UPDATE outbox SET `status` = 'queued', claimed_by = NULL,
+                               next_attempt_at = NOW() + INTERVAL %s SECOND, last_error = %s
+                               WHERE id = %s AND claimed_by = %s""", unauthorized)
+        if failed:
+            cur.executemany("""UPDATE outbox SET `status` = 'failed', attempts = attempts + 1, last_error = %s
+                               WHERE id = %s AND claimed_by = %s""", failed)
+        if dropped_assignments:
+            cur.executemany("""DELETE FROM assignments
+                               WHERE user_id = %s AND task_id = %s AND `status` = 'queued'""", dropped_assignments)
+        conn.commit()
+    return {'sent': len(sent), 'retrying': len(retrying) + len(unauthorized), 'failed': len(failed),
+            'unauthorized': len(unauthorized)}
+
+def drain(batch_size=OUTBOX_BATCH, max_batches=None, kind=None, user_ids=None):
+    """
+    Takes the batch size (& optionally a cap on the number of batches, and the kind
+        of message & the users to drain messages for, eg. just-queued welcomes).
+    Claims & posts every queued message that is due, one batch at a time,
+        recording the outcome of each batch before claiming the next. Messages
+        claimed by a concurrent drain (in this or another process) are left to it.
+        Stops after a batch that hit an auth error, leaving the rest queued.
+    Returns a dict with the number of messages sent, retrying, failed & stopped by
+        an auth error.
+    """
+    totals = {'sent': 0, 'retrying': 0, 'failed': 0, 'unauthorized': 0}
+    if user_ids is not None and not user_ids:
+        return totals
+    owner = f"{socket.gethostname()[:32]}:{os.getpid()}:{uuid.uuid4().hex[:12]}"
+    with _drain_lock:
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            batch = claim_batch(batch_size, owner, kind, user_ids)
+            if not batch:
+                break
+            messages = [(row['user_id'], row['blocks'], row['text']) for row in batch]
+            results = slack_delivery.deliver_all(messages, os.environ['TASK_BOT_TOKEN'])
+            counts = record_results(batch, results, owner)
+            for key, count in counts.items():
+                totals[key] += count
+            if counts['unauthorized']:
+                print(f"- outbox: Slack rejected the bot token ({counts['unauthorized']} messages), "
+                      "stopping until it is fixed", datetime.now())
+                break
+            batches += 1
+            if len(batch) < batch_size:
+                break
+    return totals
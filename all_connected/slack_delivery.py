@@ -0,0 +1,165 @@
+"""
+Description: Concurrent, rate-limited delivery of Slack messages for Snap N Go.
+    Messages are posted with slack_sdk's AsyncWebClient. Different users are served
+    concurrently (at most DELIVERY_CONCURRENCY at once), each user's messages go out
+    in order, and every chat.postMessage call takes a token from a shared bucket
+    sized to the method's rate tier. A 429 pauses the whole bucket for Retry-After
+    seconds before the message is retried. One failed message never stops the rest.
+"""
+import os
+from pathlib import Path
+from dotenv import load_dotenv
+env_path = Path(__file__).resolve().parent.parent / '.env'
+load_dotenv(dotenv_path=env_path)
+
+import asyncio
+from time import monotonic
+from collections import namedtuple
+
+from slack_sdk.errors import SlackApiError
+
+
+### ### CONSTANTS ### ###
+# chat.postMessage is in Slack's "special" rate tier: about 1 message per second per
+# channel with short bursts (CHANNEL_INTERVAL), and a few hundred per minute across the
+# workspace. The shared bucket keeps the whole workspace under that limit (4/s = 240 a
+# minute by default); any 429 still pauses it for Retry-After seconds.
+POST_MESSAGE_RATE = float(os.environ.get('POST_MESSAGE_RATE', 4))   # messages per second across the workspace
+POST_MESSAGE_BURST = int(os.environ.get('POST_MESSAGE_BURST', 20))  # messages that can go out back to back after an idle spell
+CHANNEL_INTERVAL = 1.0          # seconds between two messages to the same user
+DELIVERY_CONCURRENCY = 50       # users being delivered to at the same time
+MAX_RETRIES = 3                 # retries of a message that got rate limited (429)
+DEFAULT_RETRY_AFTER = 1         # seconds to back off when a 429 has no Retry-After header
+
+# Outcome of one message: position is its index in the list given to deliver()
+DeliveryResult = namedtuple('DeliveryResult', ['user_id', 'position', 'ok', 'error', 'attempts', 'ts'])
+
+
+### ### RATE LIMITING ### ###
+class TokenBucket:
+    """
+    Async token bucket: refills `rate` tokens per second up to `burst`.
+    acquire() waits for a token; pause() empties the bucket & holds every
+        caller back for the given number of seconds (used on a 429).
+    """
+    def __init__(self, rate=POST_MESSAGE_RATE, burst=POST_MESSAGE_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = monotonic()
+        self.paused_until = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # Callers queue on the lock, so tokens are handed out in arrival order
+        async with self._lock:
+            while True:
+                now = monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, monotonic() + seconds)
+        self.tokens = 0
+        self.updated = self.paused_until
+
+
+def retry_after(error):
+    """
+    * Helper function for post_message() *
+    Takes a SlackApiError.
+    Returns the seconds to wait if it was a 429 (rate limited), otherwise None.
+    """
+    response = error.response
+    if getattr(response, 'status_code', None) != 429:
+        return None
+    headers = getattr(response, 'headers', None) or {}
+    value = headers.get('Retry-After', headers.get('retry-after', DEFAULT_RETRY_AFTER))
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+### ### DELIVERY ### ###
+async def post_message(client, bucket, user_id, position, blocks, text, max_retries=MAX_RETRIES):
+    """
+    * Helper function for deliver_to_user() *
+    Takes a client, the shared TokenBucket & one message.
+    Posts it, retrying after Retry-After seconds while Slack answers 429.
+    Returns its DeliveryResult.
+    """
+    attempts = 0
+    while True:
+        await bucket.acquire()
+        attempts += 1
+        try:
+            response = await client.chat_postMessage(channel=f"@{user_id}", blocks=blocks, text=text)
+            return DeliveryResult(user_id, position, True, None, attempts, response.get('ts'))
+        except SlackApiError as e:
+            wait = retry_after(e)
+            if wait is None or attempts > max_retries:
+                error = e.response.get('error') if wait is None else 'ratelimited'
+                return DeliveryResult(user_id, position, False, error, attempts, None)
+            bucket.pause(wait)
+        except Exception as e:
+            # Connection errors etc. only fail this message
+            return DeliveryResult(user_id, position, False, repr(e), attempts, None)
+
+async def deliver_to_user(client, bucket, semaphore, user_id, messages, channel_interval=CHANNEL_INTERVAL):
+    """
+    * Helper function for deliver() *
+    Takes a client, the shared TokenBucket & concurrency semaphore, a user id and
+        that user's messages as a list of (position, blocks, text).
+    Posts them in order, at most one per channel_interval seconds.
+    Returns a list of DeliveryResults.
+    """
+    results = []
+    async with semaphore:
+        last_sent = None
+        for position, blocks, text in messages:
+            if last_sent is not None:
+                await asyncio.sleep(max(0, last_sent + channel_interval - monotonic()))
+            results.append(await post_message(client, bucket, user_id, position, blocks, text))
+            last_sent = monotonic()
+    return results
+
+async def deliver(messages, token=None, client=None, concurrency=DELIVERY_CONCURRENCY,
+                  rate=POST_MESSAGE_RATE, burst=POST_MESSAGE_BURST, channel_interval=CHANNEL_INTERVAL):
+    """
+    Takes a list of messages as (user_id, blocks, text) & either a bot token or a
+        ready client (anything with an async chat_postMessage, eg. an AsyncWebClient
+        pointed at another base_url).
+    Delivers them concurrently across users & in order within each user, within
+        the given rate limits.
+    Returns a list of DeliveryResults, one per message, in the order given.
+    """
+    if client is None:
+        from slack_sdk.web.async_client import AsyncWebClient     # imported on first use: it pulls in aiohttp
+        client = AsyncWebClient(token=token)
+    bucket = TokenBucket(rate, burst)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    per_user = {}
+    for position, (user_id, blocks, text) in enumerate(messages):
+        per_user.setdefault(user_id, []).append((position, blocks, text))
+
+    user_results = await asyncio.gather(*[deliver_to_user(client, bucket, semaphore, user_id, user_messages, channel_interval)
+                                          for user_id, user_messages in per_user.items()])
+    return sorted((result for results in user_results for result in results), key=lambda result: result.position)
+
+def deliver_all(messages, token=None, **kwargs):
+    """
+    Takes a list of messages as (user_id, blocks, text) & a bot token (plus any of
+        deliver()'s keyword arguments).
+    Synchronous wrapper around deliver(), for the timer threads in connections.py.
+    Returns a list of DeliveryResults, one per message.
+    """
+    return asyncio.run(deliver(messages, token, **kwargs))
@@ -8,60 +8,96 @@ import json
 import helper_functions
 import task_parameters
 from datetime import datetime, timedelta, time, date
-import pandas as pd 
+import numpy as np
 
 import os
 from pathlib import Path
 from dotenv import load_dotenv
-env_path = Path('..') / '.env'
+env_path = Path(__file__).resolve().parent.parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
 ### ### TASK PARAMETERS ### ###
 START_HOURS = task_parameters.START_HOURS
 END_HOURS = task_parameters.END_HOURS
+HOLIDAYS = task_parameters.HOLIDAYS
 TASK_TIMEWINDOW = task_parameters.TASK_TIMEWINDOW # in minutes
 TASK_COMP = task_parameters.TASK_COMP # in points
 
-TASK_LOCATION_FILE = f'data/task_locations.json'
-TASK_DESCRIPTION_FILE = f'data/task_descriptions.json'
+TASK_LOCATION_FILE = Path(__file__).resolve().parent / 'data' / 'task_locations.json'
+TASK_DESCRIPTION_FILE = Path(__file__).resolve().parent / 'data' / 'task_descriptions.json'
 
 DB_NAME = os.environ['DB_NAME']
 
+# Cached catalog files, key: file name, value: ((mtime, size), parsed contents)
+_catalog_cache = {}
+
 ### ### HELPER FUNCTIONS ### ###
-def random_datetime(n):
+def load_catalog(fname):
+    """
+    * Helper function for generate_tasks() *
+    Takes the name of a JSON catalog file (eg. task locations or descriptions).
+    Parses it once & caches the result; the file is only re-read when its
+        modification time or size changes.
+    Returns the parsed contents.
+    """
+    stat = os.stat(fname)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _catalog_cache.get(fname)
+    if cached is None or cached[0] != signature:
+        with open(fname, 'r') as infile:
+            cached = (signature, json.load(infile))
+        _catalog_cache[fname] = cached
+    return cached[1]
+
+
+def next_business_day(day):
+    """
+    * Helper function for random_datetime() *
+    Takes a date.
+    Returns the first date after it that is neither a weekend nor in HOLIDAYS.
+    """
+    day += timedelta(days=1)
+    while day.weekday() >= 5 or day in HOLIDAYS:
+        day += timedelta(days=1)
+    return day
+
+
+def random_datetime(n, seed=None):
     """
     * Helper function for create_task() *
-    Takes number of random dates to generate.
-    Generates a random datetime with the limit specified below.
-    Returns a random datetime.
+    Takes number of random dates to generate (& an optional random seed).
+    Picks the sampling window: from now (or the next business day's START_HOURS if 
+        we're outside working hours, on a weekend or on a holiday) until ~3 hours 
+        from now, never past END_HOURS.
+    Draws n minute offsets inside that window in one vectorized call.
+    Returns a list of n start times as 'YYYY-MM-DD HH:MM:SS' strings.
     """    
-    # Get start times
     now = datetime.now()
-    
-    # If today's a weekend or after hours on friday -> start = next monday at start_hours
-    weekday = now.strftime("%A").lower()
-    if weekday in {'saturday', 'sunday'} or (weekday == 'friday' and now.time() > END_HOURS):
-        date = datetime.now() + timedelta(days=-now.date().weekday(), weeks=1) # next monday
-        start = datetime.combine(date, START_HOURS)   
-    # If weekday, but before 10am -> start = today at start_hours
+    today = now.date()
+    is_business_day = today.weekday() < 5 and today not in HOLIDAYS
+
+    # Get start time
+    if not is_business_day or now.time() >= END_HOURS:
+        start = datetime.combine(next_business_day(today), START_HOURS)
     elif now.time() < START_HOURS:
-        start = datetime.combine(now.date(), START_HOURS)
-    # If weekday, during hours -> start time = now
-    elif START_HOURS < now.time() < END_HOURS:
-        start = now
-    # If weekday (except friday), after hours -> start time = next day at start_hours
+        start = datetime.combine(today, START_HOURS)
     else:
-        start = datetime.combine((now + timedelta(hours=24)), START_HOURS)
-    
-    # Get end time
-    next_hour = time((now.hour+2),00)
-    end = datetime.combine(start.date(), next_hour) + timedelta(hours=1)
+        # round up to the next whole minute so no task starts in the past
+        start = now.replace(second=0, microsecond=0)
+        if start < now:
+            start += timedelta(minutes=1)
 
-    # Generate & choose n random dates
-    dates = pd.date_range(start, end, freq='1min').to_series()
-    date_sample = [str(date) for date in dates.sample(n, replace=True).to_list()]
-    #print(date_sample)
-    return date_sample
+    # Get end time: top of the current hour + 3 hours, capped at END_HOURS
+    end = min(datetime.combine(start.date(), time(now.hour)) + timedelta(hours=3),
+              datetime.combine(start.date(), END_HOURS))
+    end = max(start, end)
+
+    # Sample n minute offsets (inclusive of both ends) & turn them into datetimes
+    rng = np.random.default_rng(seed)
+    num_minutes = int((end - start).total_seconds() // 60)
+    offsets = rng.integers(0, num_minutes + 1, size=n).astype('timedelta64[m]')
+    start_times = np.datetime64(start, 'm') + offsets
+    return np.char.replace(np.datetime_as_string(start_times, unit='s'), 'T', ' ').tolist()
 
 
 def create_task(locations, all_descriptions):
@@ -77,7 +113,6 @@ def create_task(locations, all_descriptions):
     compensation = round(random.uniform(TASK_COMP[0], TASK_COMP[1]), 2)
     window = random.randint(TASK_TIMEWINDOW[0], TASK_TIMEWINDOW[1])  # in minutes
     
-    print(window)
     return {'location': location,
             'time_window': window,
             'compensation': compensation,
@@ -88,26 +123,28 @@ def create_task(locations, all_descriptions):
 def insert_tasks(db, tasks_list, start_times):
     """
      * Helper function for generate_tasks() *
-    Takes a list of tasks and database (obj).
-    Inserts the tasks into the database given. 
+    Takes a list of tasks, their start times, and database (obj).
+    Inserts all the tasks into the database given with one multi-row insert, 
+        in a single transaction (either every task is inserted or none are). 
     Returns nothing.
     """
-    # Connect to database & a cursor object
+    if not tasks_list:
+        return
+
+    rows = [(task['location'], task['time_window'], task['compensation'],
+             task['expired'], task['description'], start_times[i])
+            for i, task in enumerate(tasks_list)]
+
+    # pymysql folds executemany() on a plain INSERT ... VALUES into multi-row inserts
+    query = """INSERT INTO tasks (`location`, time_window, compensation, expired, `description`, start_time)
+                VALUES (%s, %s, %s, %s, %s, %s)"""
     cursor = db.cursor()
-    cursor.execute(f"SHOW COLUMNS FROM tasks FROM {DB_NAME}")
-    columns = cursor.fetchall()
-    #print("insert", start_times)
-    for i, task in enumerate(tasks_list):
-        #print("start time type:", type(start_times[i]))
-        # Create & execute query
-        query = f"INSERT INTO tasks (`location`, time_window, compensation, expired, `description`, start_time) \
-                    VALUES ('{task['location']}', {task['time_window']}, {task['compensation']}, \
-                    {task['expired']}, '{task['description']}', '{start_times[i]}')"
-        
-        cursor.execute(query)
-
-        # Commit the changes to the database
+    try:
+        cursor.executemany(query, rows)
         db.commit()
+    except Exception:
+        db.rollback()
+        raise
 
 
 
@@ -119,26 +156,17 @@ def generate_tasks(num_tasks, db_name):
     Creates those tasks & inserts them into the Tasks database.
     Returns nothing.
     """
-    # Open database connection
-    db = helper_functions.connectDB(db_name)
-
-    # Get list of possible locations
-    with open(TASK_LOCATION_FILE, 'r') as infile:
-        locations_list = json.load(infile)
-
-    # Get list of possible task descriptions
-    with open(TASK_DESCRIPTION_FILE, 'r') as infile:
-        all_descriptions = json.load(infile)
+    # Get list of possible locations & task descriptions (cached between cycles)
+    locations_list = load_catalog(TASK_LOCATION_FILE)
+    all_descriptions = load_catalog(TASK_DESCRIPTION_FILE)
 
     # Generate a Tasks & random start times
     all_tasks = [create_task(locations_list, all_descriptions) for _ in range(num_tasks)]
     start_times = random_datetime(num_tasks)
 
     # Insert those tasks objects into the Task database
-    insert_tasks(db, all_tasks, start_times)
-
-    # Close database connection
-    db.close()
+    with helper_functions.connectDB(db_name) as db:
+        insert_tasks(db, all_tasks, start_times)
 
 
 if __name__ == '__main__':
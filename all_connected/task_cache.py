@@ -0,0 +1,202 @@
+"""
+Description: In-process cache of task rows (location, description, start time,
+    time window & compensation), keyed by task id.
+    Tasks never change once inserted, so timing checks ("has this task expired /
+    started yet?") & task details are answered from memory against the local clock
+    instead of re-querying `tasks`. The cache is filled whenever rows carrying task
+    details are fetched (remember()), by a bulk load of every open task (warm(), run
+    by the first lookup in a process & again once TASK_CACHE_TTL has passed), and on
+    a miss, which loads just that task. Task ids with no row are cached as missing
+    too, so repeated lookups of an unknown id don't query again.
+    Entries are evicted least-recently-used past TASK_CACHE_SIZE & reloaded after
+    TASK_CACHE_TTL (a bound on staleness if a task is ever edited by hand).
+    stats() gives hits, misses & the hit rate.
+"""
+import os
+from pathlib import Path
+from dotenv import load_dotenv
+env_path = Path(__file__).resolve().parent.parent / '.env'
+load_dotenv(dotenv_path=env_path)
+
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+from time import monotonic
+
+import helper_functions
+
+
+### ### CONSTANTS ### ###
+DB_NAME = os.environ['DB_NAME']
+TASK_CACHE_SIZE = int(os.environ.get('TASK_CACHE_SIZE', 10000))    # tasks kept before the least recently used is evicted
+TASK_CACHE_TTL = int(os.environ.get('TASK_CACHE_TTL', 60*60))      # seconds an entry is trusted before it is reloaded
+TASK_CACHE_REPORT_EVERY = 1000      # print the hit rate every this many lookups
+
+MISS = object()     # TaskCache.get() result for an id that isn't cached (None means "no such task")
+
+TaskInfo = namedtuple('TaskInfo', ['id', 'location', 'description', 'start_time', 'time_window', 'compensation'])
+
+
+### ### CACHE ### ###
+class TaskCache:
+    """
+    Thread-safe LRU of TaskInfo with a per-entry TTL, counting hits & misses.
+    An entry of None records that there is no such task.
+    """
+    def __init__(self, maxsize=TASK_CACHE_SIZE, ttl=TASK_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()   # task id -> (TaskInfo or None, monotonic time it was stored)
+        self._lock = threading.Lock()
+        self._warmed_at = None          # monotonic time of the last bulk load of open tasks
+        self.counters = {'hits': 0, 'misses': 0, 'loads': 0, 'evictions': 0}
+
+    def get(self, task_id, count=True):
+        """
+        Takes a task id (& whether to count the lookup as a hit or miss).
+        Returns its TaskInfo, None if it is cached as missing, or MISS if it isn't
+            cached (or is past its TTL).
+        """
+        with self._lock:
+            entry = self._entries.get(task_id)
+            if entry is not None and monotonic() - entry[1] < self.ttl:
+                self._entries.move_to_end(task_id)
+                self.counters['hits'] += count
+                return entry[0]
+            if entry is not None:
+                del self._entries[task_id]
+            self.counters['misses'] += count
+            return MISS
+
+    def put_many(self, tasks, loaded=False, missing=()):
+        """
+        Takes an iterable of TaskInfo (& whether they were loaded from the database,
+            & task ids that turned out to have no row).
+        Stores (or refreshes) them all, evicting the least recently used past maxsize.
+        """
+        now = monotonic()
+        entries = [(info.id, info) for info in tasks] + [(task_id, None) for task_id in missing]
+        with self._lock:
+            self.counters['loads'] += loaded
+            for task_id, info in entries:
+                self._entries[task_id] = (info, now)
+                self._entries.move_to_end(task_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def claim_warm_up(self):
+        """
+        Returns True (& starts the clock) if no bulk load has run in this process
+            yet, or the last one is past its TTL; otherwise False.
+        """
+        now = monotonic()
+        with self._lock:
+            if self._warmed_at is not None and now - self._warmed_at < self.ttl:
+                return False
+            self._warmed_at = now
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._warmed_at = None
+
+    def stats(self):
+        """Returns a dict of the hits, misses, loads & evictions so far, the current size and the hit rate."""
+        with self._lock:
+            stats = dict(self.counters, size=len(self._entries))
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else None
+        return stats
+
+
+_cache = TaskCache()
+
+
+### ### FILLING ### ###
+def remember(task_lists):
+    """
+    Takes rows shaped like messenger.get_task_list() (task_id, user_id, location,
+        description, start_time, time_window, compensation, ...).
+    Caches the task details they carry. Returns nothing.
+    """
+    _cache.put_many(TaskInfo(row[0], *row[2:7]) for row in task_lists)
+
+def warm(db_name=DB_NAME):
+    """
+    Takes the database name (default DB_NAME).
+    Loads every task that hasn't expired yet (so lookups of live tasks hit) with
+        one query, unless that already ran in this process within TASK_CACHE_TTL.
+    Returns nothing.
+    """
+    if not _cache.claim_warm_up():
+        return
+    with helper_functions.connectDB(db_name) as conn:
+        cur = conn.cursor()
+        cur.execute("""SELECT id, `location`, `description`, start_time, time_window, compensation
+                       FROM tasks WHERE expired = 0 AND expires_at >= NOW()""")
+        rows = cur.fetchall()
+    _cache.put_many((TaskInfo(*row) for row in rows), loaded=True)
+
+def load(task_ids, db_name=DB_NAME):
+    """
+    Takes task ids that missed the cache.
+    Loads just those tasks (expired or not) with one query & caches the ids that
+        have no row as missing.
+    Returns nothing.
+    """
+    task_ids = list(task_ids)
+    if not task_ids:
+        return
+    with helper_functions.connectDB(db_name) as conn:
+        cur = conn.cursor()
+        placeholders = ', '.join(['%s'] * len(task_ids))
+        cur.execute(f"""SELECT id, `location`, `description`, start_time, time_window, compensation
+                        FROM tasks WHERE id IN ({placeholders})""", task_ids)
+        rows = cur.fetchall()
+    found = {row[0] for row in rows}
+    _cache.put_many((TaskInfo(*row) for row in rows), loaded=True,
+                    missing=[task_id for task_id in task_ids if task_id not in found])
+
+
+### ### LOOKUPS ### ###
+def get_task(task_id):
+    """
+    Takes a task id.
+    Returns its TaskInfo (loading it on a miss), or None if there is no such task.
+    """
+    task_id = int(task_id)
+    info = _cache.get(task_id)
+    if info is MISS:
+        warm()
+        info = _cache.get(task_id, count=False)
+    if info is MISS:
+        load([task_id])
+        info = _cache.get(task_id, count=False)
+        info = None if info is MISS else info
+    lookups = _cache.counters['hits'] + _cache.counters['misses']
+    if TASK_CACHE_REPORT_EVERY and lookups % TASK_CACHE_REPORT_EVERY == 0:
+        print(f"- task cache: {stats()}", datetime.now())
+    return info
+
+def expires_at(info):
+    """Takes a TaskInfo. Returns when the task's time window closes (as tasks.expires_at)."""
+    return info.start_time + timedelta(minutes=info.time_window)
+
+def timing(info, now=None):
+    """
+    Takes a TaskInfo (& optionally the time to judge it at; default: now).
+    Returns "expired" once its time window has closed, "not started" before its
+        start time, otherwise None (as messenger.check_time_window()).
+    """
+    now = now or datetime.now()
+    if now > expires_at(info):
+        return "expired"
+    if now <= info.start_time:
+        return "not started"
+    return None
+
+def stats():
+    """Returns the shared cache's hits, misses, loads, evictions, size & hit rate."""
+    return _cache.stats()
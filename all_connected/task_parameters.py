@@ -1,4 +1,4 @@
-from datetime import time
+from datetime import time, date
 import random
 
 import matching_assignments
@@ -10,19 +10,24 @@ def get_num_users():
     print("NUM_USERS: ", num_users)
     return num_users
 
-num_total_users = get_num_users() #get number of total participants from the database
-                                                #helper variable
+def num_tasks_per_cycle():
+    '''Helper function to get the number of tasks to generate this cycle (see NUM_TASKS_PER_CYCLE)'''
+    if NUM_TASKS_PER_CYCLE is None:
+        return get_num_users()
+    return NUM_TASKS_PER_CYCLE
 
 ##### TASK CYCLE PARAMETERS #####
 START_HOURS = time(8,33) #9 am
 END_HOURS = time(17,00) #5:00 pm
+HOLIDAYS = set()    #dates (datetime.date) on which no tasks are scheduled, eg. {date(2023,7,4)}
 
 
 TASK_CYCLE = 30*60      #in seconds. cycle where new tasks are generated. 
                         #Default: every 30 minutes
-NUM_TASKS_PER_CYCLE = num_total_users   #number of tasks generated per cycle
-                                        #Default: one task per person every cycle. 
-                                        #i.e. everyone receives on average two tasks per hour
+NUM_TASKS_PER_CYCLE = None  #number of tasks generated per cycle
+                            #Default: None, one task per active person every cycle, counted from the 
+                            #database when each cycle runs (nothing is queried at import).
+                            #i.e. everyone receives on average two tasks per hour
 
 
 MATCHING_CYCLE = TASK_CYCLE+2   #in seconds. cycle where tasks are matched with users
@@ -33,6 +38,12 @@ MESSENGER_BOT_CYCLE = 60*60+2   #in seconds. cycle where the slack bot send the
                                 #Default: 1 hour and 2 seconds.
                                     #Again, making sure all tasks are matched before we send them to users.
 
+EXPIRY_CYCLE = 60   #in seconds. cycle where the background sweeper flags newly expired tasks.
+                    #Default: every minute. Nothing else writes tasks.expired; reads check expires_at directly.
+
+OUTBOX_CYCLE = 60   #in seconds. cycle where queued Slack messages are retried (see outbox.py).
+                    #Default: every minute. New messages are sent right away; this picks up retries & leftovers after a restart.
+
 
 
 TASK_TIMEWINDOW = (1, 100) #in minutes. the length of time allowed for finishing one task
@@ -44,6 +55,18 @@ TASK_COMP = (2, 6) #in points. the range of compensation participants can get fo
 ##### #####
 MATCHING_ALGO = matching_assignments.algorithm_random   #random matching algorithm
 # MATCHING_ALGO = matching_assignments.algorithm_weighted   #weighted random matching algorithm
+# MATCHING_ALGO = matching_assignments.algorithm_array   #vectorized random matching algorithm, respects MAX_TASKS_PER_USER
+# MATCHING_ALGO = matching_assignments.algorithm_optimal   #minimum-cost assignment of the whole batch, see ASSIGNMENT_COST_WEIGHTS
+
+MAX_TASKS_PER_USER = None   #cap on tasks one user can get per matching cycle (used by algorithm_array & algorithm_optimal)
+                            #Default: None, no cap
+ASSIGNMENT_COST_WEIGHTS = {'reliability': 1.0,  #prefer reliable users
+                           'load': 0.25,        #per open task a user already has
+                           'time': 1.0,         #avoid start times close to a user's other open tasks
+                           'distance': 0.5}     #prefer users with open tasks nearby
+                                                #(used by algorithm_optimal)
+BUILDING_GRAPH_FILE = None  #building graph (see helper_functions.read_file) for real walking distances
+                            #Default: None, estimate distances from room codes
 
 
 ##### #####
@@ -0,0 +1,71 @@
+"""
+Shared setup for the unit tests. They import the all_connected modules directly (as
+    the modules import each other) and never talk to MySQL or Slack: the settings read
+    at import get placeholders & fake_db stands in for helper_functions.connectDB().
+    Usage: python -m pytest all_connected/tests
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+for name, value in {'DB_NAME': 'snapngo_test', 'SQL_PASS': 'unused', 'TASK_BOT_TOKEN': 'xoxb-unused'}.items():
+    os.environ.setdefault(name, value)
+
+
+class FakeCursor:
+    """Records every statement it runs; fetchall()/fetchone() hand out `results` in order."""
+    def __init__(self, results=()):
+        self.results = list(results)
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append((' '.join(sql.split()), params))
+        return 0
+
+    def executemany(self, sql, rows):
+        self.executed.append((' '.join(sql.split()), list(rows)))
+        return len(self.executed[-1][1])
+
+    def fetchall(self):
+        return self.results.pop(0)
+
+    def fetchone(self):
+        return self.results.pop(0)[0]
+
+    def params(self, sql_start):
+        """Returns the parameters of every statement that starts with sql_start."""
+        return [params for sql, params in self.executed if sql.startswith(sql_start)]
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.commits = 0
+
+    def cursor(self, *args):
+        return self._cursor
+
+    def commit(self):
+        self.commits += 1
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """Replaces helper_functions.connectDB() with a connection to one FakeCursor, & returns the cursor."""
+    import helper_functions
+
+    cursor = FakeCursor()
+    monkeypatch.setattr(helper_functions, 'connectDB', lambda db_name: FakeConnection(cursor))
+    return cursor
@@ -0,0 +1,54 @@
+from datetime import date
+from decimal import Decimal
+
+import counters
+
+MONDAY, TUESDAY = date(2026, 10, 12), date(2026, 10, 13)
+
+
+### ### DIFFING ### ###
+def test_diff_reports_changed_missing_and_extra_rows():
+    stored = {('U1', MONDAY): (1, 1, 1, Decimal(3)),
+              ('U1', TUESDAY): (2, 0, 0, Decimal(0)),
+              ('U2', MONDAY): (1, 0, 0, Decimal(0))}
+    expected = {('U1', MONDAY): (1, 1, 1, Decimal(3)),
+                ('U1', TUESDAY): (2, 1, 0, Decimal(0)),
+                ('U3', MONDAY): (1, 1, 0, Decimal(0))}
+    assert counters.diff(stored, expected) == [
+        (('U1', TUESDAY), (2, 0, 0, Decimal(0)), (2, 1, 0, Decimal(0))),
+        (('U2', MONDAY), (1, 0, 0, Decimal(0)), None),
+        (('U3', MONDAY), None, (1, 1, 0, Decimal(0))),
+    ]
+
+def test_diff_treats_a_missing_row_as_zeros():
+    assert counters.diff({('U1', MONDAY): counters.normalize((0, 0, 0, 0))}, {}) == []
+
+def test_totals_sum_each_users_days():
+    day_counters = {('U1', MONDAY): (1, 1, 1, Decimal('2.5')),
+                    ('U1', TUESDAY): (2, 1, 0, Decimal(0)),
+                    ('U2', MONDAY): (0, 1, 1, Decimal(4))}
+    assert counters.totals_of(day_counters) == {'U1': (3, 2, 1, Decimal('2.5')), 'U2': (0, 1, 1, Decimal(4))}
+
+
+### ### RECONCILIATION ### ###
+def test_reconcile_repairs_day_rows_and_totals(fake_db):
+    fake_db.results = [
+        [('U1', MONDAY, 1, 1, 1, 3), ('U2', MONDAY, 1, 0, 0, 0)],           # user_counters
+        [('U1', 1, 1, 1, 3), ('U2', 1, 0, 0, 0)],                           # user_totals
+        [('U1', MONDAY, 1, 1, 1, 3), ('U1', TUESDAY, 1, 0, 0, 0)],          # recounted from assignments
+    ]
+
+    mismatches = counters.reconcile(fix=True)
+
+    assert [(user_id, day) for user_id, day, _, _ in mismatches] == [('U1', TUESDAY), ('U2', MONDAY), ('U1', None), ('U2', None)]
+    day_upserts, total_upserts = fake_db.params("INSERT INTO")
+    assert day_upserts == [('U1', TUESDAY, 1, 0, 0, Decimal(0))]
+    assert total_upserts == [('U1', 2, 1, 1, Decimal(3))]
+    assert fake_db.params("DELETE FROM user_counters") == [[('U2', MONDAY)]]
+    assert fake_db.params("DELETE FROM user_totals") == [[('U2',)]]
+
+def test_reconcile_without_fix_only_reports(fake_db):
+    fake_db.results = [[('U1', MONDAY, 1, 0, 0, 0)], [('U1', 1, 0, 0, 0)], [('U1', MONDAY, 2, 0, 0, 0)]]
+    assert len(counters.reconcile()) == 2
+    assert not fake_db.params("INSERT") and not fake_db.params("DELETE")
+    assert all('FOR UPDATE' not in sql for sql, _ in fake_db.executed)
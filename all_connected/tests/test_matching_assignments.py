@@ -0,0 +1,86 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import matching_assignments
+
+
+### ### MIN-COST ASSIGNMENT ### ###
+def brute_force(cost):
+    """Returns (matched pairs, total cost) of the best assignment: as many pairs as possible, then the cheapest."""
+    num_rows, num_cols = cost.shape
+    best = (0, 0.0)
+    for choice in itertools.product([None, *range(num_cols)], repeat=num_rows):
+        cols = [col for col in choice if col is not None]
+        if len(set(cols)) < len(cols):
+            continue
+        pairs = [(row, col) for row, col in enumerate(choice) if col is not None]
+        if any(np.isinf(cost[row, col]) for row, col in pairs):
+            continue
+        total = sum(cost[row, col] for row, col in pairs)
+        if len(pairs) > best[0] or (len(pairs) == best[0] and total < best[1]):
+            best = (len(pairs), total)
+    return best
+
+@pytest.mark.parametrize('seed', range(60))
+def test_solve_assignment_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    num_rows, num_cols = rng.integers(1, 6, size=2)
+    cost = rng.integers(0, 10, size=(num_rows, num_cols)).astype(float)
+    cost[rng.random((num_rows, num_cols)) < 0.25] = np.inf
+
+    rows, cols = matching_assignments.solve_assignment(cost)
+
+    assert len(set(rows.tolist())) == len(rows) and len(set(cols.tolist())) == len(cols)
+    assert not np.isinf(cost[rows, cols]).any()
+    assert (len(rows), cost[rows, cols].sum()) == pytest.approx(brute_force(cost))
+
+def test_solve_assignment_prefers_more_pairs_over_cheaper_ones():
+    # Row 0 alone is cheapest on column 0, but only the diagonal matches both rows
+    cost = np.array([[0.0, 9.0],
+                     [1.0, np.inf]])
+    rows, cols = matching_assignments.solve_assignment(cost)
+    assert sorted(zip(rows.tolist(), cols.tolist())) == [(0, 1), (1, 0)]
+
+def test_slot_assignment_spreads_rows_by_slot_cost():
+    # Both rows are cheapest on column 0; its second slot costs 5 more, so one row moves
+    matching = matching_assignments.SlotAssignment(2, room=[2, 2], slot_step=5.0)
+    matching.add_edges(0, [0, 1], [0.0, 1.0])
+    matching.add_edges(1, [0, 1], [0.0, 3.0])
+    matching.place_all([0, 1])
+    assert sorted(matching.matches()) == [(0, 1), (1, 0)]
+
+
+### ### ALIAS SAMPLING ### ###
+def alias_distribution(prob, alias):
+    """Returns the probability of drawing each column from an alias table."""
+    num = len(prob)
+    distribution = np.asarray(prob, dtype=float) / num
+    np.add.at(distribution, alias, (1 - np.asarray(prob)) / num)
+    return distribution
+
+@pytest.mark.parametrize('weights', [[1, 2, 3, 4], [0, 0, 5, 1], [0.1] * 7, [10, 0, 0, 0, 0, 1]])
+def test_alias_table_is_exact(weights):
+    prob, alias = matching_assignments.build_alias_table(weights)
+    expected = np.asarray(weights, dtype=float) / np.sum(weights)
+    assert alias_distribution(prob, alias) == pytest.approx(expected)
+
+def test_alias_table_of_zero_weights_is_uniform():
+    prob, alias = matching_assignments.build_alias_table([0, 0, 0])
+    assert alias_distribution(prob, alias) == pytest.approx([1 / 3] * 3)
+
+def test_weighted_draw_frequencies():
+    weights = np.array([1.0, 2.0, 3.0, 0.0, 4.0])
+    draw = matching_assignments.make_weighted_draw(weights, np.random.default_rng(0))
+    picks = draw(np.arange(len(weights)), 200_000)
+    frequencies = np.bincount(picks, minlength=len(weights)) / len(picks)
+    assert frequencies == pytest.approx(weights / weights.sum(), abs=0.005)
+
+def test_weighted_draw_from_a_subset_of_users():
+    weights = np.array([1.0, 2.0, 3.0, 0.0, 4.0])
+    draw = matching_assignments.make_weighted_draw(weights, np.random.default_rng(1))
+    candidates = np.array([1, 3, 4])
+    picks = draw(candidates, 120_000)
+    assert set(picks.tolist()) <= {1, 4}
+    assert np.mean(picks == 4) == pytest.approx(4 / 6, abs=0.005)
@@ -0,0 +1,63 @@
+import outbox
+from slack_delivery import DeliveryResult
+
+
+def message(message_id, attempts=0, task_ids=()):
+    return {'id': message_id, 'user_id': f"U{message_id}", 'kind': 'tasks', 'blocks': [], 'text': '',
+            'task_ids': list(task_ids), 'attempts': attempts}
+
+def result(row, error=None):
+    return DeliveryResult(row['user_id'], 0, error is None, error, 1, None if error else '1.000100')
+
+
+### ### RESULT CLASSIFICATION ### ###
+def test_record_results_classifies_every_outcome(fake_db):
+    batch = [message(1, task_ids=[10]),                                   # posted
+             message(2, task_ids=[20]),                                   # temporary error
+             message(3, task_ids=[30]),                                   # permanent error
+             message(4, attempts=outbox.OUTBOX_MAX_ATTEMPTS - 1),         # out of attempts
+             message(5, task_ids=[50])]                                   # auth error
+    results = [result(batch[0]), result(batch[1], 'internal_error'), result(batch[2], 'channel_not_found'),
+               result(batch[3], 'internal_error'), result(batch[4], 'invalid_auth')]
+
+    counts = outbox.record_results(batch, results, 'owner')
+
+    assert counts == {'sent': 1, 'retrying': 2, 'failed': 2, 'unauthorized': 1}
+    assert fake_db.params("UPDATE outbox SET `status` = 'sent'") == [[('1.000100', 1, 'owner')]]
+    assert fake_db.params("UPDATE assignments SET `status` = 'pending'") == [[('U1', 10)]]
+    retried, unauthorized = fake_db.params("UPDATE outbox SET `status` = 'queued'")
+    assert retried == [(outbox.backoff(1), 'internal_error', 2, 'owner')]
+    assert unauthorized == [(outbox.OUTBOX_BACKOFF, 'invalid_auth', 5, 'owner')]
+    assert fake_db.params("UPDATE outbox SET `status` = 'failed'") == [[('channel_not_found', 3, 'owner'),
+                                                                         ('internal_error', 4, 'owner')]]
+    # only the permanently failed message's tasks are handed back to the matcher
+    assert fake_db.params("DELETE FROM assignments") == [[('U3', 30)]]
+
+def test_auth_errors_keep_their_attempts(fake_db):
+    outbox.record_results([message(1, attempts=3)], [result(message(1), 'token_revoked')], 'owner')
+    [sql] = [sql for sql, _ in fake_db.executed if sql.startswith("UPDATE outbox")]
+    assert 'attempts' not in sql
+
+def test_backoff_doubles_up_to_its_cap():
+    assert [outbox.backoff(attempts) for attempts in (1, 2, 3)] == [outbox.OUTBOX_BACKOFF * 2 ** n for n in range(3)]
+    assert outbox.backoff(100) == outbox.OUTBOX_MAX_BACKOFF
+
+
+### ### DRAINING ### ###
+def test_drain_stops_on_an_auth_error(monkeypatch):
+    batches = [[message(1), message(2)], [message(3), message(4)]]
+    claimed = []
+    monkeypatch.setattr(outbox, 'claim_batch', lambda *args: claimed.append(args) or batches[len(claimed) - 1])
+    monkeypatch.setattr(outbox.slack_delivery, 'deliver_all',
+                        lambda messages, token: [result({'user_id': user_id}, 'invalid_auth') for user_id, _, _ in messages])
+    monkeypatch.setattr(outbox, 'record_results',
+                        lambda batch, results, owner: {'sent': 0, 'retrying': len(batch), 'failed': 0, 'unauthorized': len(batch)})
+
+    totals = outbox.drain(batch_size=2)
+
+    assert len(claimed) == 1
+    assert totals == {'sent': 0, 'retrying': 2, 'failed': 0, 'unauthorized': 2}
+
+def test_drain_for_no_users_claims_nothing(monkeypatch):
+    monkeypatch.setattr(outbox, 'claim_batch', lambda *args: [][0])
+    assert outbox.drain(kind='welcome', user_ids=[]) == {'sent': 0, 'retrying': 0, 'failed': 0, 'unauthorized': 0}
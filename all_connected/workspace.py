@@ -1,44 +1,33 @@
 import copy
 import random
-import json
 from datetime import datetime, timedelta
 
 import os
 from pathlib import Path
 from dotenv import load_dotenv
-env_path = Path('..') / '.env'
+env_path = Path(__file__).resolve().parent.parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
-from messenger import update_tasks_expired, get_task_list
-from helper_functions import connectDB
+from messenger import get_task_list
+from helper_functions import connectDB, load_block
 
 DB_NAME = os.environ['DB_NAME']
 
 
-with open('block_messages/default_btn.json', 'r') as infile:
-    default_btn = json.load(infile)
-
-with open('block_messages/headers.json', 'r') as infile:
-    block_headers = json.load(infile)
-
-
 def get_accepted_tasks(user_id) -> list:
     """
     Takes a user id (int)
     Finds that user's assignment data.
     
     """
-    update_tasks_expired()
-    conn = connectDB(DB_NAME)
-    cur = conn.cursor()
-    query = f'''SELECT DISTINCT assignments.task_id
-                FROM assignments INNER JOIN tasks
-                WHERE assignments.user_id = '{user_id}' AND assignments.`status` = 'accepted' AND tasks.expired = 0 AND img IS NULL'''
-    cur.execute(query)
-
-    task_list = [int(task_id[0]) for task_id in cur.fetchall()]
-    
-    conn.close()
+    with connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        query = f'''SELECT DISTINCT assignments.task_id
+                    FROM assignments INNER JOIN tasks ON assignments.task_id = tasks.id
+                    WHERE assignments.user_id = '{user_id}' AND assignments.`status` = 'accepted' AND tasks.expired = 0 AND tasks.expires_at >= NOW() AND img IS NULL'''
+        cur.execute(query)
+
+        task_list = [int(task_id[0]) for task_id in cur.fetchall()]
     return task_list
 
 
@@ -48,18 +37,18 @@ def get_pending_tasks(user_id) -> list:
     Finds that user's assignment data.
     
     """
-    conn = connectDB(DB_NAME)
-    cur = conn.cursor()
-    # query = f'''SELECT task_id FROM assignments 
-    #             WHERE user_id = '{user_id}' AND `status` = 'pending'
-    #         '''
-    query = f'''SELECT DISTINCT assignments.task_id 
-                FROM assignments INNER JOIN tasks
-                WHERE assignments.user_id = '{user_id}' AND assignments.`status` = 'pending' AND tasks.expired = 0
-            '''
-    cur.execute(query)
-    task_list = [item[0] for item in cur.fetchall()]
-    conn.close()
+    with connectDB(DB_NAME) as conn:
+        cur = conn.cursor()
+        # query = f'''SELECT task_id FROM assignments 
+        #             WHERE user_id = '{user_id}' AND `status` = 'pending'
+        #         '''
+        query = f'''SELECT DISTINCT assignments.task_id 
+                    FROM assignments INNER JOIN tasks ON assignments.task_id = tasks.id
+                    WHERE assignments.user_id = '{user_id}' AND assignments.`status` = 'pending' AND tasks.expired = 0
+                        AND tasks.expires_at >= NOW()
+                '''
+        cur.execute(query)
+        task_list = [item[0] for item in cur.fetchall()]
     return task_list
 
 
@@ -107,9 +96,9 @@ def make_report_block(user_id) -> list:
     blocks = []
     if all_active:
         if len(blocks) >= 46:
-                blocks.append(block_headers['too_many_pending_header'])
-        blocks.append(block_headers['active_header'])
-        blocks.append(block_headers['divider'])
+                blocks.append(load_block('headers')['too_many_pending_header'])
+        blocks.append(load_block('headers')['active_header'])
+        blocks.append(load_block('headers')['divider'])
         
         # Sort active tasks by start time
         sorted_active = sorted(all_active, key=lambda task_list: task_list[4]) 
@@ -117,32 +106,32 @@ def make_report_block(user_id) -> list:
             active_task = compact_task(task_list)
             blocks.append(active_task)
     else:
-        blocks.append(block_headers['no_active_header'])
+        blocks.append(load_block('headers')['no_active_header'])
 
-    blocks.append(block_headers['divider'])
+    blocks.append(load_block('headers')['divider'])
     
     # Add appropriate pending task information
     if all_pending:
-        blocks.append(block_headers['pending_header'])
+        blocks.append(load_block('headers')['pending_header'])
         
         # Sort pending tasks by start time
         sorted_pending = sorted(all_pending, key=lambda task_list: task_list[4])
         for task_list in sorted_pending:
             if len(blocks) >= 47:
-                blocks.append(block_headers['too_many_pending_header'])
+                blocks.append(load_block('headers')['too_many_pending_header'])
                 break
             pending_task = compact_task(task_list)
             blocks.append(pending_task)
 
-            buttons = copy.deepcopy(default_btn)
+            buttons = copy.deepcopy(load_block('default_btn'))
             buttons['block_id'] = str(task_list[0])
             blocks.append(buttons)
     else:
-        blocks.append(block_headers['no_pending_header'])
+        blocks.append(load_block('headers')['no_pending_header'])
 
     # Add 'for more info' ending
-    blocks.append(block_headers['divider'])
-    blocks.append(block_headers['ending_block'])
+    blocks.append(load_block('headers')['divider'])
+    blocks.append(load_block('headers')['ending_block'])
 
     return blocks
 
@@ -201,16 +190,16 @@ def button_color(task_id, user_id):
     """
     status = 'rejected'
     if status == "rejected": # Reject btn is red
-        block = copy.deepcopy(default_btn)
+        block = copy.deepcopy(load_block('default_btn'))
         block['elements'][1]['style'] = 'danger'
         block['block_id'] = str(task_id)
     elif status == "accepted": # Accept btn is green
         print('accepted')
-        block = copy.deepcopy(default_btn)
+        block = copy.deepcopy(load_block('default_btn'))
         block['elements'][0]['style'] = 'primary'
         block['block_id'] = str(task_id)
     else: # both buttons grey
-        block = copy.deepcopy(default_btn)
+        block = copy.deepcopy(load_block('default_btn'))
         block['block_id'] = str(task_id)
     return block
 